@@ -17,12 +17,17 @@ or by ENV vars, some examples:
     -- LOG_NAME
     -- TEST_QUERIES (dry run, default no)
     -- QUEUE_SIZE (default 256)
+    -- QUEUE_MAX_MB (default 0, packets only)
+    -- QUEUE_TRANSPORT (queue or shm, default queue)
+    -- SPILL_DIR (local disk tier for the data queue, default none)
     -- QUEUE_FB4NEWR (queue free before new read, when reuse_writers=yes, default 1/3 off queue)
     -- REUSE_WRITERS (default no)
     -- DUMP_ON_ERROR (default no)
     -- DUMPFILE_SEP (default '|')
     -- STATS_IN_JSON (default no)
     -- PARALLEL_READERS (default 1)
+    -- MAX_PARALLEL_STREAMS (default 1)
+    -- MEMORY_LIMIT_MB (memory governor, default 0, off)
 
     check README.md for more info.
 
@@ -47,6 +52,7 @@ import modules.logging as logging
 from modules.logging import logLevel as logLevel
 import modules.connections as connections
 import modules.jobs as jobs
+import modules.queues as queues
 import modules.jobmanager as jobmanager
 
 
@@ -131,6 +137,12 @@ def Main():
 
     shared.connections = connections.preCheck(raw_connections)
 
+    if shared.spillDir != '':
+        if not os.path.isdir(shared.spillDir):
+            logging.processError(p_message=f'SPILL_DIR [{shared.spillDir}] is not a directory. giving up.', p_stop=True, p_exitCode=4)
+        elif shared.SPILL_COMPRESS == 'lz4' and not queues.lz4Available():
+            logging.processError(p_message='SPILL_COMPRESS lz4 requested, but lz4 is not installed. giving up.', p_stop=True, p_exitCode=4)
+
     if shared.Working.value:
         raw_jobs = jobs.load(q_filename)
 
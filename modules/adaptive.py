@@ -0,0 +1,98 @@
+'''adaptive fetch size: jobManager tunes the fetchmany() size of a reader, from the read and write timings it gets on events'''
+
+import multiprocessing as mp
+
+from typing import Optional
+
+import modules.shared as shared
+
+# packets between adjustments, so each one is based on a few measures
+_packetsPerAdjustment = 4
+
+def _ema(p_old:float, p_new:float) -> float:
+    return p_new if p_old == 0 else (0.8 * p_old) + (0.2 * p_new)
+
+def memoryPressure() -> bool:
+    '''memory governor: total RSS is above MEMORY_HIGH_WATER of MEMORY_LIMIT_MB'''
+    return shared.memoryLimitMB > 0 and shared.rssTotalMB.value >= shared.memoryLimitMB * shared.memoryHighWater
+
+class AdaptiveFetchSize:
+    '''
+    fetch size shared between a reader, that uses it on every fetch and publishes the average size of its rows,
+    and jobManager, that adjusts it towards ADAPTIVE_FETCH_TARGET_KB and ADAPTIVE_FETCH_TARGET_SECS per packet,
+    within ADAPTIVE_FETCH_MIN/MAX rows and ADAPTIVE_FETCH_MAX_QUEUE_MB for a full queue.
+    '''
+
+    def __init__(self, p_jobID:int, p_initialSize:int):
+        self.jobID:int = p_jobID
+
+        self._size = mp.Value('i', p_initialSize, lock=False)
+        self._rowBytes = mp.Value('d', 0.0, lock=False)
+
+        # jobManager side only
+        self._readSecsPerRow:float = 0
+        self._writeSecsPerRow:float = 0
+        self._packetsSinceChange:int = 0
+
+    #### reader side
+
+    def current(self) -> int:
+        return self._size.value
+
+    def packetRead(self, p_rows:int, p_bytes:int):
+        if p_rows > 0:
+            self._rowBytes.value = _ema(self._rowBytes.value, p_bytes / p_rows)
+
+    #### jobManager side
+
+    def readDone(self, p_rows:int, p_secs:float, p_writers:int) -> Optional[tuple[int, int, float]]:
+        '''on E_READ; returns (old size, new size, packet seconds) when the size was changed'''
+        if p_rows is None or p_rows <= 0:
+            return None
+        self._readSecsPerRow = _ema(self._readSecsPerRow, p_secs / p_rows)
+        self._packetsSinceChange += 1
+        if self._packetsSinceChange < _packetsPerAdjustment:
+            return None
+        return self._adjust(p_writers)
+
+    def writeDone(self, p_rows:int, p_secs:float):
+        '''on E_WRITE'''
+        if p_rows is not None and p_rows > 0:
+            self._writeSecsPerRow = _ema(self._writeSecsPerRow, p_secs / p_rows)
+
+    def shrink(self) -> Optional[tuple[int, int, float]]:
+        '''halves the fetch size, on memory pressure; same return as readDone'''
+        iCurrent = self._size.value
+        iTarget = max(shared.adaptiveFetchMin, iCurrent // 2)
+        if iTarget == iCurrent:
+            return None
+        self._size.value = iTarget
+        self._packetsSinceChange = 0
+        return (iCurrent, iTarget, 0)
+
+    def _adjust(self, p_writers:int) -> Optional[tuple[int, int, float]]:
+        iCurrent = self._size.value
+        fRowBytes = self._rowBytes.value
+
+        # time a packet takes on the slowest side; writers share the packets
+        fPacketSecs = iCurrent * max(self._readSecsPerRow, self._writeSecsPerRow / max(1, p_writers))
+
+        iTarget = iCurrent * 2
+        if fPacketSecs > 0:
+            iTarget = int(iCurrent * shared.adaptiveFetchTargetSecs / fPacketSecs)
+        if fRowBytes > 0:
+            iTarget = min(iTarget, int(shared.adaptiveFetchTargetKB * 1024 / fRowBytes))
+            iTarget = min(iTarget, int(shared.adaptiveFetchMaxQueueMB * 1024 * 1024 / (fRowBytes * shared.queueSize)))
+
+        # no big jumps, and stay within bounds
+        iTarget = max(iCurrent // 2, min(iCurrent * 2, iTarget))
+        if memoryPressure():
+            iTarget = min(iTarget, iCurrent)
+        iTarget = max(shared.adaptiveFetchMin, min(shared.adaptiveFetchMax, iTarget))
+
+        if abs(iTarget - iCurrent) < iCurrent * 0.1:
+            return None
+
+        self._size.value = iTarget
+        self._packetsSinceChange = 0
+        return (iCurrent, iTarget, fPacketSecs)
@@ -6,6 +6,7 @@ from timeit import default_timer as timer
 import modules.logging as logging
 from modules.logging import logLevel as logLevel
 import modules.shared as shared
+import modules.utils as utils
 
 
 def generate_create_table(
@@ -38,17 +39,8 @@ def generate_create_table(
     columns_info = []
     for col in p_description:
 
-        # Handle non-serializable types in Oracle's DbType
-        type_code = col[1]
-        if hasattr(type_code, 'name'):
-            # For Oracle's DbType objects, use the name attribute
-            type_name = type_code.name
-        elif hasattr(type_code, '__name__'):
-            # For other objects with __name__ attribute
-            type_name = type_code.__name__
-        else:
-            # For simple types or when name attribute is not available
-            type_name = str(type_code)
+        # Handle non-serializable types, like Oracle's DbType
+        type_name = utils.type_name(col[1])
 
         column_info = {
             'name': col[0],
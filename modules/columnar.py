@@ -0,0 +1,133 @@
+'''columnar packets: readers send arrow record batches, serialized as arrow IPC buffers, instead of lists of tuples'''
+
+import io
+
+from typing import Any, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+def available() -> bool:
+    '''pyarrow comes with databricks-sql-connector[pyarrow], but let's not assume it'''
+    return pa is not None
+
+def isArrowPacket(p_packet) -> bool:
+    return pa is not None and isinstance(p_packet, pa.Buffer)
+
+def toIPC(p_data) -> Any:
+    '''serializes a RecordBatch or a Table into an arrow IPC stream buffer'''
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, p_data.schema) as writer:
+        writer.write(p_data)
+    return sink.getvalue()
+
+def rowsToIPC(p_rows:list, p_columnNames:list[str]) -> Any:
+    '''converts a fetchmany() result into an arrow IPC buffer'''
+    columns = list(zip(*p_rows))
+    return toIPC(pa.RecordBatch.from_arrays([pa.array(col) for col in columns], names=p_columnNames))
+
+def ipcToTable(p_buffer) -> Any:
+    return pa.ipc.open_stream(p_buffer).read_all()
+
+def ipcToRows(p_buffer) -> list[tuple]:
+    '''for writers that can only handle rows (executemany, csv.writer)'''
+    table = ipcToTable(p_buffer)
+    return list(zip(*[col.to_pylist() for col in table.columns]))
+
+def tableToCSV(p_table) -> Optional[io.BytesIO]:
+    '''
+    arrow table as csv: no header, every value quoted and nulls left empty, so NULL and '' stay different.
+    returns None if the table has types csv cannot carry (binary, nested)
+    '''
+    import pyarrow.csv as pacsv
+
+    for field in p_table.schema:
+        if pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type) or pa.types.is_fixed_size_binary(field.type) or pa.types.is_nested(field.type):
+            return None
+
+    sink = io.BytesIO()
+    pacsv.write_csv(p_table, sink, pacsv.WriteOptions(include_header=False, quoting_style='all_valid'))
+    sink.seek(0)
+    return sink
+
+def describe(p_schema) -> list[tuple]:
+    '''builds something that looks like a cursor.description out of an arrow schema'''
+    return [(field.name, field.type, None, None, None, None, field.nullable) for field in p_schema]
+
+class ArrowFetcher:
+    '''
+    fetches packets as arrow IPC buffers, with the same execute/fetch/description steps readData uses on cursors.
+    - databricks cursors fetch arrow natively (fetchmany_arrow)
+    - oracledb connections fetch dataframes natively (fetch_df_batches), which bypasses the cursor;
+      the batches come in p_fetchSize rows, and are cut or joined to the size asked on each fetch
+    - anything else is fetched as rows and converted here, on the reader side
+    '''
+
+    def __init__(self, p_connection, p_cursor, p_fetchSize:int):
+        self.connection = p_connection
+        self.cursor = p_cursor
+        self.fetchSize:int = p_fetchSize
+        self.description:Optional[list] = None
+
+        self._batches = None
+        self._query:str = ''
+        self._columnNames:list[str] = []
+        # dataframe rows fetched but not sent yet
+        self._pending:list = []
+        self._pendingRows:int = 0
+
+        if hasattr(p_cursor, 'fetchmany_arrow'):
+            self.mode = 'native'
+        elif hasattr(p_connection, 'fetch_df_batches'):
+            self.mode = 'dataframe'
+        else:
+            self.mode = 'convert'
+
+    def execute(self, p_query:str):
+        if self.mode == 'dataframe':
+            self._query = p_query
+            self._batches = iter(self.connection.fetch_df_batches(statement=p_query, size=self.fetchSize))
+        else:
+            self.cursor.execute(p_query)
+            self.description = self.cursor.description
+            self._columnNames = [col[0] for col in self.cursor.description]
+
+    def fetch(self, p_size:int) -> tuple[Any, int]:
+        '''returns (packet, number of rows); ([], 0) at the end of data, like fetchmany()'''
+        match self.mode:
+            case 'native':
+                table = self.cursor.fetchmany_arrow(p_size)
+                if table.num_rows == 0:
+                    return [], 0
+                return toIPC(table), table.num_rows
+
+            case 'dataframe':
+                while self._pendingRows < p_size:
+                    try:
+                        batch = pa.table(next(self._batches)) # type: ignore
+                    except StopIteration:
+                        break
+                    if self.description is None:
+                        self.description = describe(batch.schema)
+                    self._pending.append(batch)
+                    self._pendingRows += batch.num_rows
+                if self._pendingRows == 0:
+                    if self.description is None:
+                        # no rows, so no batch to describe: get the columns from an empty run on the cursor
+                        self.cursor.execute(f'SELECT * FROM ({self._query.strip().rstrip(";")}) dc_arrow_query WHERE 1=0')
+                        self.description = self.cursor.description
+                    return [], 0
+                table = pa.concat_tables(self._pending)
+                rest = table.slice(p_size)
+                table = table.slice(0, p_size)
+                self._pending = [rest] if rest.num_rows > 0 else []
+                self._pendingRows = rest.num_rows
+                return toIPC(table), table.num_rows
+
+            case _:
+                bData = self.cursor.fetchmany(p_size)
+                if not bData:
+                    return [], 0
+                return rowsToIPC(bData, self._columnNames), len(bData)
@@ -4,8 +4,11 @@ import os
 import csv
 
 import json
+import multiprocessing as mp
 
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import Any, Callable, Optional
 
 import modules.logging as logging
 from modules.logging import logLevel as logLevel
@@ -162,6 +165,11 @@ def preCheck(raw_connections:dict[int, dict[str, Any]]) -> dict[str, dict[str, A
             else:
                 sSchema = ''
 
+            iMaxSessions, iMaxReaders, iMaxWriters = [
+                int(aConn[limit]) if limit in aConn and aConn[limit] != '' else 0
+                for limit in ('max_sessions', 'max_readers', 'max_writers')
+            ]
+
             nc = {
                 'driver':                   aConn['driver'],
                 'server':                   aConn['server'],
@@ -171,20 +179,95 @@ def preCheck(raw_connections:dict[int, dict[str, Any]]) -> dict[str, dict[str, A
                 'trustservercertificate':   sTSC,
                 'insert_placeholder':       sIP,
                 'insert_object_delimiter':  sOD,
-                'schema':                   sSchema
+                'schema':                   sSchema,
+                'max_sessions':             iMaxSessions,
+                'max_readers':              iMaxReaders,
+                'max_writers':              iMaxWriters
             }
 
+            if iMaxSessions or iMaxReaders or iMaxWriters:
+                shared.connSlots[cName] = mp.Array('i', 3)
+
         conns[cName] = nc
 
     logging.logPrint(f'final connections data:\n{json.dumps(conns, indent=2)}\n', logLevel.DEBUG)
     return conns
 
-def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_mode = 'w', p_test_mode:bool=False) -> Optional[dict[int, Any]]:
+def _setupConnection(p_name:str, x:int, p_conn):
+    '''change schemas if applicable, and set timeouts'''
+
+    c = shared.connections[p_name]
+    if 'schema' in c:
+        s:str = c['schema']
+        if len(s) > 0:
+            sql = change_schema_cmd[c['driver']].format(s)
+            if len(sql) > 0:
+                try:
+                    logging.logPrint(f'({p_name}[{x}]): setting schema with [{sql}]', logLevel.INFO, reportFrom=True)
+                    p_conn.cursor().execute(sql)
+                except Exception as e:
+                    logging.processError(p_e=e,p_message=f'({p_name}[{x}]): happened while trying to set schema', p_stop=True)
+
+    if shared.idleTimeoutSecs > 0:
+        sql:str = change_timeout_cmd[c['driver']].format(shared.idleTimeoutSecs)
+        if len(sql) > 0:
+            try:
+                logging.logPrint(f'({p_name}[{x}]): setting timeout with [{sql}]', logLevel.INFO, reportFrom=True)
+                p_conn.cursor().execute(sql)
+            except Exception as e:
+                logging.processError(p_e=e, p_message=f'({p_name}[{x}]): happened while trying to set timeout', p_stop=True)
+
+def _connectAll(p_name:str, p_qtd:int, p_connect:Callable[[int], Any]) -> dict[int, Any]:
+    '''
+    opens p_qtd connections with p_connect(x), and sets them up, up to CONNECT_FANOUT at the same time.
+    the first one is opened on this thread before the others, so one time driver setup (oracle thick mode) never runs on several threads.
+    each one goes to the stats as connectionOpen (threads is its index).
+    the threads are gone when this returns, so forking readers and writers afterwards is safe.
+    '''
+
+    def connectOne(x:int):
+        tStart = timer()
+        newConn = p_connect(x)
+        _setupConnection(p_name, x, newConn)
+        fSecs = timer() - tStart
+        logging.statsPrint('connectionOpen', None, 0, fSecs, x)
+        logging.logPrint(f'({p_name}[{x}]): connected in {fSecs:.3f}s', logLevel.DEBUG, reportFrom=True)
+        return newConn
+
+    nc:dict[int, Any] = {}
+    iFanout = min(p_qtd, max(1, shared.connectFanout))
+    if iFanout <= 1:
+        for x in range(p_qtd):
+            nc[x] = connectOne(x)
+        return nc
+
+    nc[0] = connectOne(0)
+    with ThreadPoolExecutor(max_workers=iFanout, thread_name_prefix=f'connect[{p_name}]') as executor:
+        futures = {x: executor.submit(connectOne, x) for x in range(1, p_qtd)}
+        firstError:Optional[Exception] = None
+        for x in futures:
+            try:
+                nc[x] = futures[x].result()
+            except Exception as e:
+                if firstError is None:
+                    firstError = e
+    if firstError is not None:
+        # no half sets: the ones that made it are closed, the caller gives up as before
+        for x in nc:
+            try:
+                nc[x].close()
+            except Exception:
+                pass
+        raise firstError
+    return nc
+
+def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_mode = 'w', p_test_mode:bool=False, p_localInfile:bool=False) -> Optional[dict[int, Any]]:
     ''' creates connection objects to sources or destinations
         returns an array of connections, if connecting to databases, or an array of tupples of (file, stream), if driver == csv
+        p_localInfile enables LOAD DATA LOCAL INFILE on mysql/mariadb connections
     '''
 
-    logging.logPrint(f'called, name=[{p_name}], qtd=[{p_qtd}], readOnly={p_readOnly}, tableName=[{p_tableName}], mode=[{p_mode}], p_test_mode={p_test_mode}', logLevel.DEBUG)
+    logging.logPrint(f'called, name=[{p_name}], qtd=[{p_qtd}], readOnly={p_readOnly}, tableName=[{p_tableName}], mode=[{p_mode}], p_test_mode={p_test_mode}, p_localInfile={p_localInfile}', logLevel.DEBUG)
     nc:dict[int, Any] = {}
     c = shared.connections[p_name]
 
@@ -194,16 +277,18 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
         case 'pyodbc':
             try:
                 import pyodbc
-                for x in range(p_qtd):
+                def connectPyodbc(x:int):
                     # parameters in string because if added as independent parameters, it segfaults
                     # used to be:
                     #nc[x]=pyodbc.connect(driver='{ODBC Driver 18 for SQL Server}', server=c['server'], database=c['database'], user=c['user'], password=c['password'], encoding = 'UTF-8', nencoding = 'UTF-8', readOnly = p_readOnly, trustservercertificate = c['trustservercertificate'] )
-                    nc[x]=pyodbc.connect(f"DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={c['server']};DATABASE={{{c['database']}}};UID={{{c['user']}}};PWD={{{c['password']}}};ENCODING=UTF-8;TRUSTSERVERCERTIFICATE={c['trustservercertificate']};APP={shared.applicationName}")
+                    newConn=pyodbc.connect(f"DRIVER={{ODBC Driver 18 for SQL Server}};SERVER={c['server']};DATABASE={{{c['database']}}};UID={{{c['user']}}};PWD={{{c['password']}}};ENCODING=UTF-8;TRUSTSERVERCERTIFICATE={c['trustservercertificate']};APP={shared.applicationName}")
                     try:
-                        nc[x].timeout = shared.idleTimeoutSecs
+                        newConn.timeout = shared.idleTimeoutSecs
                     except Exception as e:
                         logging.logPrint(f'({p_name}): exception [{e}] happened while trying to set timeout to [{shared.idleTimeoutSecs}]', logLevel.DEBUG, reportFrom=True)
                         pass #do not remove as on production mode we comment the previous line
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectPyodbc)
             except (Exception, pyodbc.DatabaseError) as e: # type:ignore
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
                 return None
@@ -211,9 +296,9 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
         case 'oracledb':
             try:
                 import oracledb
-                for x in range(p_qtd):
+                def connectOracle(x:int):
                     try:
-                        nc[x]=oracledb.connect(
+                        newConn=oracledb.connect(
                             user=c['user'],
                             password=c['password'],
                             dsn=f"{c['server']}/{c['database']}"
@@ -229,25 +314,27 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
                                 pass # Already initialized
 
                             # Retry connection in Thick mode
-                            nc[x]=oracledb.connect(
+                            newConn=oracledb.connect(
                                 user=c['user'],
                                 password=c['password'],
                                 dsn=f"{c['server']}/{c['database']}"
                             )
                         else:
                             raise e
-                    nc[x].outputtypehandler = oracledb_OutputTypeHandler
+                    newConn.outputtypehandler = oracledb_OutputTypeHandler
 
                     try:
-                        nc[x].client_identifier=shared.applicationName
+                        newConn.client_identifier=shared.applicationName
                     except Exception as e:
                         logging.logPrint(f'({p_name}): could not set client_identifier on connection: [{e}]', logLevel.DEBUG, reportFrom=True)
                         pass #do not remove as on production mode we comment the previous line
                     try:
-                        nc[x].call_timeout = (shared.idleTimeoutSecs * 1000) # in milisecs
+                        newConn.call_timeout = (shared.idleTimeoutSecs * 1000) # in milisecs
                     except Exception as e:
                         logging.logPrint(f'({p_name}): exception [{e}] happened while trying to set call_timeout to [{shared.idleTimeoutSecs}]', logLevel.DEBUG, reportFrom=True)
                         pass #do not remove as on production mode we comment the previous line
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectOracle)
 
             except Exception as e:
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
@@ -255,20 +342,19 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
 
         case 'psycopg2':
             try:
-                from psycopg2 import pool as pgpools
-                tpool = pgpools.ThreadedConnectionPool(
-                    1,
-                    p_qtd,
-                    host=c['server'],
-                    database=c['database'],
-                    user=c['user'],
-                    password = c['password'],
-                    application_name=shared.applicationName,
-                    connect_timeout = shared.connectionTimeoutSecs
-                )
-                for x in range(p_qtd):
-                    nc[x] = tpool.getconn()
-                    nc[x].readonly = p_readOnly
+                import psycopg2
+                def connectPG(x:int):
+                    newConn = psycopg2.connect(
+                        host=c['server'],
+                        database=c['database'],
+                        user=c['user'],
+                        password = c['password'],
+                        application_name=shared.applicationName,
+                        connect_timeout = shared.connectionTimeoutSecs
+                    )
+                    newConn.readonly = p_readOnly
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectPG)
             except Exception as e:
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
                 return None
@@ -276,20 +362,22 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
         case 'mysql':
             try:
                 import mysql.connector
-                for x in range(p_qtd):
-                    nc[x]=mysql.connector.connect(
+                def connectMysql(x:int):
+                    newConn=mysql.connector.connect(
                         host=c['server'],
                         database=c['database'],
                         user=c['user'],
                         password = c['password'],
-                        connect_timeout = shared.connectionTimeoutSecs
-
+                        connect_timeout = shared.connectionTimeoutSecs,
+                        allow_local_infile = p_localInfile
                     )
                     try:
-                        nc[x]._client_name = shared.applicationName
+                        newConn._client_name = shared.applicationName
                     except Exception as e:
                         logging.logPrint(f'({p_name}): could not set client_name on connection: [{e}]', logLevel.DEBUG, reportFrom=True)
                         pass #do not remove as on production mode we comment the previous line
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectMysql)
             except Exception as e:
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
                 return None
@@ -297,19 +385,22 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
         case 'mariadb':
             try:
                 import mariadb
-                for x in range(p_qtd):
-                    nc[x]=mariadb.connect(
+                def connectMariadb(x:int):
+                    newConn=mariadb.connect(
                         host=c['server'],
                         database=c['database'],
                         user=c['user'],
                         password = c['password'],
-                        connect_timeout = shared.connectionTimeoutSecs
+                        connect_timeout = shared.connectionTimeoutSecs,
+                        local_infile = p_localInfile
                     )
                     try:
-                        nc[x]._client_name = shared.applicationName
+                        newConn._client_name = shared.applicationName
                     except Exception as e:
                         logging.logPrint(f'({p_name}): could not set client_name on connection: [{e}]', logLevel.DEBUG, reportFrom=True)
                         pass #do not remove as on production mode we comment the previous line
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectMariadb)
             except Exception as e:
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
                 return None
@@ -349,9 +440,9 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
 
                 logging.logPrint(f'({p_name}): databricks auth: got Token: [{token}]', logLevel.DEBUG, reportFrom=True)
 
-                for x in range(p_qtd):
+                def connectDatabricks(x:int):
                     logging.logPrint(f'({p_name}): databricks[{x}]: establishing connection...', logLevel.DEBUG, reportFrom=True)
-                    nc[x]=dbricksSql.connect(
+                    newConn=dbricksSql.connect(
                         server_hostname=c['server'],
                         http_path=c['database'],
                         credentials_provider = dbricks_connection_provider,
@@ -362,6 +453,8 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
                         http_timeout=shared.idleTimeoutSecs
                     )
                     logging.logPrint(f'({p_name}): databricks[{x}]: connected.', logLevel.DEBUG, reportFrom=True)
+                    return newConn
+                nc = _connectAll(p_name, p_qtd, connectDatabricks)
             except Exception as e:
                 logging.processError(p_e=e, p_message=p_name, p_stop=True, p_exitCode=2)
                 return None
@@ -433,28 +526,6 @@ def initConnections(p_name:str, p_readOnly:bool, p_qtd:int, p_tableName = '', p_
                 except Exception as error:
                     logging.logPrint(f'({p_name}): CSV error [{error}] opening file [{sFileName}]')
 
-    # all connections: change schemas if applicable, and set timeouts.
-    for x in range(p_qtd):
-        if 'schema' in c:
-            s:str = c['schema']
-            if len(s) > 0:
-                sql = change_schema_cmd[c['driver']].format(s)
-                if len(sql) > 0:
-                    try:
-                        logging.logPrint(f'({p_name}[{x}]): setting schema with [{sql}]', logLevel.INFO, reportFrom=True)
-                        nc[x].cursor().execute(sql)
-                    except Exception as e:
-                        logging.processError(p_e=e,p_message=f'({p_name}[{x}]): happened while trying to set schema', p_stop=True)
-
-        if shared.idleTimeoutSecs > 0:
-            sql:str = change_timeout_cmd[c['driver']].format(shared.idleTimeoutSecs)
-            if len(sql) > 0:
-                try:
-                    logging.logPrint(f'({p_name}[{x}]): setting timeout with [{sql}]', logLevel.INFO, reportFrom=True)
-                    nc[x].cursor().execute(sql)
-                except Exception as e:
-                    logging.processError(p_e=e, p_message=f'({p_name}[{x}]): happened while trying to set timeout', p_stop=True)
-
     try:
         if p_test_mode:
             connTestLogLevel = logLevel.INFO
@@ -491,6 +562,77 @@ def getConnectionParameter(p_name:str, p_otion:str):
     else:
         return None
 
+slot_kinds = {'s':0, 'r':1, 'w':2}
+
+def acquireSlots(p_name:str, p_kind:str, p_qtd:int = 1) -> int:
+    '''
+    reserves up to p_qtd sessions on connection p_name, within its max_sessions and max_readers ('r') or max_writers ('w').
+    's' is a session that is neither (statements). returns how many were granted, 0 if the caller has to wait
+    '''
+
+    if p_name not in shared.connSlots:
+        return p_qtd
+
+    c = shared.connections[p_name]
+    slots = shared.connSlots[p_name]
+    iKind = slot_kinds[p_kind]
+    with slots.get_lock():
+        iGranted = p_qtd
+        if c['max_sessions']:
+            iGranted = min(iGranted, c['max_sessions'] - slots[0])
+        if p_kind == 'r' and c['max_readers']:
+            iGranted = min(iGranted, c['max_readers'] - slots[iKind])
+        if p_kind == 'w' and c['max_writers']:
+            iGranted = min(iGranted, c['max_writers'] - slots[iKind])
+        iGranted = max(iGranted, 0)
+        slots[0] += iGranted
+        if iKind > 0:
+            slots[iKind] += iGranted
+
+    logging.logPrint(f'({p_name}): {iGranted} of {p_qtd} [{p_kind}] slots granted, in use: {slots[:]}', logLevel.DEBUG)
+    return iGranted
+
+def releaseSlots(p_name:str, p_kind:str, p_qtd:int = 1):
+    '''gives back sessions reserved with acquireSlots'''
+
+    if p_name not in shared.connSlots:
+        return
+
+    slots = shared.connSlots[p_name]
+    iKind = slot_kinds[p_kind]
+    with slots.get_lock():
+        inUse = slots[:]
+        slots[0] = max(slots[0] - p_qtd, 0)
+        if iKind > 0:
+            slots[iKind] = max(slots[iKind] - p_qtd, 0)
+
+    # releasing more than was acquired is a bookkeeping bug, don't hide it
+    if inUse[0] < p_qtd or inUse[iKind] < p_qtd:
+        logging.logPrint(f'({p_name}): releasing {p_qtd} [{p_kind}] slots, but only {inUse} are in use', logLevel.ERROR)
+
+def getCopyOutOptions(p_dest:str) -> str:
+    '''options for postgres COPY (query) TO STDOUT, so the raw output is ready to be written to p_dest'''
+
+    if getConnectionParameter(p_dest, 'driver') != 'csv':
+        # text format, the default for COPY FROM STDIN
+        return ''
+
+    c = shared.connections[p_dest]
+    try:
+        _delim = utils.delimiter_decoder(c['delimiter'])
+    except Exception:
+        if len(c['delimiter']) == 1:
+            _delim = c['delimiter']
+        else:
+            _delim = ','
+    _delim = _delim.replace('\\', '\\\\').replace("'", "\\'")
+
+    # python's csv defaults: " quotes, and doubled " inside quotes
+    sOptions = f"FORMAT csv, DELIMITER E'{_delim}', QUOTE '\"', ESCAPE '\"'"
+    if c.get('quoting', '') == 'ALL':
+        sOptions += ', FORCE_QUOTE *'
+    return f'WITH ({sOptions})'
+
 def initCursor(p_conn, p_jobID:int, p_source:str, p_fetchSize:int):
     '''prepares the object that will send commands to databases'''
     # postgres: try not to fetch all rows to memory, using server side cursors
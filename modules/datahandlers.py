@@ -1,5 +1,6 @@
 '''readers and writers'''
 import os
+import io
 import traceback
 
 from timeit import default_timer as timer
@@ -13,6 +14,11 @@ from setproctitle import setproctitle
 
 import modules.shared as shared
 import modules.utils as utils
+import modules.columnar as columnar
+import modules.writemethods as writemethods
+import modules.adaptive as adaptive
+import modules.queues as queues
+import modules.detailcache as detailcache
 import modules.logging as logging
 from modules.logging import logLevel as logLevel
 
@@ -66,8 +72,13 @@ def executeStatement(p_jobID:int, p_connection, p_cursor, p_target:str, p_query:
     logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID)
 
 
-def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str, p_outQueue:Queue, p_finalDataReader:bool=True):
-    '''gets data from sources'''
+def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str, p_outQueue:Queue, p_finalDataReader:bool=True, p_packetFormat:str='rows', p_adaptiveFetch:Optional[adaptive.AdaptiveFetchSize]=None, p_threadID:int=0, p_keysDedup:bool=False, p_prefetch:int=0):
+    '''
+    gets data from sources; with p_adaptiveFetch, the fetch size is the one jobManager keeps adjusting there.
+    split readers (several readers on the same job) get a p_threadID, sent back on E_READ_END like readData2 does.
+    keys readers with p_keysDedup drop the keys they already sent.
+    with p_prefetch, a thread keeps up to that many packets fetched ahead while this one queues them
+    '''
 
     playNice()
 
@@ -81,6 +92,46 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
 
     errorOccurred = False
 
+    # packets are either what fetchmany() returns, or arrow IPC buffers
+    if p_packetFormat == 'arrow':
+        fetcher = columnar.ArrowFetcher(p_connection, p_cursor, p_fetchSize)
+        executeQuery = fetcher.execute
+        fetchPacket = fetcher.fetch
+        describe = lambda: fetcher.description
+    else:
+        executeQuery = p_cursor.execute
+        def fetchPacket(p_size:int):
+            bData = p_cursor.fetchmany(p_size)
+            return bData, len(bData) if bData else 0
+        describe = lambda: p_cursor.description
+
+    if p_adaptiveFetch is not None:
+        fetchFixedSize = fetchPacket
+        def fetchPacket(p_size:int):
+            bData, iRows = fetchFixedSize(p_adaptiveFetch.current())
+            if iRows > 0:
+                p_adaptiveFetch.packetRead(iRows, bData.size if columnar.isArrowPacket(bData) else utils.estimate_packet_bytes(bData))
+            return bData, iRows
+
+    keysDedup:Optional[detailcache.KeysDedup] = None
+    if p_keysDedup and not p_finalDataReader:
+        keysDedup = detailcache.KeysDedup(shared.keysDedupMaxMB*1024*1024)
+        fetchAllKeys = fetchPacket
+        def fetchPacket(p_size:int):
+            while True:
+                bData, iRows = fetchAllKeys(p_size)
+                if iRows == 0:
+                    return bData, 0
+                bData = keysDedup.filter(bData) # type: ignore
+                if len(bData) > 0:
+                    return bData, len(bData)
+
+    prefetch:Optional[queues.PrefetchBuffer] = None
+    if p_prefetch > 0:
+        prefetch = queues.PrefetchBuffer(fetchPacket, p_prefetch, shared.prefetchMaxMB*1024*1024,
+                                         lambda bData: bData.size if columnar.isArrowPacket(bData) else utils.estimate_packet_bytes(bData))
+        fetchPacket = prefetch.fetch
+
     if p_query:
         try:
             setproctitle(f'{processTitlePrefix}(query) [{jobName}]')
@@ -90,7 +141,7 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
                 p_jobID,  None, None)
             )
 
-            p_cursor.execute(p_query)
+            executeQuery(p_query)
 
             shared.eventQueue.put( (
                 shared.E_QUERY_END if p_finalDataReader else shared.E_KEYS_QUERY_END,
@@ -108,9 +159,11 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
             #first read outside the loop, to get the col description without penalising the main loop with ifs
             bData = False
 
+            iRows = 0
+
             rStart = timer()
             try:
-                bData = p_cursor.fetchmany(p_fetchSize)
+                bData, iRows = fetchPacket(p_fetchSize)
             except Exception as e:
                 errorOccurred = True
                 setproctitle(f'{processTitlePrefix}(error@1) [{jobName}]')
@@ -120,15 +173,15 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
             if not errorOccurred:
                 shared.eventQueue.put( (
                     shared.E_READ_START,
-                    p_jobID, p_cursor.description, p_fetchSize )
+                    p_jobID, describe(), p_fetchSize )
                 )
                 if not shared.TEST_QUERIES:
                     p_outQueue.put( bData, block = True)
-                    shared.eventQueue.put( (shared.E_READ, p_jobID, len(bData), (timer()-rStart)) ) #type: ignore
+                    shared.eventQueue.put( (shared.E_READ, p_jobID, iRows, (timer()-rStart)) )
     else:
         shared.eventQueue.put( (
             shared.E_KEYS_READ_START,
-            p_jobID, p_cursor.description, p_fetchSize )
+            p_jobID, describe(), p_fetchSize )
         )
 
     if not shared.TEST_QUERIES:
@@ -137,7 +190,7 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
             bData = False
             try:
                 rStart = timer()
-                bData = p_cursor.fetchmany(p_fetchSize)
+                bData, iRows = fetchPacket(p_fetchSize)
             except Exception as e:
                 errorOccurred = True
                 setproctitle(f'{processTitlePrefix}(error@2) [{jobName}]')
@@ -147,7 +200,7 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
             if not bData:
                 break
 
-            shared.eventQueue.put( (shared.E_READ, p_jobID, len(bData), (timer()-rStart)) )
+            shared.eventQueue.put( (shared.E_READ, p_jobID, iRows, (timer()-rStart)) )
             p_outQueue.put( bData, block = True )
 
         logging.logPrint('exited read loop.', logLevel.DEBUG, p_jobID=p_jobID)
@@ -155,6 +208,11 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
         logging.logPrint('testing queries mode, stopping read.', logLevel.DEBUG, p_jobID=p_jobID)
         pass #do not remove as on production mode we comment the previous line
 
+    if prefetch is not None:
+        setproctitle(f'{processTitlePrefix}(stopping prefetch) [{jobName}]')
+        prefetch.close(shared.connectionTimeoutSecs)
+        logging.statsPrint('prefetchStalls', p_jobID, prefetch.stalls, prefetch.stallSecs, p_prefetch)
+
     setproctitle(f'{processTitlePrefix}(abort@cursor) [{jobName}]')
     try:
         p_cursor.abort()
@@ -179,14 +237,121 @@ def readData(p_jobID:int, p_connection, p_cursor, p_fetchSize:int, p_query:str,
     except Exception:
         pass
 
+    if keysDedup is not None:
+        logging.statsPrint('keysDedup', p_jobID, keysDedup.dropped, 0, len(keysDedup))
+        if keysDedup.bFull:
+            logging.logPrint(f'KEYS_DEDUP_MAX_MB reached, kept the first {len(keysDedup):,} keys only', p_jobID=p_jobID)
+
     shared.eventQueue.put( (
         shared.E_READ_END if p_finalDataReader else shared.E_KEYS_READ_END,
-        p_jobID, None, None)
+        p_jobID, p_threadID if p_threadID else None, None)
     )
 
     setproctitle(f'{processTitlePrefix}(flushing) [{jobName}]')
     logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID)
 
+class _CopySink(io.TextIOBase):
+    '''file like object for copy_expert: groups the rows postgres sends into packets of p_fetchSize rows'''
+
+    def __init__(self, p_jobID:int, p_fetchSize:int, p_outQueue:Queue):
+        self.jobID = p_jobID
+        self.fetchSize = p_fetchSize
+        self.outQueue = p_outQueue
+        self._lines:list[str] = []
+        self._rStart = timer()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, p_line:str) -> int:
+        # psycopg2 calls this once per row
+        self._lines.append(p_line)
+        if len(self._lines) >= self.fetchSize:
+            self.sendPacket()
+        return len(p_line)
+
+    def sendPacket(self):
+        if not shared.Working.value:
+            # raising here aborts the COPY
+            raise InterruptedError('stop requested')
+        if len(self._lines) > 0:
+            iRows = len(self._lines)
+            shared.eventQueue.put( (shared.E_READ, self.jobID, iRows, (timer()-self._rStart)) )
+            self.outQueue.put( writemethods.CopyPacket(iRows, ''.join(self._lines)), block = True )
+            self._lines = []
+            self._rStart = timer()
+
+def readDataCopyPG(p_jobID:int, p_connection, p_fetchSize:int, p_query:str, p_outQueue:Queue, p_copyOptions:str = ''):
+    '''gets data from postgres sources with COPY (query) TO STDOUT, as raw text, without converting values to python objects'''
+
+    playNice()
+
+    utils.block_signals()
+
+    logging.logPrint(f'Started, fetchSize=[{p_fetchSize}], copyOptions=[{p_copyOptions}]', logLevel.DEBUG, p_jobID=p_jobID)
+    tStart = timer()
+
+    jobName = shared.getJobName(p_jobID)
+    processTitlePrefix:str = 'datacopy: readDataCopyPG '
+
+    errorOccurred = False
+
+    sQuery = p_query.strip().rstrip(';')
+    cursor = None
+    description = None
+
+    try:
+        setproctitle(f'{processTitlePrefix}(query) [{jobName}]')
+        shared.eventQueue.put( (shared.E_QUERY_START, p_jobID,  None, None) )
+
+        # COPY does not return a description, so get it from an empty run of the same query
+        cursor = p_connection.cursor()
+        cursor.execute(f'SELECT * FROM ({sQuery}) dc_copy_query LIMIT 0')
+        description = cursor.description
+
+        shared.eventQueue.put( (shared.E_QUERY_END, p_jobID,  None, (timer() - tStart)) )
+    except Exception as e:
+        errorOccurred = True
+        setproctitle(f'{processTitlePrefix}(error@query) [{jobName}]')
+        logging.processError(p_e=e, p_message=f'executing query, conn=[{p_connection}]', p_jobID=p_jobID, p_dontSendToStats=True)
+        shared.eventQueue.put( (shared.E_QUERY_ERROR, p_jobID, None, (timer() - tStart)) )
+
+    if not errorOccurred and shared.Working.value:
+        shared.eventQueue.put( (shared.E_READ_START, p_jobID, description, p_fetchSize ) )
+
+        if not shared.TEST_QUERIES:
+            setproctitle(f'{processTitlePrefix}(reading) [{jobName}]')
+            sink = _CopySink(p_jobID, p_fetchSize, p_outQueue)
+            try:
+                cursor.copy_expert(f'COPY ({sQuery}) TO STDOUT {p_copyOptions}', sink) # type: ignore
+                sink.sendPacket()
+            except Exception as e:
+                if shared.Working.value:
+                    setproctitle(f'{processTitlePrefix}(error@copy) [{jobName}]')
+                    logging.processError(p_e=e, p_message='readingCopy', p_jobID=p_jobID, p_dontSendToStats=True)
+                    shared.eventQueue.put( (shared.E_READ_ERROR, p_jobID, None, (timer() - tStart)) )
+            logging.logPrint('exited copy.', logLevel.DEBUG, p_jobID=p_jobID)
+        else:
+            logging.logPrint('testing queries mode, stopping read.', logLevel.DEBUG, p_jobID=p_jobID)
+            pass #do not remove as on production mode we comment the previous line
+
+    setproctitle(f'{processTitlePrefix}(closing cursor) [{jobName}]')
+    try:
+        cursor.close() # type: ignore
+    except Exception:
+        pass
+
+    setproctitle(f'{processTitlePrefix}(closing connection) [{jobName}]')
+    try:
+        p_connection.close()
+    except Exception:
+        pass
+
+    shared.eventQueue.put( (shared.E_READ_END, p_jobID, None, None) )
+
+    setproctitle(f'{processTitlePrefix}(flushing) [{jobName}]')
+    logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID)
+
 def readDataCSV(p_jobID:int, p_conn, p_fetchSize:int, p_outQueue:Queue, p_finalDataReader:bool=True, p_columns:Optional[list]=None):
 
     playNice()
@@ -307,8 +472,64 @@ def readDataCSV(p_jobID:int, p_conn, p_fetchSize:int, p_outQueue:Queue, p_finalD
     setproctitle(f'{processTitlePrefix}(flushing) [{jobName}]')
     logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID)
 
-def readData2(p_jobID:int, p_threadID:int, p_connection2, p_cursor2, p_query2:str, p_fetchSize:int):
-    '''gets data from sources, sublooping for keys'''
+# detail_mode temp: (create statement, statement that empties it, table name) of the session temp table that gets each key packet
+keys_table_ddl:dict[str, tuple[str, str, str]] = {
+    'psycopg2': ('CREATE TEMPORARY TABLE dc_keys ({})', 'TRUNCATE TABLE dc_keys', 'dc_keys'),
+    'mysql':    ('CREATE TEMPORARY TABLE dc_keys ({})', 'TRUNCATE TABLE dc_keys', 'dc_keys'),
+    'mariadb':  ('CREATE TEMPORARY TABLE dc_keys ({})', 'TRUNCATE TABLE dc_keys', 'dc_keys'),
+    'pyodbc':   ('CREATE TABLE #dc_keys ({})', 'TRUNCATE TABLE #dc_keys', '#dc_keys'),
+    'oracledb': ('CREATE PRIVATE TEMPORARY TABLE ORA$PTT_dc_keys ({}) ON COMMIT PRESERVE DEFINITION', 'DELETE FROM ORA$PTT_dc_keys', 'ORA$PTT_dc_keys'),
+}
+
+# column types for the keys temp table, from the python type of the key values
+keys_table_types:dict[str, dict[str, str]] = {
+    'psycopg2': {'int':'BIGINT', 'float':'DOUBLE PRECISION', 'Decimal':'NUMERIC', 'str':'TEXT', 'datetime':'TIMESTAMP', 'date':'DATE', 'bytes':'BYTEA'},
+    'mysql':    {'int':'BIGINT', 'float':'DOUBLE', 'Decimal':'DECIMAL(38,10)', 'str':'VARCHAR(1024)', 'datetime':'DATETIME(6)', 'date':'DATE', 'bytes':'VARBINARY(1024)'},
+    'pyodbc':   {'int':'BIGINT', 'float':'FLOAT', 'Decimal':'DECIMAL(38,10)', 'str':'NVARCHAR(1024)', 'datetime':'DATETIME2', 'date':'DATE', 'bytes':'VARBINARY(1024)'},
+    'oracledb': {'int':'NUMBER', 'float':'BINARY_DOUBLE', 'Decimal':'NUMBER', 'str':'VARCHAR2(4000)', 'datetime':'TIMESTAMP', 'date':'DATE', 'bytes':'RAW(2000)'},
+}
+keys_table_types['mariadb'] = keys_table_types['mysql']
+
+# detail_mode in: most keys on each IN list (sql server takes up to 2100 parameters, oracle up to 1000 IN list items)
+detail_in_max_params:dict[str, int] = {'pyodbc': 2000}
+detail_in_max_keys:dict[str, int] = {'oracledb': 1000}
+
+def bindMarkers(p_driver:str, p_placeholder:str, p_count:int) -> list[str]:
+    '''positional bind markers: oracle numbers them, the others repeat the connection placeholder'''
+    if p_driver == 'oracledb':
+        return [f':{i}' for i in range(1, p_count+1)]
+    return [p_placeholder] * p_count
+
+def detailInQuery(p_query2:str, p_driver:str, p_placeholder:str, p_nKeys:int, p_nCols:int) -> str:
+    '''replaces #KEYS# with the bind markers for p_nKeys keys of p_nCols columns: a,b,c or (a,b),(c,d)'''
+    markers = bindMarkers(p_driver, p_placeholder, p_nKeys * p_nCols)
+    if p_nCols == 1:
+        sKeys = ','.join(markers)
+    else:
+        sKeys = ','.join(f"({','.join(markers[i*p_nCols:(i+1)*p_nCols])})" for i in range(p_nKeys))
+    return p_query2.replace('#KEYS#', sKeys)
+
+def _keysTableColumns(p_driver:str, p_keys:list) -> list[str]:
+    '''k1 TYPE, k2 TYPE...: each column type comes from the first non null value of the packet, text if there is none'''
+    types = keys_table_types[p_driver]
+    columns:list[str] = []
+    for i in range(len(p_keys[0])):
+        sType = types['str']
+        for keys in p_keys:
+            if keys[i] is not None:
+                sType = types.get(type(keys[i]).__name__, types['str'])
+                break
+        columns.append(f'k{i+1} {sType}')
+    return columns
+
+def readData2(p_jobID:int, p_threadID:int, p_connection2, p_cursor2, p_query2:str, p_fetchSize:int, p_stream:queues.StreamQueues, p_detailMode:str='row', p_detailBatch:int=1000, p_sourceDriver:str='', p_placeholder:str='%s', p_cacheRows:int=0, p_cacheKB:int=0):
+    '''
+    gets data from sources, sublooping for keys. detail_mode (p_detailMode) is how:
+    - row: query 2 runs once per key row, with the keys as parameters
+    - in: query 2 runs once per group of up to p_detailBatch keys, bound in place of #KEYS# (an IN list)
+    - temp: each key packet goes to a session temp table, that replaces #KEYS# on query 2, which runs once per packet
+    on row mode, p_cacheRows/p_cacheKB keep the results of the last keys, so repeated keys do not run the query again
+    '''
 
     playNice()
 
@@ -322,25 +543,95 @@ def readData2(p_jobID:int, p_threadID:int, p_connection2, p_cursor2, p_query2:st
 
     errorOccurred = False
 
+    keysCursor = None
+    keysWriter = None
+    sKeysInsert = ''
+    inQueries:dict[int, str] = {}
+
+    detailCache:Optional[detailcache.DetailCache] = None
+    if p_detailMode == 'row' and (p_cacheRows > 0 or p_cacheKB > 0):
+        detailCache = detailcache.DetailCache(p_cacheRows, p_cacheKB*1024)
+
     setproctitle(f'datacopy: readData2 (reading) [{jobName}]#{p_threadID}')
     while shared.Working.value and not errorOccurred:
         try:
-            bData = shared.dataKeysQueue.get(timeout=1)
+            bData = p_stream.dataKeysQueue.get(timeout=1)
         except queueEmpty:
-            if shared.stopWhenKeysEmpty.value:
+            if p_stream.stopWhenKeysEmpty.value:
                 break
             continue
 
         logging.logPrint(f'[{len(bData)}] rows received from readData Level 1', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
-        for keys in bData:
+        if len(bData) == 0:
+            continue
+
+        # (query, parameters) for each detail query this packet of keys needs
+        match p_detailMode:
+            case 'in':
+                iCols = len(bData[0])
+                iGroup = max(1, min(p_detailBatch, detail_in_max_params.get(p_sourceDriver, p_detailBatch*iCols) // iCols, detail_in_max_keys.get(p_sourceDriver, p_detailBatch)))
+                lookups = []
+                for i in range(0, len(bData), iGroup):
+                    group = bData[i:i+iGroup]
+                    if len(group) not in inQueries:
+                        inQueries[len(group)] = detailInQuery(p_query2, p_sourceDriver, p_placeholder, len(group), iCols)
+                    lookups.append( (inQueries[len(group)], [v for keys in group for v in keys]) )
+
+            case 'temp':
+                qStart = timer()
+                try:
+                    if keysCursor is None:
+                        sCreate, _, sKeysTable = keys_table_ddl[p_sourceDriver]
+                        keysCursor = p_connection2.cursor()
+                        keysColumns = _keysTableColumns(p_sourceDriver, bData)
+                        keysCursor.execute(sCreate.format(', '.join(keysColumns)))
+                        sKeysCols = ','.join(c.split(' ')[0] for c in keysColumns)
+                        if p_sourceDriver == 'psycopg2':
+                            keysWriter = writemethods.newPacketWriter('copy', keysCursor)
+                            sKeysInsert = f'COPY {sKeysTable}({sKeysCols}) FROM STDIN'
+                        else:
+                            if p_sourceDriver == 'pyodbc':
+                                keysCursor.fast_executemany = True
+                            keysWriter = writemethods.newPacketWriter('insert', keysCursor)
+                            sKeysInsert = f"INSERT INTO {sKeysTable}({sKeysCols}) VALUES ({','.join(bindMarkers(p_sourceDriver, p_placeholder, len(keysColumns)))})"
+                        logging.logPrint(f'keys temp table created: [{sKeysTable}({keysColumns})]', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
+                    else:
+                        keysCursor.execute(keys_table_ddl[p_sourceDriver][1])
+                    keysWriter(keysCursor, sKeysInsert, bData) # type: ignore
+                except Exception as e:
+                    errorOccurred = True
+                    logging.processError(p_e=e, p_message=f'loading keys temp table, conn2=[{p_connection2}]', p_jobID=p_jobID, p_threadID=p_threadID)
+                    shared.eventQueue.put( (shared.E_QUERY_ERROR, p_jobID, None, (timer() - qStart)) )
+                    break
+                lookups = [ (p_query2.replace('#KEYS#', keys_table_ddl[p_sourceDriver][2]), None) ]
+
+            case _:
+                lookups = [ (p_query2, keys) for keys in bData ]
+
+        for sQuery2, keys in lookups:
             if shared.Working.value == False or errorOccurred:
                 break
 
+            cacheRows:Optional[list] = None
+            iCacheBytes = 0
+            if detailCache is not None:
+                cachedRows = detailCache.get(keys)
+                if cachedRows is not None:
+                    rStart = timer()
+                    for i in range(0, len(cachedRows), p_fetchSize):
+                        p_stream.dataQueue.put( cachedRows[i:i+p_fetchSize], block = True )
+                        shared.eventQueue.put( (shared.E_READ, p_jobID, len(cachedRows[i:i+p_fetchSize]), (timer()-rStart)) )
+                    continue
+                cacheRows = []
+
             logging.logPrint(f'executing query 2 with keys=[{keys}]', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
             qStart = timer()
             try:
                 shared.eventQueue.put( (shared.E_DETAIL_QUERY_START, p_jobID, None, None) )
-                p_cursor2.execute(p_query2, keys)
+                if keys is None:
+                    p_cursor2.execute(sQuery2)
+                else:
+                    p_cursor2.execute(sQuery2, keys)
                 shared.eventQueue.put( (shared.E_DETAIL_QUERY_END, p_jobID, None, (timer() - qStart)) )
             except Exception as e:
                 errorOccurred = True
@@ -366,17 +657,38 @@ def readData2(p_jobID:int, p_threadID:int, p_connection2, p_cursor2, p_query2:st
 
                 if not bData2:
                     logging.logPrint(f'query 2 returned no rows', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
+                    if cacheRows is not None:
+                        detailCache.put(keys, cacheRows) # type: ignore
                     break
+                if cacheRows is not None:
+                    iCacheBytes += utils.estimate_packet_bytes(bData2)
+                    if detailCache.fits(len(cacheRows) + len(bData2), iCacheBytes): # type: ignore
+                        cacheRows.extend(bData2)
+                    else:
+                        # too big to cache, stop collecting it
+                        cacheRows = None
                 logging.logPrint(f'query 2 returned [{len(bData2)}] rows', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
                 if len(bData2) > 0:
                     shared.eventQueue.put( (shared.E_READ, p_jobID, len(bData2), (timer()-rStart)) )
-                    shared.dataQueue.put( bData2, block = True )
+                    p_stream.dataQueue.put( bData2, block = True )
                 else:
                     continue
 
             if shared.TEST_QUERIES:
                     break
 
+        if p_detailMode == 'temp' and not errorOccurred:
+            # keeps the transaction (and, on postgres, the truncated temp table files) from growing for the whole job
+            try:
+                p_connection2.commit()
+            except Exception as e:
+                errorOccurred = True
+                logging.processError(p_e=e, p_message=f'commit after keys packet, conn2=[{p_connection2}]', p_jobID=p_jobID, p_threadID=p_threadID)
+
+    if detailCache is not None:
+        logging.statsPrint('detailCacheHits', p_jobID, detailCache.hits, 0, len(detailCache))
+        logging.statsPrint('detailCacheMisses', p_jobID, detailCache.misses, 0, len(detailCache))
+
     try:
         p_cursor2.close()
     except Exception:
@@ -391,8 +703,44 @@ def readData2(p_jobID:int, p_threadID:int, p_connection2, p_cursor2, p_query2:st
     logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
 
 
-def writeData(p_jobID:int, p_threadID:int, p_connection, p_cursor, p_iQuery:str = ''):
-    '''writes data to destinations'''
+def getCoalescedPacket(p_dataQueue:queues.mpQueue | queues.ShmQueue | queues.ByteBoundedQueue | queues.SpillQueue, p_coalesceRows:int, p_coalesceBytes:int, p_lingerSecs:float, p_pending:list):
+    '''
+    gets a packet from the data queue; small ones are merged with the ones behind them, until there are
+    p_coalesceRows rows or p_coalesceBytes bytes, or until nothing else shows up for p_lingerSecs.
+    only row packets are merged: a copy or arrow packet found behind them is kept in p_pending, and is what the next call returns.
+    raises queueEmpty, like the queue.
+    '''
+    if p_pending:
+        bData = p_pending.pop()
+    else:
+        bData = p_dataQueue.get( block=True, timeout = 1 )
+    if (p_coalesceRows <= 0 and p_coalesceBytes <= 0) or not writemethods.isRowPacket(bData):
+        return bData
+
+    bData = list(bData)
+    iBytes = utils.estimate_packet_bytes(bData)
+    tLingerEnd = timer() + p_lingerSecs
+    while (p_coalesceRows <= 0 or len(bData) < p_coalesceRows) and (p_coalesceBytes <= 0 or iBytes < p_coalesceBytes):
+        fRemaining = tLingerEnd - timer()
+        if fRemaining <= 0:
+            break
+        try:
+            bMore = p_dataQueue.get( block=True, timeout = fRemaining )
+        except queueEmpty:
+            break
+        if not writemethods.isRowPacket(bMore):
+            p_pending.append(bMore)
+            break
+        bData.extend(bMore)
+        iBytes += utils.estimate_packet_bytes(bMore)
+    return bData
+
+def writeData(p_jobID:int, p_threadID:int, p_stream:queues.StreamQueues, p_connection, p_cursor, p_iQuery:str = '', p_writeMethod:str = 'insert', p_description:Optional[list] = None, p_sourceDriver:str = '', p_destDriver:str = '', p_commitRows:int = 0, p_commitSecs:float = 0, p_coalesceRows:int = 0, p_coalesceKB:int = 0, p_coalesceSecs:float = 0, p_pipeline:int = 0):
+    '''
+    writes data to destinations; commits every p_commitRows rows or p_commitSecs seconds, or after each packet if both are 0.
+    small packets are merged up to p_coalesceRows rows or p_coalesceKB, waiting at most p_coalesceSecs for more.
+    with p_pipeline, a thread keeps up to that many packets taken from the queue (and unpickled) while this one writes
+    '''
 
     playNice()
 
@@ -400,35 +748,95 @@ def writeData(p_jobID:int, p_threadID:int, p_connection, p_cursor, p_iQuery:str
 
     jobName = shared.getJobName(p_jobID)
 
+    try:
+        writePacket = writemethods.newPacketWriter(p_writeMethod, p_cursor, p_description, p_sourceDriver, p_destDriver, p_jobID, p_threadID)
+    except Exception as e:
+        logging.processError(p_e=e, p_message=f'preparing write method [{p_writeMethod}]', p_dontSendToStats=True, p_jobID=p_jobID, p_threadID=p_threadID)
+        writePacket = writemethods.write_methods['insert']
+
     setproctitle(f'datacopy: writeData [{jobName}]')
 
-    logging.logPrint('Started', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
+    logging.logPrint(f'Started, commitRows=[{p_commitRows}], commitSecs=[{p_commitSecs}], coalesceRows=[{p_coalesceRows}], coalesceKB=[{p_coalesceKB}], coalesceSecs=[{p_coalesceSecs}], pipeline=[{p_pipeline}]', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
     shared.eventQueue.put( (shared.E_WRITE_START, p_jobID, None, None) )
+
+    # a packet taken while coalescing that could not be merged, written next
+    pendingPacket:list = []
+    getPacket = lambda: getCoalescedPacket(p_stream.dataQueue, p_coalesceRows, p_coalesceKB * 1024, p_coalesceSecs, pendingPacket)
+    inputEnded = lambda: p_stream.stopWhenEmpty.value
+    pipeline:Optional[queues.PacketPipeline] = None
+    if p_pipeline > 0:
+        pipeline = queues.PacketPipeline(getPacket, p_stream.stopWhenEmpty, p_pipeline, shared.writePipelineMaxMB*1024*1024, writemethods.packetBytes)
+        getPacket = lambda: pipeline.get(timeout = 1) # type: ignore
+        inputEnded = pipeline.ended
+
+    # rows written since the last commit, only reported (E_WRITE) once commited
+    iPendingRows:int = 0
+    fPendingSecs:float = 0
+    tLastCommit:float = timer()
+    bEndOfData:bool = False
+
     while shared.Working.value:
+        if p_stream.retireWriters.value > 0:
+            bRetire = False
+            with p_stream.retireWriters.get_lock():
+                if p_stream.retireWriters.value > 0:
+                    p_stream.retireWriters.value -= 1
+                    bRetire = True
+            if bRetire:
+                logging.logPrint('retiring (less writers needed)', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
+                # same as the end of data: commit what is pending and leave
+                bEndOfData = True
+                break
         try:
-            bData = shared.dataQueue.get( block=True, timeout = 1 )
+            bData = getPacket()
         except queueEmpty:
-            if shared.stopWhenEmpty.value:
+            if inputEnded():
                 logging.logPrint('end of data detected', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
                 setproctitle(f'datacopy: writeData [{jobName}] stopping')
+                bEndOfData = True
                 break
-            continue
+            if iPendingRows == 0 or p_commitSecs <= 0 or (timer() - tLastCommit) < p_commitSecs:
+                continue
+            # nothing new, but the pending rows are old enough to commit
+            bData = None
         iStart = timer()
         try:
-            p_cursor.executemany(p_iQuery, bData)
-            p_connection.commit()
+            if bData is not None:
+                iPendingRows += writePacket(p_cursor, p_iQuery, bData)
+            if (p_commitRows <= 0 and p_commitSecs <= 0) or (p_commitRows > 0 and iPendingRows >= p_commitRows) or (p_commitSecs > 0 and (timer() - tLastCommit) >= p_commitSecs):
+                p_connection.commit()
+                shared.eventQueue.put( (shared.E_WRITE, p_jobID, iPendingRows, fPendingSecs + (timer() - iStart)) )
+                iPendingRows = 0
+                fPendingSecs = 0
+                tLastCommit = timer()
+            else:
+                fPendingSecs += timer() - iStart
         except Exception as e:
             setproctitle(f'datacopy: writeData [{jobName}], error occurred')
-            logging.logPrint(bData, logLevel.DUMP_DATA)
+            logging.logPrint(writemethods.packetRows(bData), logLevel.DUMP_DATA)
             logging.processError(p_e=e, p_dontSendToStats=True, p_jobID=p_jobID, p_threadID=p_threadID)
             shared.eventQueue.put( (shared.E_WRITE_ERROR, p_jobID, p_threadID, None ) )
             break
 
-        #sometimes... things don't work as expected... like with pyodbc...
-        wr = p_cursor.rowcount
-        if wr == -1:
-            wr = len(bData) # let's hope that all rows were writen...
-        shared.eventQueue.put( (shared.E_WRITE, p_jobID, wr, (timer() - iStart)) )
+    # packets the pipeline already took from the queue are written too (when retiring, the others go on)
+    leftPackets:list = []
+    if pipeline is not None:
+        leftPackets = pipeline.close(shared.connectionTimeoutSecs)
+
+    if bEndOfData and (iPendingRows > 0 or len(leftPackets) > 0):
+        setproctitle(f'datacopy: writeData (last commit) [{jobName}]')
+        iStart = timer()
+        bData = None
+        try:
+            for bData in leftPackets:
+                iPendingRows += writePacket(p_cursor, p_iQuery, bData)
+            p_connection.commit()
+            shared.eventQueue.put( (shared.E_WRITE, p_jobID, iPendingRows, fPendingSecs + (timer() - iStart)) )
+        except Exception as e:
+            if bData is not None:
+                logging.logPrint(writemethods.packetRows(bData), logLevel.DUMP_DATA)
+            logging.processError(p_e=e, p_message='last commit', p_dontSendToStats=True, p_jobID=p_jobID, p_threadID=p_threadID)
+            shared.eventQueue.put( (shared.E_WRITE_ERROR, p_jobID, p_threadID, None ) )
 
     setproctitle(f'datacopy: writeData (rollback@cursor) [{jobName}]')
     try:
@@ -458,7 +866,7 @@ def writeData(p_jobID:int, p_threadID:int, p_connection, p_cursor, p_iQuery:str
     logging.logPrint('Ended', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
     setproctitle(f'datacopy: writeData [{jobName}], ended')
 
-def writeDataCSV(p_jobID:int, p_threadID:int, p_conn, p_Header:str, p_encodeSpecial:bool = False):
+def writeDataCSV(p_jobID:int, p_threadID:int, p_stream:queues.StreamQueues, p_conn, p_Header:str, p_encodeSpecial:bool = False):
     '''write data to csv file'''
 
     playNice()
@@ -479,14 +887,20 @@ def writeDataCSV(p_jobID:int, p_threadID:int, p_conn, p_Header:str, p_encodeSpec
 
     while shared.Working.value:
         try:
-            bData = shared.dataQueue.get( block=True, timeout = 1 )
+            bData = p_stream.dataQueue.get( block=True, timeout = 1 )
         except queueEmpty:
-            if shared.stopWhenEmpty.value:
+            if p_stream.stopWhenEmpty.value:
                 logging.logPrint(f'end of data detected', logLevel.DEBUG, p_jobID=p_jobID, p_threadID=p_threadID)
                 break
             continue
         iStart = timer()
         try:
+            if isinstance(bData, writemethods.CopyPacket):
+                # already csv, straight from COPY TO STDOUT
+                f_file.write(bData.data)
+                shared.eventQueue.put( (shared.E_WRITE, p_jobID, bData.rows, (timer()-iStart)) )
+                continue
+            bData = writemethods.packetRows(bData)
             if p_encodeSpecial:
                 f_stream.writerows(utils.encodeSpecialChars(bData))
             else:
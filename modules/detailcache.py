@@ -0,0 +1,100 @@
+'''key de-duplication and detail results cache, for key_query/query (dual query) jobs'''
+
+import hashlib
+
+from collections import OrderedDict
+from typing import Any, Optional
+
+import modules.utils as utils
+
+# rough cost of each key on the de-duplication set: a 128 bit int plus its set slot
+_bytesPerKey = 72
+
+def _keyHash(p_keys) -> int:
+    return int.from_bytes(hashlib.blake2b(repr(tuple(p_keys)).encode(), digest_size=16).digest(), 'little')
+
+class KeysDedup:
+    '''
+    drops keys already seen on this job, on the keys reader. it keeps 128 bit hashes of the keys, not the keys;
+    when it reaches p_maxBytes it stops remembering new keys, but keeps dropping the ones it has.
+    '''
+
+    def __init__(self, p_maxBytes:int):
+        self.maxKeys:int = p_maxBytes // _bytesPerKey
+        self.dropped:int = 0
+        self.bFull:bool = False
+
+        self._seen:set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def filter(self, p_rows:list) -> list:
+        rows = []
+        for keys in p_rows:
+            h = _keyHash(keys)
+            if h in self._seen:
+                self.dropped += 1
+                continue
+            if not self.bFull:
+                if len(self._seen) < self.maxKeys:
+                    self._seen.add(h)
+                else:
+                    self.bFull = True
+            rows.append(keys)
+        return rows
+
+class DetailCache:
+    '''
+    least recently used detail query results, by the keys bound to the query, on each detail reader.
+    limited to p_maxRows rows and p_maxBytes (estimated) in total; 0 means no limit on that one.
+    '''
+
+    def __init__(self, p_maxRows:int, p_maxBytes:int):
+        self.maxRows:int = p_maxRows
+        self.maxBytes:int = p_maxBytes
+        self.rows:int = 0
+        self.bytes:int = 0
+        self.hits:int = 0
+        self.misses:int = 0
+
+        self._entries:OrderedDict[Any, tuple[list, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, p_keys) -> Optional[list]:
+        try:
+            entry = self._entries.get(tuple(p_keys))
+        except TypeError:
+            #unhashable key values
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(tuple(p_keys))
+        self.hits += 1
+        return entry[0]
+
+    def fits(self, p_rows:int, p_bytes:int = 0) -> bool:
+        '''if a result of p_rows rows and p_bytes (estimated) can be cached at all, so the reader can stop collecting one that can't'''
+        return (self.maxRows == 0 or p_rows <= self.maxRows) and (self.maxBytes == 0 or p_bytes <= self.maxBytes)
+
+    def put(self, p_keys, p_rows:list):
+        iBytes = utils.estimate_packet_bytes(p_rows)
+        if not self.fits(len(p_rows), iBytes):
+            return
+        try:
+            key = tuple(p_keys)
+            if key in self._entries:
+                return
+        except TypeError:
+            return
+
+        self._entries[key] = (p_rows, iBytes)
+        self.rows += len(p_rows)
+        self.bytes += iBytes
+        while (self.maxRows > 0 and self.rows > self.maxRows) or (self.maxBytes > 0 and self.bytes > self.maxBytes):
+            oldRows, oldBytes = self._entries.popitem(last=False)[1]
+            self.rows -= len(oldRows)
+            self.bytes -= oldBytes
@@ -4,6 +4,8 @@ import sys
 
 import re
 from timeit import default_timer as timer
+from typing import Any, Optional
+from decimal import Decimal
 import multiprocessing as mp
 
 from queue import Empty as queueEmpty
@@ -18,13 +20,323 @@ import modules.utils as utils
 import modules.jobs as jobs
 import modules.connections as connections
 import modules.datahandlers as datahandlers
+import modules.adaptive as adaptive
+import modules.queues as queues
+import modules.writemethods as writemethods
+
+def _startDBWriters(p_jobID:int, p_job:jobs.Job, p_stream:queues.StreamQueues, p_qtd:int, p_firstWriterID:int, p_insertQuery:str, p_description, p_reserved:int = 0) -> int:
+    '''
+    connects up to p_qtd writers to the job destination (as many as it has free slots for) and launches writeData on them.
+    p_reserved writer slots were already acquired by the caller.
+    returns how many were launched, -1 if connecting failed
+    '''
+
+    p_qtd = p_reserved + connections.acquireSlots(p_job.dest, 'w', p_qtd - p_reserved)
+    if p_qtd == 0:
+        return 0
+
+    newWriteConns = connections.initConnections(p_job.dest, False, p_qtd, p_job.table, 'w', p_localInfile=(p_job.writeMethod == 'load_data'))
+    if newWriteConns is None:
+        connections.releaseSlots(p_job.dest, 'w', p_qtd)
+        return -1
+
+    for x in range(p_qtd):
+        iWriterID = p_firstWriterID + x
+        shared.PutConn[iWriterID] = newWriteConns[x]
+        shared.PutData[iWriterID] = shared.PutConn[iWriterID].cursor()
+        if len(p_job.preCmdDst) > 0:
+            try:
+                logging.logPrint(f'preparing cursor #{iWriterID} for inserts, executing preCmdDst=[{p_job.preCmdDst}]', logLevel.DEBUG, p_jobID=p_jobID)
+                shared.PutData[iWriterID].execute(p_job.preCmdDst)
+            except Exception as e:
+                logging.processError(p_e=e, p_message=f'preparing cursor #{iWriterID} for inserts, preCmdDst=[{p_job.preCmdDst}]', p_jobID=p_jobID,p_dontSendToStats=True)
+        shared.writeP[iWriterID] = (mp.Process(target=datahandlers.writeData, args = (p_jobID, iWriterID, p_stream, shared.PutConn[iWriterID], shared.PutData[iWriterID], p_insertQuery, p_job.writeMethod, p_description, p_job.sourceDriver, p_job.destDriver, p_job.commitRows, p_job.commitSecs, p_job.coalesceRows, p_job.coalesceKB, p_job.coalesceSecs, p_job.writePipeline) ))
+        shared.writeP[iWriterID].start()
+
+    return p_qtd
+
+def _acquireReaderSlots(p_job:jobs.Job) -> int:
+    '''
+    reserves the sessions a job needs to start reading: on dual query mode, one on the key source and up to PARALLEL_READERS on the source;
+    on split reads, one session for min/max and the snapshot, and up to split_workers readers; otherwise one on the source.
+    returns how many source readers can be launched, 0 if the job has to wait
+    '''
+
+    if p_job.nbrSplits > 0:
+        if connections.acquireSlots(p_job.source, 's') == 0:
+            return 0
+        iGranted = connections.acquireSlots(p_job.source, 'r', min(p_job.nbrSplits, p_job.nbrSplitWorkers))
+        if iGranted == 0:
+            connections.releaseSlots(p_job.source, 's')
+        return iGranted
+
+    if len(p_job.key_source) > 0:
+        if connections.acquireSlots(p_job.key_source, 'r') == 0:
+            return 0
+        iGranted = connections.acquireSlots(p_job.source, 'r', shared.parallelReaders)
+        if iGranted == 0:
+            connections.releaseSlots(p_job.key_source, 'r')
+        return iGranted
+
+    return connections.acquireSlots(p_job.source, 'r')
+
+def _releaseReaderSlots(p_job:jobs.Job, p_granted:int):
+    '''gives back what _acquireReaderSlots reserved, p_granted being what it returned'''
+
+    if p_job.nbrSplits > 0:
+        connections.releaseSlots(p_job.source, 's')
+        connections.releaseSlots(p_job.source, 'r', p_granted)
+    elif len(p_job.key_source) > 0:
+        connections.releaseSlots(p_job.key_source, 'r')
+        connections.releaseSlots(p_job.source, 'r', p_granted)
+    else:
+        connections.releaseSlots(p_job.source, 'r')
+
+def _splitBoundaries(p_min, p_max, p_count:int) -> list[str]:
+    '''p_count-1 evenly spaced values between p_min and p_max of a numeric split_column, as sql literals'''
+
+    if p_min is None or p_max is None:
+        return []
+    if isinstance(p_min, Decimal):
+        p_min = int(p_min) if p_min == int(p_min) else float(p_min)
+    if isinstance(p_max, Decimal):
+        p_max = int(p_max) if p_max == int(p_max) else float(p_max)
+
+    if utils.identify_type(p_min) == 'integer' and utils.identify_type(p_max) == 'integer':
+        boundaries = sorted({p_min + ((p_max - p_min + 1) * i) // p_count for i in range(1, p_count)})
+        return [str(b) for b in boundaries if b > p_min]
+    if utils.identify_type(p_min) in ('integer', 'float') and utils.identify_type(p_max) in ('integer', 'float'):
+        boundaries = sorted({p_min + ((p_max - p_min) * i) / p_count for i in range(1, p_count)})
+        return [repr(float(b)) for b in boundaries if b > p_min]
+
+    raise ValueError(f'split_count needs a numeric split_column, min/max are [{p_min}]/[{p_max}]; use split_ranges instead')
+
+def _physicalBoundaries(p_job:jobs.Job, p_cursor, p_table:str) -> tuple[str, list[str]]:
+    '''
+    split_mode physical: cuts the table in split_count chunks of blocks, returns the column to split on and the chunk boundaries.
+    postgres: ctid block ranges, from the relation size. oracle: the first ROWID of each group of extents (non partitioned tables only)
+    ctid ranges are only scanned as ranges from postgres 14; before that each chunk would be a full scan, so it is read in one chunk
+    '''
+
+    if p_job.sourceDriver == 'psycopg2':
+        p_cursor.execute("SELECT current_setting('server_version_num')")
+        iVersion = int(p_cursor.fetchone()[0])
+        if iVersion < 140000:
+            logging.logPrint(f'split_mode physical needs postgres 14 or newer for ctid range scans, server is [{iVersion}]: reading in one chunk', p_jobID=p_job.jobID)
+            return 'ctid', []
+        sTable = p_table.replace("'", "''")
+        p_cursor.execute(f"SELECT pg_relation_size('{sTable}'::regclass) / current_setting('block_size')::int")
+        iBlocks = int(p_cursor.fetchone()[0])
+        iChunkBlocks = -(-iBlocks // p_job.nbrSplits)
+        return 'ctid', [f"'({b},0)'::tid" for b in range(iChunkBlocks, iBlocks, iChunkBlocks)] if iChunkBlocks > 0 else []
+
+    # oracle: rowids are ordered by (data object, file, block, row), so the first rowid of each group is enough
+    sOwner, _, sName = p_table.replace('"', '').rpartition('.')
+    if len(sOwner) > 0:
+        sExtents = f"DBA_EXTENTS WHERE OWNER = '{sOwner.upper()}' AND"
+        sObjects = f"DBA_OBJECTS o ON o.OWNER = '{sOwner.upper()}' AND"
+    else:
+        sExtents = 'USER_EXTENTS WHERE'
+        sObjects = 'USER_OBJECTS o ON'
+    p_cursor.execute(f'''SELECT ROWIDTOCHAR(MIN(DBMS_ROWID.ROWID_CREATE(1, o.DATA_OBJECT_ID, e.RELATIVE_FNO, e.BLOCK_ID, 0)))
+        FROM (SELECT SEGMENT_NAME, RELATIVE_FNO, BLOCK_ID, NTILE({p_job.nbrSplits}) OVER (ORDER BY RELATIVE_FNO, BLOCK_ID) CHUNK
+              FROM {sExtents} SEGMENT_NAME = '{sName.upper()}' AND SEGMENT_TYPE = 'TABLE') e
+        JOIN {sObjects} o.OBJECT_NAME = e.SEGMENT_NAME AND o.OBJECT_TYPE = 'TABLE'
+        GROUP BY e.CHUNK ORDER BY e.CHUNK''')
+    chunkStarts = [row[0] for row in p_cursor.fetchall()]
+    return 'ROWID', [f"CHARTOROWID('{rowID}')" for rowID in chunkStarts[1:]]
+
+def _rangePredicates(p_column:str, p_boundaries:list[str], p_withNulls:bool=True) -> list[str]:
+    '''one predicate per range: below the first boundary (and nulls), from each boundary to the next, and from the last one up'''
+
+    if len(p_boundaries) == 0:
+        return ['1=1']
+
+    predicates = [f'{p_column} < {p_boundaries[0]} OR {p_column} IS NULL' if p_withNulls else f'{p_column} < {p_boundaries[0]}']
+    for lo, hi in zip(p_boundaries[:-1], p_boundaries[1:]):
+        predicates.append(f'{p_column} >= {lo} AND {p_column} < {hi}')
+    predicates.append(f'{p_column} >= {p_boundaries[-1]}')
+    return predicates
+
+def _splitQueries(p_query:str, p_predicates:list[str]) -> list[str]:
+    '''one query per predicate: it goes where the query has #SPLIT_RANGE#, or on a WHERE around the whole query'''
+
+    if '#SPLIT_RANGE#' in p_query:
+        return [p_query.replace('#SPLIT_RANGE#', f'({predicate})') for predicate in p_predicates]
+    return [f'SELECT * FROM ({p_query}) dc_split WHERE {predicate}' for predicate in p_predicates]
+
+def _pgExportSnapshot(p_conn) -> str:
+    '''
+    starts a read only REPEATABLE READ transaction on a postgres connection, and exports its snapshot for the split readers.
+    initConnections leaves a transaction open (version check, schema, timeout), so it is rolled back first:
+    the isolation level can only change between transactions, and the snapshot is taken by the first statement.
+    '''
+    p_conn.rollback()
+    p_conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = p_conn.cursor()
+    cursor.execute('SELECT pg_export_snapshot()')
+    sSnapshot = cursor.fetchone()[0]
+    cursor.close()
+    return sSnapshot
+
+def _pgImportSnapshot(p_conn, p_snapshot:str):
+    '''starts a read only REPEATABLE READ transaction on a postgres connection that sees p_snapshot; SET TRANSACTION SNAPSHOT has to be its first statement'''
+    p_conn.rollback()
+    p_conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = p_conn.cursor()
+    cursor.execute(f"SET TRANSACTION SNAPSHOT '{p_snapshot}'")
+    cursor.close()
+
+def _oraCurrentSCN(p_cursor) -> int:
+    '''the current SCN of an oracle database, that the split readers go back to'''
+    p_cursor.execute('SELECT CURRENT_SCN FROM V$DATABASE')
+    return int(p_cursor.fetchone()[0])
+
+def _oraFlashbackSCN(p_conn, p_scn:int):
+    '''
+    puts an oracle session in flashback mode at p_scn, so every query it runs sees the data as of that SCN.
+    it's the session wide form of AS OF SCN, which only goes on table references, not around a whole query.
+    it has to start outside a transaction
+    '''
+    p_conn.rollback()
+    cursor = p_conn.cursor()
+    cursor.callproc('DBMS_FLASHBACK.ENABLE_AT_SYSTEM_CHANGE_NUMBER', [p_scn])
+    cursor.close()
+
+def _startSplitReaders(p_jobID:int, p_split:dict[str, Any], p_qtd:int) -> int:
+    '''
+    launches readData on the next p_qtd split queries of a job, each one on its own connection (that imports the job snapshot on postgres, or goes back to the job SCN on oracle).
+    the slots must be already reserved. returns how many were launched, -1 if connecting failed
+    '''
+
+    thisJob:jobs.Job = p_split['job']
+    p_qtd = min(p_qtd, len(p_split['queries']))
+
+    for _ in range(p_qtd):
+        newConns = connections.initConnections(thisJob.source, True, 1)
+        if newConns is None:
+            return -1
+
+        iThreadID = p_split['nextThreadID']
+        p_split['nextThreadID'] += 1
+        shared.GetConn[iThreadID] = newConns[0]
+        if len(p_split['snapshot']) > 0:
+            try:
+                _pgImportSnapshot(shared.GetConn[iThreadID], p_split['snapshot'])
+            except Exception as e:
+                logging.processError(p_e=e, p_message=f'importing snapshot [{p_split['snapshot']}] on split reader #{iThreadID}', p_jobID=p_jobID, p_stop=True, p_exitCode=6)
+                return -1
+        elif p_split['scn'] > 0:
+            try:
+                _oraFlashbackSCN(shared.GetConn[iThreadID], p_split['scn'])
+            except Exception as e:
+                logging.processError(p_e=e, p_message=f'going back to SCN [{p_split['scn']}] on split reader #{iThreadID}', p_jobID=p_jobID, p_stop=True, p_exitCode=6)
+                return -1
+        shared.GetData[iThreadID] = connections.initCursor(p_conn=shared.GetConn[iThreadID], p_jobID=iThreadID, p_source=thisJob.source, p_fetchSize=thisJob.fetchSize)
+
+        sQuery = p_split['queries'].pop(0)
+        logging.logPrint(f'split reader #{iThreadID}, query:\n***\n{sQuery}\n***', logLevel.DEBUG, p_jobID=p_jobID)
+        shared.readP[iThreadID] = mp.Process(target=datahandlers.readData, args = (p_jobID, shared.GetConn[iThreadID], shared.GetData[iThreadID], thisJob.fetchSize, sQuery, p_split['outQueue'], True, thisJob.packetFormat, p_split['adaptiveFetch'], iThreadID, False, thisJob.readPrefetch))
+        shared.readP[iThreadID].start()
+
+    return p_qtd
+
+def _resumeSplitReaders(p_jobID:int, p_split:dict[str, Any], p_running:int) -> int:
+    '''launches more split readers for a job, up to split_workers running and as many as there are free reader slots. returns how many, -1 if connecting failed'''
+
+    iWanted = min(len(p_split['queries']), p_split['job'].nbrSplitWorkers - p_running)
+    if iWanted <= 0:
+        return 0
+    iSlots = connections.acquireSlots(p_split['job'].source, 'r', iWanted)
+    if iSlots == 0:
+        return 0
+    return _startSplitReaders(p_jobID, p_split, iSlots)
 
 def jobManager():
     ''' main jobs handling loop'''
 
     utils.block_signals()
 
+    if shared.maxParallelStreams > 1 and len(shared.jobs) > 1:
+        _parallelStreams()
+    else:
+        _streamManager(1, len(shared.jobs))
+
+    setproctitle(f'datacopy: jobManager thread, ended')
+    with shared.Working.get_lock():
+        shared.Working.value = False
+
+def _isBarrierStream(p_firstJobID:int, p_lastJobID:int) -> bool:
+    '''streams with E mode jobs (statements) run alone: they usually prepare or clean up what the other streams touch'''
+    for jobID in range(p_firstJobID, p_lastJobID+1):
+        if shared.jobs[jobID]['mode'].upper() == 'E':
+            return True
+    return False
+
+def _streamProcess(p_firstJobID:int, p_lastJobID:int, p_eventQueue:queues.mpQueue):
+    '''one stream, on its own process. readers and writers are forked from here, so they send their events to this stream's queue'''
+
+    utils.block_signals()
+    shared.eventQueue = p_eventQueue
+    _streamManager(p_firstJobID, p_lastJobID)
+
+def _parallelStreams():
+    '''launches up to MAX_PARALLEL_STREAMS streams at a time, and forwards stop requests to all of them'''
+
+    setproctitle(f'datacopy: jobManager thread, streams coordinator')
+
+    pendingStreams:list[tuple[int, int]] = jobs.getStreams()
+    runningStreams:dict[int, tuple[mp.Process, queues.mpQueue, bool]] = {}
+    bStopForwarded:bool = False
+
+    logging.logPrint(f'{len(pendingStreams)} streams to run, max parallel streams: [{shared.maxParallelStreams}]')
+
+    try:
+        while len(pendingStreams) > 0 or len(runningStreams) > 0:
+            while shared.Working.value and not bStopForwarded and len(pendingStreams) > 0 and len(runningStreams) < shared.maxParallelStreams:
+                iFirstJobID, iLastJobID = pendingStreams[0]
+                bBarrier = _isBarrierStream(iFirstJobID, iLastJobID)
+                if (bBarrier and len(runningStreams) > 0) or any(running[2] for running in runningStreams.values()):
+                    break
+                pendingStreams.pop(0)
+                logging.logPrint(f'launching stream with jobs [{iFirstJobID}..{iLastJobID}]', logLevel.DEBUG, p_jobID=iFirstJobID)
+                streamEventQueue:queues.mpQueue = mp.Queue()
+                streamP = mp.Process(target=_streamProcess, args=(iFirstJobID, iLastJobID, streamEventQueue))
+                streamP.start()
+                runningStreams[iFirstJobID] = (streamP, streamEventQueue, bBarrier)
+
+            bStopRequested = False
+            try:
+                eType, _, _, _ = shared.eventQueue.get(block=True, timeout=1)
+                if eType == shared.E_STOP:
+                    bStopRequested = True
+            except queueEmpty:
+                pass
+
+            if (bStopRequested or not shared.Working.value) and not bStopForwarded:
+                logging.logPrint(f'stop requested, forwarding to {len(runningStreams)} running streams', logLevel.DEBUG)
+                for _, streamEventQueue, _ in runningStreams.values():
+                    streamEventQueue.put( (shared.E_STOP, None, None, None) )
+                pendingStreams = []
+                bStopForwarded = True
+
+            for iFirstJobID in list(runningStreams.keys()):
+                streamP, streamEventQueue, _ = runningStreams[iFirstJobID]
+                if not streamP.is_alive():
+                    streamP.join()
+                    streamEventQueue.close()
+                    del runningStreams[iFirstJobID]
+                    logging.logPrint(f'stream started with job [{iFirstJobID}] ended', logLevel.DEBUG, p_jobID=iFirstJobID)
+
+    except Exception as e:
+        logging.processError(p_e=e, p_message='streams coordinator: unexpected exception', p_stack=traceback.format_exc(), p_stop=True, p_exitCode=5)
+
+def _streamManager(p_firstJobID:int, p_lastJobID:int):
+    '''runs the jobs from p_firstJobID to p_lastJobID, one stream (destination table) after the other'''
+
     jobName:str='<unknown>'
+    #queues of the stream running, closed on the way out even when it ends on an error
+    streamQueues:Optional[queues.StreamQueues] = None
     try:
         setproctitle(f'datacopy: jobManager thread')
 
@@ -36,12 +348,20 @@ def jobManager():
 
         tParallelReadersNextCheck:float = 0
 
-        jobID = 1
+        jobID = p_firstJobID
 
         iDataLinesRead:dict[int, int] = {}
         fReadSecs:dict[int, float] = {}
         iDetailsQueriesSecs:dict[int, float] = {}
 
+        #readers still running on jobs with several readers (detail readers, split readers)
+        iJobReaders:dict[int, int] = {}
+        #split reads state: job, queries not started yet, snapshot, outQueue, adaptiveFetch, nextThreadID
+        splitReads:dict[int, dict[str, Any]] = {}
+
+        #fetch size of the readers of each job with fetch_size=adaptive, while they run
+        adaptiveFetches:dict[int, adaptive.AdaptiveFetchSize] = {}
+
         iIdleTimeout:int = 0
 
         logging.logPrint(f'entering jobs loop, max readers allowed: [{shared.parallelReaders}]')
@@ -53,7 +373,7 @@ def jobManager():
         #################################
 
 
-        while jobID < len(shared.jobs)+1 and bKeepGoing:
+        while jobID < p_lastJobID+1 and bKeepGoing:
             logging.logPrint(f'outer loop, jobID=[{jobID}]', logLevel.DEBUG, p_jobID=jobID)
 
             sWriteFileMode = 'w'
@@ -71,6 +391,30 @@ def jobManager():
 
             writersNotStartedYet = True
 
+            # queues and flags for this stream's readers and writers
+            streamQueues = queues.StreamQueues(jobID, shared.QUEUE_TRANSPORT, shared.queueSize, (shared.queueMaxMB if shared.queueMaxMB > 0 else shared.queueShmMB)*1024*1024,
+                                               shared.spillDir, shared.spillSegmentMB*1024*1024, shared.spillMaxMB*1024*1024, shared.SPILL_COMPRESS == 'lz4',
+                                               shared.queueMaxMB*1024*1024, writemethods.packetBytes)
+            if streamQueues.transport != shared.QUEUE_TRANSPORT:
+                logging.logPrint(f'not enough free space on /dev/shm for the queue ring, using QUEUE_TRANSPORT=[{streamQueues.transport}] on this stream', p_jobID=jobID)
+
+            #jobs and writers waiting for free slots on their connections (max_sessions, max_readers, max_writers)
+            waitingForSlots:list[tuple[int, int]] = []
+            iWritersPending:int = 0
+            iWriterSlots:int = 0
+            sWriterSlotReserved:str = ''
+            tSlotsNextCheck:float = 0
+
+            #memory governor
+            bMemoryPressure:bool = False
+            tMemoryNextCheck:float = 0
+
+            #elastic writers
+            bElasticWriters:bool = False
+            iMaxWriters:int = 0
+            tHighWaterSince:float = 0
+            tLowWaterSince:float = 0
+
             oMaxAlreadyInsertedData = None
 
             bEndOfJobs = False
@@ -80,7 +424,7 @@ def jobManager():
 
             logging.statsPrint('streamStart', jobID, shared.parallelReaders, thisJob.nbrParallelWriters, 0)
 
-            shared.idleSecsObserved.value = 0
+            iIdleSecsObserved:int = 0
 
             fStart = timer()
 
@@ -198,10 +542,19 @@ def jobManager():
                             fReadSecs[eJobID] += secs
                             fTotalReadSecs += secs
 
+                            if eJobID in adaptiveFetches:
+                                fetchSizeChange = adaptiveFetches[eJobID].readDone(recs, secs, iRunningWriters)
+                                if fetchSizeChange is not None:
+                                    logging.statsPrint('fetchSizeChange', eJobID, fetchSizeChange[1], fetchSizeChange[2], fetchSizeChange[0])
+                                    logging.logPrint(f'adaptive fetch size: [{fetchSizeChange[0]}] -> [{fetchSizeChange[1]}]', logLevel.DEBUG, p_jobID=eJobID)
+
                         case shared.E_WRITE:
                             iTotalDataLinesWritten += recs
                             fTotalWrittenSecs += secs
 
+                            for jobAdaptiveFetch in adaptiveFetches.values():
+                                jobAdaptiveFetch.writeDone(recs, secs)
+
                         case shared.E_BOOT:
                             if not shared.Working.value:
                                 continue
@@ -215,6 +568,11 @@ def jobManager():
                             if not shared.Working.value:
                                 continue
 
+                            if connections.acquireSlots(shared.jobs[eJobID]['source'], 's') == 0:
+                                logging.logPrint(f'no free sessions on [{shared.jobs[eJobID]["source"]}], waiting', logLevel.DEBUG, p_jobID=eJobID)
+                                waitingForSlots.append( (eType, eJobID) )
+                                continue
+
                             #disable parallel command launch
                             tParallelReadersNextCheck = float('inf')
 
@@ -246,6 +604,7 @@ def jobManager():
                             logging.statsPrint(p_type='execStatementStart', p_jobID=eJobID, p_recs=0, p_secs=0, p_threads=1)
 
                         case shared.E_CMD_ERROR:
+                            connections.releaseSlots(shared.jobs[eJobID]['source'], 's')
                             tParallelReadersNextCheck = timer() + shared.parallelReadersLaunchInterval
                             iRunningStatements -= 1
                             iActiveJobsOnThisStream -=1
@@ -254,6 +613,7 @@ def jobManager():
 
 
                         case shared.E_CMD_END:
+                            connections.releaseSlots(shared.jobs[eJobID]['source'], 's')
                             tParallelReadersNextCheck = timer() + shared.parallelReadersLaunchInterval
                             iRunningStatements -= 1
                             logging.statsPrint(p_type='execStatementEnd', p_jobID=eJobID, p_recs=0, p_secs=secs, p_threads=0)
@@ -265,16 +625,41 @@ def jobManager():
                             if not shared.Working.value:
                                 continue
 
+                            # memory governor: with something else running to free memory, wait for it
+                            if iActiveJobsOnThisStream > 0 and adaptive.memoryPressure():
+                                logging.logPrint(f'memory at [{shared.rssTotalMB.value:,.0f}]MB of [{shared.memoryLimitMB:,}]MB, reader waiting', logLevel.DEBUG, p_jobID=eJobID)
+                                waitingForSlots.append( (eType, eJobID) )
+                                continue
+
+                            bootJob = jobs.Job(eJobID)
+                            iReaderSlots = _acquireReaderSlots(bootJob)
+                            if iReaderSlots == 0:
+                                logging.logPrint(f'no free reader slots on [{bootJob.source}] or [{bootJob.key_source}], waiting', logLevel.DEBUG, p_jobID=eJobID)
+                                waitingForSlots.append( (eType, eJobID) )
+                                continue
+
+                            # the first writer slot is taken together with the reader slots: a stream holding its readers
+                            # while it waits for writers could be waiting on another stream that does the reverse
+                            if writersNotStartedYet and len(sWriterSlotReserved) == 0 and bootJob.destDriver != 'csv' and not shared.TEST_QUERIES:
+                                if connections.acquireSlots(bootJob.dest, 'w') == 0:
+                                    _releaseReaderSlots(bootJob, iReaderSlots)
+                                    logging.logPrint(f'no free writer slots on [{bootJob.dest}], waiting', logLevel.DEBUG, p_jobID=eJobID)
+                                    waitingForSlots.append( (eType, eJobID) )
+                                    continue
+                                sWriterSlotReserved = bootJob.dest
+
                             iActiveJobsOnThisStream += 1
 
                             iDataLinesRead[eJobID] = 0
                             fReadSecs[eJobID] = .001
+                            iJobReaders[eJobID] = 0
 
-                            thisJob = jobs.Job(eJobID)
+                            thisJob = bootJob
                             jobName = thisJob.jobName
 
                             isSelect = re.search('(^|[ \t\n]+)SELECT[ \t\n]+', thisJob.query.upper())
                             siObjSep = connections.getConnectionParameter(thisJob.source, 'insert_object_delimiter')
+                            sSplitTable = f'{siObjSep}{thisJob.query}{siObjSep}'
 
                             if thisJob.mode.upper() == 'A' and oMaxAlreadyInsertedData:
                                 if utils.identify_type(oMaxAlreadyInsertedData) in ('integer', 'float'):
@@ -292,6 +677,12 @@ def jobManager():
                                     if thisJob.sourceDriver != 'csv':
                                         thisJob.query = f'SELECT * FROM {siObjSep}{thisJob.query}{siObjSep}'
 
+                            if thisJob.nbrSplits > 0 and thisJob.splitMode == 'physical':
+                                # ctid and ROWID only exist on the table itself, not on a select around it
+                                if isSelect:
+                                    logging.processError(p_message='split_mode physical needs a table name as query', p_jobID=eJobID, p_stop=True, p_exitCode=4)
+                                    break
+                                thisJob.query = f"{thisJob.query} {'AND' if ' WHERE ' in thisJob.query else 'WHERE'} #SPLIT_RANGE#"
 
                             # dual query case:
                             if len(thisJob.key_source) > 0:
@@ -316,25 +707,31 @@ def jobManager():
                                         break
                                     shared.GetData[r1JobID] = connections.initCursor(p_conn=shared.GetConn[r1JobID], p_jobID=eJobID, p_source=thisJob.key_source, p_fetchSize=thisJob.fetchSize)
 
-                                for i in range(1, shared.parallelReaders+1):
+                                for i in range(1, iReaderSlots+1):
                                     thisThreadID=eJobID*1000+i
-                                    newConns = connections.initConnections(thisJob.source, True, 1)
+                                    #detail_mode temp writes the keys to a temp table, postgres does not allow creating it on read only transactions
+                                    newConns = connections.initConnections(thisJob.source, thisJob.detailMode != 'temp', 1)
                                     if newConns is not None:
                                         shared.GetConn[thisThreadID] = newConns[0]
                                     else:
                                         break
                                     shared.GetData[thisThreadID] = connections.initCursor(p_conn=shared.GetConn[thisThreadID], p_jobID=eJobID, p_source=thisJob.source, p_fetchSize=thisJob.fetchSize)
 
-                                    r2=mp.Process(target=datahandlers.readData2, args = (eJobID, thisThreadID, shared.GetConn[thisThreadID], shared.GetData[thisThreadID], thisJob.query, thisJob.fetchSize))
+                                    r2=mp.Process(target=datahandlers.readData2, args = (eJobID, thisThreadID, shared.GetConn[thisThreadID], shared.GetData[thisThreadID], thisJob.query, thisJob.fetchSize, streamQueues,
+                                                                                         thisJob.detailMode, thisJob.detailBatch, thisJob.sourceDriver, connections.getConnectionParameter(thisJob.source, 'insert_placeholder'),
+                                                                                         thisJob.detailCacheRows, thisJob.detailCacheKB))
                                     shared.readP[thisThreadID]=r2
 
                                     r2.start()
                                     iRunningReaders += 1
+                                    iJobReaders[eJobID] += 1
 
 
-                                outQueue:mp.Queue = shared.dataKeysQueue
+                                outQueue:mp.Queue = streamQueues.dataKeysQueue
                                 r1FinalDataReader = False
+                                r1PacketFormat:str = 'rows'
                                 iDetailsQueriesSecs[eJobID] = 0.001
+                                adaptiveFetch:Optional[adaptive.AdaptiveFetchSize] = None
                             else:
                                 r1JobID = eJobID
                                 r1Query:str=thisJob.query
@@ -345,8 +742,15 @@ def jobManager():
                                     shared.GetConn[r1JobID] = newConns[0]
                                 else:
                                     break
-                                outQueue:mp.Queue = shared.dataQueue
+                                outQueue:mp.Queue = streamQueues.dataQueue
                                 r1FinalDataReader = True
+                                r1PacketFormat:str = thisJob.packetFormat
+
+                                if thisJob.bAdaptiveFetch:
+                                    adaptiveFetch = adaptive.AdaptiveFetchSize(r1JobID, thisJob.fetchSize)
+                                    adaptiveFetches[r1JobID] = adaptiveFetch
+                                else:
+                                    adaptiveFetch = None
 
                                 if r1SourceDriver != 'csv':
                                     shared.GetData[r1JobID] = connections.initCursor(p_conn=shared.GetConn[r1JobID], p_jobID=eJobID, p_source=thisJob.source, p_fetchSize=thisJob.fetchSize)
@@ -357,12 +761,65 @@ def jobManager():
                             iDataLinesRead[r1JobID] = 0
                             fReadSecs[r1JobID] = .001
 
-                            if r1SourceDriver == 'csv':
+                            if r1FinalDataReader and thisJob.nbrSplits > 0:
+                                # the first connection gets min/max and holds the snapshot the split readers import
+                                try:
+                                    splitConn = shared.GetConn[r1JobID]
+                                    sSnapshot = ''
+                                    iSCN = 0
+                                    if thisJob.sourceDriver == 'psycopg2':
+                                        sSnapshot = _pgExportSnapshot(splitConn)
+                                        logging.logPrint(f'exported snapshot [{sSnapshot}] for split readers', logLevel.DEBUG, p_jobID=eJobID)
+
+                                    splitCursor = splitConn.cursor()
+                                    if thisJob.sourceDriver == 'oracledb':
+                                        iSCN = _oraCurrentSCN(splitCursor)
+                                        logging.logPrint(f'split readers will read as of SCN [{iSCN}]', logLevel.DEBUG, p_jobID=eJobID)
+                                    siObjSep = connections.getConnectionParameter(thisJob.source, 'insert_object_delimiter')
+                                    sSplitColumn = f'{siObjSep}{thisJob.splitColumn}{siObjSep}'
+                                    if thisJob.splitMode == 'physical':
+                                        sSplitColumn, splitBoundaries = _physicalBoundaries(thisJob, splitCursor, sSplitTable)
+                                    elif len(thisJob.splitRanges) > 0:
+                                        splitBoundaries = thisJob.splitRanges
+                                    else:
+                                        splitCursor.execute(f"SELECT MIN({sSplitColumn}), MAX({sSplitColumn}) FROM ({r1Query.replace('#SPLIT_RANGE#', '1=1')}) dc_split")
+                                        splitMinMax = splitCursor.fetchone()
+                                        splitBoundaries = _splitBoundaries(splitMinMax[0], splitMinMax[1], thisJob.nbrSplits)
+                                    splitCursor.close()
+                                except Exception as e:
+                                    logging.processError(p_e=e, p_message=f'preparing split reads ({thisJob.splitMode}) of [{thisJob.jobName}]', p_jobID=eJobID, p_stop=True, p_exitCode=6)
+                                    break
+
+                                if len(sSnapshot) == 0:
+                                    try:
+                                        splitConn.close()
+                                    except Exception:
+                                        pass
+                                    connections.releaseSlots(thisJob.source, 's')
+
+                                splitQueries = _splitQueries(r1Query, _rangePredicates(sSplitColumn, splitBoundaries, thisJob.splitMode != 'physical'))
+                                logging.logPrint(f'split on [{sSplitColumn}] in {len(splitQueries)} ranges, boundaries: {splitBoundaries}', p_jobID=eJobID)
+                                if iReaderSlots > len(splitQueries):
+                                    connections.releaseSlots(thisJob.source, 'r', iReaderSlots - len(splitQueries))
+                                    iReaderSlots = len(splitQueries)
+
+                                splitReads[eJobID] = {'job':thisJob, 'queries':splitQueries, 'snapshot':sSnapshot, 'scn':iSCN, 'outQueue':outQueue, 'adaptiveFetch':adaptiveFetch, 'nextThreadID':eJobID*1000+1}
+                                iStarted = _startSplitReaders(eJobID, splitReads[eJobID], iReaderSlots)
+                                if iStarted < 0:
+                                    logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                                    break
+                                iRunningReaders += iStarted
+                                iJobReaders[eJobID] += iStarted
+                                logging.statsPrint('splitReadStart', eJobID, len(splitQueries), 0, iStarted)
+                            elif r1SourceDriver == 'csv':
                                 shared.readP[r1JobID]=mp.Process(target=datahandlers.readDataCSV, args = (r1JobID, shared.GetConn[r1JobID], r1FetchSize, outQueue, r1FinalDataReader))
+                            elif r1FinalDataReader and thisJob.readMethod == 'copy':
+                                shared.readP[r1JobID]=mp.Process(target=datahandlers.readDataCopyPG, args = (r1JobID, shared.GetConn[r1JobID], r1FetchSize, r1Query, outQueue, connections.getCopyOutOptions(thisJob.dest)))
                             else:
-                                shared.readP[r1JobID]=mp.Process(target=datahandlers.readData, args = (r1JobID, shared.GetConn[r1JobID], shared.GetData[r1JobID], r1FetchSize, r1Query, outQueue, r1FinalDataReader))
-                            shared.readP[r1JobID].start()
-                            iRunningReaders += 1
+                                shared.readP[r1JobID]=mp.Process(target=datahandlers.readData, args = (r1JobID, shared.GetConn[r1JobID], shared.GetData[r1JobID], r1FetchSize, r1Query, outQueue, r1FinalDataReader, r1PacketFormat, adaptiveFetch, 0, thisJob.bKeyDedup, thisJob.readPrefetch))
+                            if not (r1FinalDataReader and thisJob.nbrSplits > 0):
+                                shared.readP[r1JobID].start()
+                                iRunningReaders += 1
 
                             tParallelReadersNextCheck = timer() + shared.parallelReadersLaunchInterval
 
@@ -448,25 +905,36 @@ def jobManager():
                                     sColNames = sColNames[:-1]
                                     sColsPlaceholders = sColsPlaceholders[:-1]
 
-                                    insertQuery = ''
                                     match thisJob.overrideCols:
                                         case '@d':
-                                            insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({sColNames}) VALUES ({sColsPlaceholders})'
+                                            sInsertCols = sColNames
                                             sIcolType = 'from destination'
                                         case '@l':
-                                            insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({sColNames.lower()}) VALUES ({sColsPlaceholders})'
+                                            sInsertCols = sColNames.lower()
                                             sIcolType = 'from source, lowercase'
                                         case '@u':
-                                            insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({sColNames.upper()}) VALUES ({sColsPlaceholders})'
+                                            sInsertCols = sColNames.upper()
                                             sIcolType = 'from source, upercase'
                                         case _:
                                             if len(thisJob.overrideCols)>0 and thisJob.overrideCols[0] != '@':
-                                                insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({thisJob.overrideCols}) VALUES ({sColsPlaceholders})'
+                                                sInsertCols = thisJob.overrideCols
                                                 sIcolType = 'overridden'
                                             else:
-                                                insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({sColNames}) VALUES ({sColsPlaceholders})'
+                                                sInsertCols = sColNames
                                                 sIcolType = 'from source'
 
+                                    match thisJob.writeMethod:
+                                        case 'copy':
+                                            insertQuery = f'COPY {siObjSep}{thisJob.table}{siObjSep}({sInsertCols}) FROM STDIN'
+                                        case 'append':
+                                            #direct path, needs a commit after each packet, which writeData already does
+                                            insertQuery = f'INSERT /*+ APPEND_VALUES */ INTO {siObjSep}{thisJob.table}{siObjSep}({sInsertCols}) VALUES ({sColsPlaceholders})'
+                                        case 'load_data':
+                                            #the writer adds LOAD DATA LOCAL INFILE 'file' in front of this
+                                            insertQuery = f"INTO TABLE {siObjSep}{thisJob.table}{siObjSep} CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({sInsertCols})"
+                                        case _:
+                                            insertQuery = f'INSERT INTO {siObjSep}{thisJob.table}{siObjSep}({sInsertCols}) VALUES ({sColsPlaceholders})'
+
                                     sColNamesNoQuotes:str = sColNames.replace(f'{siObjSep}','')
 
                                     logging.logPrint(sColNamesNoQuotes.split(','), logLevel.DUMP_COLS)
@@ -478,7 +946,7 @@ def jobManager():
                                             sCSVHeader:str = ''
 
                                     else:
-                                        logging.logPrint(f'insert query (cols {sIcolType}): [{insertQuery}]', p_jobID=eJobID)
+                                        logging.logPrint(f'insert query (cols {sIcolType}, write method {thisJob.writeMethod}): [{insertQuery}]', p_jobID=eJobID)
                                 else:
                                     #just generate create statements with an LLM
                                     import modules.ai as ai
@@ -494,33 +962,64 @@ def jobManager():
                                 if not shared.TEST_QUERIES:
                                     logging.logPrint(f'number of writers for this job: [{thisJob.nbrParallelWriters}]', p_jobID=eJobID)
 
-                                    newWriteConns = connections.initConnections(thisJob.dest, False, thisJob.nbrParallelWriters, thisJob.table, sWriteFileMode)
-                                    if newWriteConns is None:
-                                        logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
-                                    else:
-                                        with shared.stopWhenEmpty.get_lock():
-                                            shared.stopWhenEmpty.value = False
-                                        for x in range(thisJob.nbrParallelWriters):
-                                            shared.PutConn[iWriters] = newWriteConns[x]
-                                            if isinstance(newWriteConns[x], tuple):
+                                    if thisJob.destDriver == 'csv':
+                                        newWriteConns = connections.initConnections(thisJob.dest, False, thisJob.nbrParallelWriters, thisJob.table, sWriteFileMode)
+                                        if newWriteConns is None:
+                                            logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                                        else:
+                                            with streamQueues.stopWhenEmpty.get_lock():
+                                                streamQueues.stopWhenEmpty.value = False
+                                            for x in range(thisJob.nbrParallelWriters):
+                                                shared.PutConn[iWriters] = newWriteConns[x]
                                                 shared.PutData[iWriters] = None
-                                                shared.writeP[iWriters] = (mp.Process(target=datahandlers.writeDataCSV, args = (eJobID, iWriters, shared.PutConn[iWriters], sCSVHeader, thisJob.bCSVEncodeSpecial) ))
+                                                shared.writeP[iWriters] = (mp.Process(target=datahandlers.writeDataCSV, args = (eJobID, iWriters, streamQueues, shared.PutConn[iWriters], sCSVHeader, thisJob.bCSVEncodeSpecial) ))
                                                 shared.writeP[iWriters].start()
+                                                iWriters += 1
+                                                iRunningWriters += 1
+
+                                            writersNotStartedYet = False
+                                            logging.statsPrint('writeDataStart', eJobID, 0, 0, thisJob.nbrParallelWriters)
+                                    else:
+                                        iMaxWriters = thisJob.nbrMaxWriters
+                                        iDestMaxWriters = connections.getConnectionParameter(thisJob.dest, 'max_writers')
+                                        if iDestMaxWriters:
+                                            iMaxWriters = min(iMaxWriters, iDestMaxWriters)
+                                        bElasticWriters = iMaxWriters > thisJob.nbrMinWriters
+
+                                        with streamQueues.stopWhenEmpty.get_lock():
+                                            streamQueues.stopWhenEmpty.value = False
+                                        with streamQueues.retireWriters.get_lock():
+                                            streamQueues.retireWriters.value = 0
+
+                                        #kept for the elastic writers launched later
+                                        writersJobID = eJobID
+                                        writersJob = thisJob
+                                        writersInsertQuery = insertQuery
+                                        writersDescription = recs
+
+                                        iWriterSlotReserved = 0
+                                        if len(sWriterSlotReserved) > 0:
+                                            if sWriterSlotReserved == thisJob.dest:
+                                                iWriterSlotReserved = 1
                                             else:
-                                                shared.PutData[iWriters] = shared.PutConn[iWriters].cursor()
-                                                if len(thisJob.preCmdDst) > 0:
-                                                    try:
-                                                        logging.logPrint(f'preparing cursor #{iWriters} for inserts, executing preCmdDst=[{thisJob.preCmdDst}]', logLevel.DEBUG, p_jobID=eJobID)
-                                                        shared.PutData[iWriters].execute(thisJob.preCmdDst)
-                                                    except Exception as e:
-                                                        logging.processError(p_e=e, p_message=f'preparing cursor #{iWriters} for inserts, preCmdDst=[{thisJob.preCmdDst}]', p_jobID=eJobID,p_dontSendToStats=True)
-                                                shared.writeP[iWriters] = (mp.Process(target=datahandlers.writeData, args = (eJobID, iWriters, shared.PutConn[iWriters], shared.PutData[iWriters], insertQuery) ))
-                                                shared.writeP[iWriters].start()
-                                            iWriters += 1
-                                            iRunningWriters += 1
+                                                connections.releaseSlots(sWriterSlotReserved, 'w')
+                                            sWriterSlotReserved = ''
+
+                                        iWritersWanted = min(thisJob.nbrParallelWriters, iMaxWriters)
+                                        iStarted = _startDBWriters(eJobID, thisJob, streamQueues, iWritersWanted, iWriters, insertQuery, recs, iWriterSlotReserved)
+                                        if iStarted < 0:
+                                            logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                                        else:
+                                            iWriters += iStarted
+                                            iRunningWriters += iStarted
+                                            iWriterSlots += iStarted
+                                            iWritersPending = iWritersWanted - iStarted
 
-                                        writersNotStartedYet = False
-                                        logging.statsPrint('writeDataStart', eJobID, 0, 0, thisJob.nbrParallelWriters)
+                                            writersNotStartedYet = False
+                                            if iStarted > 0:
+                                                logging.statsPrint('writeDataStart', eJobID, 0, 0, iStarted)
+                                            if iWritersPending > 0:
+                                                logging.logPrint(f'no free writer slots on [{thisJob.dest}] for {iWritersPending} writers, waiting', p_jobID=eJobID)
 
                         case shared.E_READ_ERROR:
                             logging.statsPrint('readDataError', eJobID, iDataLinesRead[eJobID], fReadSecs[eJobID], iRunningReaders)
@@ -529,33 +1028,56 @@ def jobManager():
                         case shared.E_READ_END:
                             iRunningReaders -= 1
                             iReadingReaders -= 1
+                            connections.releaseSlots(shared.jobs[eJobID]['source'], 'r')
 
-                            # readData2 stuffs the threaID in recs
+                            # readData2 and split readers stuff the threaID in recs
                             if recs is None:
                                 iActiveJobsOnThisStream -=1
+                                adaptiveFetches.pop(eJobID, None)
                                 logging.statsPrint('readDataEnd', eJobID, iDataLinesRead[eJobID], fReadSecs[eJobID], iRunningReaders)
                                 try:
                                     shared.readP[eJobID].join(timeout=1)
                                 except:
                                     pass
                             else:
-                                #only print stats on last thead end
-                                if iRunningReaders == 0:
-                                    iActiveJobsOnThisStream -= 1
-                                    logging.statsPrint('readDataEnd', eJobID, iDataLinesRead[eJobID], fReadSecs[eJobID], iRunningReaders)
+                                iJobReaders[eJobID] -= 1
                                 try:
                                     shared.readP[recs].join(timeout=1)
                                 except:
                                     pass
 
+                                if eJobID in splitReads and shared.Working.value:
+                                    iStarted = _resumeSplitReaders(eJobID, splitReads[eJobID], iJobReaders[eJobID])
+                                    if iStarted < 0:
+                                        logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                                    else:
+                                        iRunningReaders += iStarted
+                                        iJobReaders[eJobID] += iStarted
+
+                                #only print stats on last thead end
+                                if iJobReaders[eJobID] == 0 and (eJobID not in splitReads or len(splitReads[eJobID]['queries']) == 0 or not shared.Working.value):
+                                    iActiveJobsOnThisStream -= 1
+                                    adaptiveFetches.pop(eJobID, None)
+                                    logging.statsPrint('readDataEnd', eJobID, iDataLinesRead[eJobID], fReadSecs[eJobID], iRunningReaders)
+                                    if eJobID in splitReads:
+                                        if len(splitReads[eJobID]['snapshot']) > 0:
+                                            # the snapshot is no longer needed
+                                            try:
+                                                shared.GetConn[eJobID].close()
+                                            except Exception:
+                                                pass
+                                            connections.releaseSlots(shared.jobs[eJobID]['source'], 's')
+                                        del splitReads[eJobID]
+
                         case shared.E_KEYS_READ_START:
-                            with shared.stopWhenKeysEmpty.get_lock():
-                                shared.stopWhenKeysEmpty.value = False
+                            with streamQueues.stopWhenKeysEmpty.get_lock():
+                                streamQueues.stopWhenKeysEmpty.value = False
                             logging.statsPrint('keysReadStart', p_jobID=eJobID, p_recs=secs, p_secs=0, p_threads=iRunningReaders)
 
                         case shared.E_KEYS_READ_END:
-                            with shared.stopWhenKeysEmpty.get_lock():
-                                shared.stopWhenKeysEmpty.value = True
+                            connections.releaseSlots(shared.jobs[abs(eJobID)].get('key_source', ''), 'r')
+                            with streamQueues.stopWhenKeysEmpty.get_lock():
+                                streamQueues.stopWhenKeysEmpty.value = True
                             logging.statsPrint('keysReadEnd', eJobID, iDataLinesRead[eJobID], fReadSecs[eJobID], iRunningWriters)
 
                         case shared.E_WRITE_START:
@@ -567,6 +1089,10 @@ def jobManager():
 
                         case shared.E_WRITE_END:
                             iRunningWriters -= 1
+                            #csv writers don't take slots, only the ones _startDBWriters launched do
+                            if iWriterSlots > 0:
+                                connections.releaseSlots(writersJob.dest, 'w')
+                                iWriterSlots -= 1
                             try:
                                 shared.writeP[eJobID].join(timeout=1)
                             except:
@@ -587,7 +1113,7 @@ def jobManager():
                 except queueEmpty:
                     if not bStopRequested:
                         iIdleTimeout += 1
-                        shared.idleSecsObserved.value += 1
+                        iIdleSecsObserved += 1
 
                         if shared.idleTimeoutSecs > 0 and iIdleTimeout > shared.idleTimeoutSecs:
                             logging.statsPrint('IdleTimeoutError', jobID, 0, shared.idleTimeoutSecs, 0)
@@ -603,22 +1129,22 @@ def jobManager():
                                     logging.logPrint(f'ignored error on forcing close on timeout, [{k}][{v[k]}]: [{e}]', logLevel.DEBUG)
                                     pass #do not remove as on production mode we comment the previous line
 
-                        if ( iIdleTimeout > 3 and iActiveJobsOnThisStream == 0 and iRunningWriters == 0 ):
+                        if ( iIdleTimeout > 3 and iActiveJobsOnThisStream == 0 and iRunningWriters == 0 and len(waitingForSlots) == 0 and iWritersPending == 0 ):
                             #exit inner loop
                             break
                     else:
                         #apply the brakes...
 
-                        while shared.dataKeysQueue.qsize() > 0:
+                        while streamQueues.dataKeysQueue.qsize() > 0:
                             try:
-                                _ = shared.dataKeysQueue.get(block = True, timeout = 1 )
+                                _ = streamQueues.dataKeysQueue.get(block = True, timeout = 1 )
                                 _ = None
                                 dumpedPackets += 1
                             except queueEmpty:
                                 break
                         while not bReadyToStop:
                             try:
-                                _ = shared.dataQueue.get(block = True, timeout = 1 )
+                                _ = streamQueues.dataQueue.get(block = True, timeout = 1 )
                                 _ = None
                                 dumpedPackets += 1
                             except queueEmpty:
@@ -638,18 +1164,80 @@ def jobManager():
                             bKeepGoing = False
 
                 #common part of event processing:
-                iCurrentQueueSize = shared.dataQueue.qsize()
-
-                if iCurrentQueueSize > shared.maxQueueLenObserved:
-                    shared.maxQueueLenObserved = iCurrentQueueSize
-
-                if iCurrentQueueSize == shared.queueSize:
-                    shared.maxQueueLenObservedEvents +=1
+                iCurrentQueueSize = streamQueues.observe()
+
+                if tMemoryNextCheck < timer() and adaptive.memoryPressure():
+                    tMemoryNextCheck = timer() + 1
+                    if not bMemoryPressure:
+                        bMemoryPressure = True
+                        logging.statsPrint('memoryHighWater', jobID, int(shared.rssTotalMB.value), 0, shared.memoryLimitMB)
+                        logging.logPrint(f'memory at [{shared.rssTotalMB.value:,.0f}]MB of [{shared.memoryLimitMB:,}]MB, holding new readers and shrinking fetch sizes')
+                    for jobAdaptiveFetch in adaptiveFetches.values():
+                        fetchSizeChange = jobAdaptiveFetch.shrink()
+                        if fetchSizeChange is not None:
+                            logging.statsPrint('fetchSizeChange', jobAdaptiveFetch.jobID, fetchSizeChange[1], fetchSizeChange[2], fetchSizeChange[0])
+                elif bMemoryPressure and not adaptive.memoryPressure():
+                    bMemoryPressure = False
+                    logging.logPrint(f'memory back at [{shared.rssTotalMB.value:,.0f}]MB of [{shared.memoryLimitMB:,}]MB')
+
+                if (len(waitingForSlots) > 0 or iWritersPending > 0 or len(splitReads) > 0) and shared.Working.value and tSlotsNextCheck < timer():
+                    tSlotsNextCheck = timer() + 1
+                    for waitingEvent in waitingForSlots:
+                        shared.eventQueue.put( (waitingEvent[0], waitingEvent[1], None, None) )
+                    waitingForSlots = []
+
+                    for splitJobID in splitReads:
+                        iStarted = _resumeSplitReaders(splitJobID, splitReads[splitJobID], iJobReaders[splitJobID])
+                        if iStarted < 0:
+                            logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                            break
+                        iRunningReaders += iStarted
+                        iJobReaders[splitJobID] += iStarted
+
+                    if iWritersPending > 0:
+                        iStarted = _startDBWriters(writersJobID, writersJob, streamQueues, iWritersPending, iWriters, writersInsertQuery, writersDescription)
+                        if iStarted < 0:
+                            logging.processError(p_message='InitConnections returned None, giving up', p_stop=True)
+                            iWritersPending = 0
+                        elif iStarted > 0:
+                            if iRunningWriters == 0:
+                                logging.statsPrint('writeDataStart', writersJobID, 0, 0, iStarted)
+                            iWriters += iStarted
+                            iRunningWriters += iStarted
+                            iWriterSlots += iStarted
+                            iWritersPending -= iStarted
+
+                if bElasticWriters and not writersNotStartedYet and shared.Working.value and not streamQueues.stopWhenEmpty.value:
+                    fQueueUsage = iCurrentQueueSize / shared.queueSize
+                    if fQueueUsage >= shared.writersHighWater:
+                        tLowWaterSince = 0
+                        if tHighWaterSince == 0:
+                            tHighWaterSince = timer()
+                        elif timer() - tHighWaterSince >= shared.writersScaleSecs and iRunningWriters < iMaxWriters:
+                            iStarted = _startDBWriters(writersJobID, writersJob, streamQueues, 1, iWriters, writersInsertQuery, writersDescription)
+                            if iStarted > 0:
+                                iWriters += iStarted
+                                iRunningWriters += iStarted
+                                iWriterSlots += iStarted
+                                logging.statsPrint('writersScaleUp', writersJobID, iRunningWriters, fQueueUsage, iRunningWriters)
+                            tHighWaterSince = 0
+                    elif fQueueUsage <= shared.writersLowWater:
+                        tHighWaterSince = 0
+                        if tLowWaterSince == 0:
+                            tLowWaterSince = timer()
+                        elif timer() - tLowWaterSince >= shared.writersScaleSecs and iRunningWriters - streamQueues.retireWriters.value > writersJob.nbrMinWriters:
+                            with streamQueues.retireWriters.get_lock():
+                                streamQueues.retireWriters.value += 1
+                            logging.statsPrint('writersScaleDown', writersJobID, iRunningWriters - streamQueues.retireWriters.value, fQueueUsage, iRunningWriters)
+                            tLowWaterSince = 0
+                    else:
+                        tHighWaterSince = 0
+                        tLowWaterSince = 0
 
                 if tParallelReadersNextCheck < timer():
                     tParallelReadersNextCheck = timer() + shared.parallelReadersLaunchInterval
-                    if  bKeepGoing and (not bEndOfJobs and not thisJob.bCloseStream and iActiveJobsOnThisStream < shared.parallelReaders and iCurrentQueueSize<shared.usedQueueBeforeNew):
-                        if jobID<len(shared.jobs):
+                    if  bKeepGoing and (not bEndOfJobs and not thisJob.bCloseStream and iActiveJobsOnThisStream + len(waitingForSlots) < shared.parallelReaders and iCurrentQueueSize<shared.usedQueueBeforeNew):
+                        if jobID<p_lastJobID:
                             jobID += 1
                             jobName = shared.getJobName(jobID)
                             shared.eventQueue.put( (shared.E_BOOT, jobID, None, None ) )
@@ -658,22 +1246,22 @@ def jobManager():
                             jobID += 1
                             bEndOfJobs = True
                     else:
-                        if iActiveJobsOnThisStream == 0 and thisJob.bCloseStream:
-                            if shared.dataQueue.qsize() == 0 and shared.eventQueue.qsize() == 0 and shared.stopWhenEmpty.value == False:
+                        if iActiveJobsOnThisStream == 0 and len(waitingForSlots) == 0 and thisJob.bCloseStream:
+                            if streamQueues.dataQueue.qsize() == 0 and shared.eventQueue.qsize() == 0 and streamQueues.stopWhenEmpty.value == False:
                                 logging.logPrint('signaling the end of data for this stream.', p_jobID=eJobID)
-                                shared.stopWhenEmpty.value = True
+                                streamQueues.stopWhenEmpty.value = True
 
                 if shared.Working.value:
                     if shared.SCREEN_STATS:
                         if iRunningStatements > 0:
-                            statsLine=f'\r excecuting statement of Job [{jobName}], timeout timer: {iIdleTimeout:,}, idle time: {shared.idleSecsObserved.value:,}        '
+                            statsLine=f'\r excecuting statement of Job [{jobName}], timeout timer: {iIdleTimeout:,}, idle time: {iIdleSecsObserved:,}        '
                         else:
-                            statsLine=f'\r{iTotalDataLinesRead:,} recs read ({(iTotalDataLinesRead/fTotalReadSecs):,.2f}/sec, {iReadingReaders}r,{iRunningQueries}q), {iTotalDataLinesWritten:,} recs written ({(iTotalDataLinesWritten/fTotalWrittenSecs):,.2f}/sec, {iRunningWriters}w), queue len: {iCurrentQueueSize:,}, max queue: {shared.maxQueueLenObserved:,}, timeout timer: {iIdleTimeout:,}, idle time: {shared.idleSecsObserved.value:,}, activeJobs: {iActiveJobsOnThisStream}        '
+                            statsLine=f'\r{iTotalDataLinesRead:,} recs read ({(iTotalDataLinesRead/fTotalReadSecs):,.2f}/sec, {iReadingReaders}r,{iRunningQueries}q), {iTotalDataLinesWritten:,} recs written ({(iTotalDataLinesWritten/fTotalWrittenSecs):,.2f}/sec, {iRunningWriters}w), queue len: {iCurrentQueueSize:,}, max queue: {streamQueues.maxQueueLenObserved:,}, timeout timer: {iIdleTimeout:,}, idle time: {iIdleSecsObserved:,}, activeJobs: {iActiveJobsOnThisStream}        '
                         if shared.SCREEN_STATS_TO_STDOUT:
                             print(statsLine, file=sys.stdout, end='', flush = True)
                         else:
                             print(statsLine, file=sys.stderr, end='', flush = True)
-                    logging.logPrint(f'reads:{iTotalDataLinesRead:,} ({(iTotalDataLinesRead/fTotalReadSecs):,.2f}/s, {iReadingReaders}r,{iRunningQueries}q); writes:{iTotalDataLinesWritten:,} ({(iTotalDataLinesWritten/fTotalWrittenSecs):,.2f}/s, {iRunningWriters}w); ql:{iCurrentQueueSize:,}, mq:{shared.maxQueueLenObserved:,}; i:{iIdleTimeout:,}, it:{shared.idleSecsObserved.value:,}, Working={shared.Working.value}, ActiveJobs={iActiveJobsOnThisStream}', logLevel.STATSONPROCNAME)
+                    logging.logPrint(f'reads:{iTotalDataLinesRead:,} ({(iTotalDataLinesRead/fTotalReadSecs):,.2f}/s, {iReadingReaders}r,{iRunningQueries}q); writes:{iTotalDataLinesWritten:,} ({(iTotalDataLinesWritten/fTotalWrittenSecs):,.2f}/s, {iRunningWriters}w); ql:{iCurrentQueueSize:,}, mq:{streamQueues.maxQueueLenObserved:,}; i:{iIdleTimeout:,}, it:{iIdleSecsObserved:,}, Working={shared.Working.value}, ActiveJobs={iActiveJobsOnThisStream}', logLevel.STATSONPROCNAME)
 
 
             fEnd = timer()
@@ -682,22 +1270,29 @@ def jobManager():
             print('\n\n', file=sys.stdout, flush = True)
 
             if iTotalDataLinesWritten > 0:
-                logging.statsPrint('queueStats', jobID, shared.maxQueueLenObserved, shared.maxQueueLenObservedEvents, 0)
+                logging.statsPrint('queueStats', jobID, streamQueues.maxQueueLenObserved, streamQueues.maxQueueLenObservedEvents, 0)
+                spillStats = streamQueues.spillStats()
+                if spillStats is not None:
+                    logging.statsPrint('queueSpillStats', jobID, spillStats[1], spillStats[2], spillStats[0])
+                if streamQueues.byteBoundedQueue is not None:
+                    logging.statsPrint('queueBytesStats', jobID, streamQueues.maxQueueBytesObserved, 0, 0)
                 logging.logPrint(f'{iTotalDataLinesWritten:,} rows copied in {utils.seconds_to_readable(fTimeTaken)} ({(iTotalDataLinesWritten/fTimeTaken):,.2f}/sec).')
-                logging.statsPrint('writeDataEnd', jobID, iTotalDataLinesWritten, fTotalWrittenSecs, shared.dataQueue.qsize())
+                logging.statsPrint('writeDataEnd', jobID, iTotalDataLinesWritten, fTotalWrittenSecs, streamQueues.dataQueue.qsize())
             else:
                 logging.logPrint(f'statement(s) executed in {utils.seconds_to_readable(fTimeTaken)}')
 
-            logging.statsPrint('streamEnd', jobID, shared.idleSecsObserved.value, fTimeTaken, 0)
-            shared.maxQueueLenObserved = 0
-            shared.maxQueueLenObservedEvents = 0
+            logging.statsPrint('streamEnd', jobID, iIdleSecsObserved, fTimeTaken, 0)
+            if len(sWriterSlotReserved) > 0:
+                connections.releaseSlots(sWriterSlotReserved, 'w')
+            streamQueues.close()
+            streamQueues = None
             logging.logPrint(f'end of inner loop, with jobID=[{jobID}]', logLevel.DEBUG)
             jobID += 1
 
         logging.logPrint(f'end of outer loop, with jobID=[{jobID}]', logLevel.DEBUG)
-        setproctitle(f'datacopy: jobManager thread, ended')
-        with shared.Working.get_lock():
-            shared.Working.value = False
 
     except Exception as e:
         logging.processError(p_e=e, p_message=f'({jobName}): unexpected exception', p_stack=traceback.format_exc(), p_stop=True, p_exitCode=5)
+    finally:
+        if streamQueues is not None:
+            streamQueues.close()
@@ -12,9 +12,20 @@ from modules.logging import logLevel as logLevel
 import modules.shared as shared
 import modules.utils as utils
 import modules.connections as connections
+import modules.columnar as columnar
+import modules.writemethods as writemethods
+import modules.datahandlers as datahandlers
 
 expected_query_columns = ('source','dest','mode','query','table')
 
+packet_formats = ('rows', 'arrow')
+
+read_methods = ('fetch', 'copy')
+
+split_modes = ('range', 'physical')
+
+detail_modes = ('row', 'in', 'temp')
+
 class Job:
     '''job variables organizer class to ease management'''
 
@@ -102,7 +113,11 @@ class Job:
 
         self.table = thisJobData['table']
 
-        if 'fetch_size' in thisJobData:
+        self.bAdaptiveFetch:bool = False
+        if 'fetch_size' in thisJobData and str(thisJobData['fetch_size']).lower() == 'adaptive':
+            self.bAdaptiveFetch = True
+            self.fetchSize = shared.defaultFetchSize
+        elif 'fetch_size' in thisJobData:
             qFetchSize = int(thisJobData['fetch_size'])
             if qFetchSize == 0:
                 self.fetchSize = shared.defaultFetchSize
@@ -163,6 +178,114 @@ class Job:
         else:
             self.nbrParallelWriters:int = 1
 
+        # elastic writers: jobManager adds or retires writers between these, following the queue usage
+        if 'min_writers' in thisJobData and thisJobData['min_writers'] != '' and not shared.TEST_QUERIES:
+            self.nbrMinWriters:int = max(1, int(thisJobData['min_writers']))
+        else:
+            self.nbrMinWriters:int = self.nbrParallelWriters
+
+        if 'max_writers' in thisJobData and thisJobData['max_writers'] != '' and not shared.TEST_QUERIES:
+            self.nbrMaxWriters:int = max(self.nbrParallelWriters, int(thisJobData['max_writers']))
+        else:
+            self.nbrMaxWriters:int = self.nbrParallelWriters
+
+        if 'packet_format' in thisJobData and thisJobData['packet_format'] != '':
+            self.packetFormat:str = str(thisJobData['packet_format']).lower()
+        else:
+            self.packetFormat:str = 'rows'
+
+        if 'read_method' in thisJobData and thisJobData['read_method'] != '':
+            self.readMethod:str = str(thisJobData['read_method']).lower()
+        else:
+            self.readMethod:str = 'fetch'
+
+        if 'read_prefetch' in thisJobData and thisJobData['read_prefetch'] != '':
+            self.readPrefetch:int = int(thisJobData['read_prefetch'])
+        else:
+            self.readPrefetch:int = 0
+
+        # split reads: several readers, each one on a range of split_column (split_mode range) or on a chunk of the table blocks (split_mode physical)
+        self.splitMode:str = str(thisJobData.get('split_mode', '')).lower() or 'range'
+        self.splitColumn:str = str(thisJobData.get('split_column', ''))
+        if 'split_ranges' in thisJobData and thisJobData['split_ranges'] != '':
+            self.splitRanges:list[str] = [b.strip() for b in str(thisJobData['split_ranges']).split(',')]
+            self.nbrSplits:int = len(self.splitRanges) + 1
+        else:
+            self.splitRanges:list[str] = []
+            self.nbrSplits:int = 0
+            if 'split_count' in thisJobData and thisJobData['split_count'] != '':
+                try:
+                    self.nbrSplits = int(thisJobData['split_count'])
+                except ValueError:
+                    logging.processError(p_message=f'split_count [{thisJobData['split_count']}] is not a number of ranges. giving up.', p_jobID=p_jobID, p_stop=True, p_exitCode=4)
+
+        self.nbrSplitWorkers:int = self.nbrSplits
+        if 'split_workers' in thisJobData and thisJobData['split_workers'] not in ('', 0, '0'):
+            try:
+                self.nbrSplitWorkers = int(thisJobData['split_workers'])
+            except ValueError:
+                logging.processError(p_message=f'split_workers [{thisJobData['split_workers']}] is not a number of readers. giving up.', p_jobID=p_jobID, p_stop=True, p_exitCode=4)
+
+        if 'detail_mode' in thisJobData and thisJobData['detail_mode'] != '':
+            self.detailMode:str = str(thisJobData['detail_mode']).lower()
+        else:
+            self.detailMode:str = 'row'
+
+        if 'detail_batch' in thisJobData and thisJobData['detail_batch'] not in ('', 0, '0'):
+            self.detailBatch:int = int(thisJobData['detail_batch'])
+        else:
+            self.detailBatch:int = 1000
+
+        if 'key_dedup' in thisJobData:
+            self.bKeyDedup:bool = bool(thisJobData['key_dedup'] == 'yes')
+        else:
+            self.bKeyDedup:bool = False
+
+        if 'detail_cache_rows' in thisJobData and thisJobData['detail_cache_rows'] != '':
+            self.detailCacheRows:int = int(thisJobData['detail_cache_rows'])
+        else:
+            self.detailCacheRows:int = 0
+
+        if 'detail_cache_kb' in thisJobData and thisJobData['detail_cache_kb'] != '':
+            self.detailCacheKB:int = int(thisJobData['detail_cache_kb'])
+        else:
+            self.detailCacheKB:int = 0
+
+        if 'write_method' in thisJobData and thisJobData['write_method'] != '':
+            self.writeMethod:str = str(thisJobData['write_method']).lower()
+        else:
+            self.writeMethod:str = writemethods.supported_write_methods[self.destDriver if self.destDriver in writemethods.supported_write_methods else ''][0]
+
+        if 'commit_rows' in thisJobData and thisJobData['commit_rows'] != '':
+            self.commitRows:int = int(thisJobData['commit_rows'])
+        else:
+            self.commitRows:int = 0
+
+        if 'commit_secs' in thisJobData and thisJobData['commit_secs'] != '':
+            self.commitSecs:float = float(thisJobData['commit_secs'])
+        else:
+            self.commitSecs:float = 0
+
+        if 'coalesce_rows' in thisJobData and thisJobData['coalesce_rows'] != '':
+            self.coalesceRows:int = int(thisJobData['coalesce_rows'])
+        else:
+            self.coalesceRows:int = 0
+
+        if 'coalesce_kb' in thisJobData and thisJobData['coalesce_kb'] != '':
+            self.coalesceKB:int = int(thisJobData['coalesce_kb'])
+        else:
+            self.coalesceKB:int = 0
+
+        if 'coalesce_secs' in thisJobData and thisJobData['coalesce_secs'] != '':
+            self.coalesceSecs:float = float(thisJobData['coalesce_secs'])
+        else:
+            self.coalesceSecs:float = 0.1
+
+        if 'write_pipeline' in thisJobData and thisJobData['write_pipeline'] != '':
+            self.writePipeline:int = int(thisJobData['write_pipeline'])
+        else:
+            self.writePipeline:int = 0
+
         if 'csv_encode_special' in thisJobData:
             self.bCSVEncodeSpecial = bool(thisJobData['csv_encode_special'] == 'yes')
         else:
@@ -208,6 +331,19 @@ class Job:
         return f'Job({self.__str__()})'
 
 
+def getStreams() -> list[tuple[int, int]]:
+    '''(first jobID, last jobID) of each stream, i.e., of each run of jobs that share writers (same rule as Job.bCloseStream)'''
+
+    streams:list[tuple[int, int]] = []
+    iFirstJobID:int = 1
+    for jobID in range(1, len(shared.jobs)+1):
+        if shared.REUSE_WRITERS and jobID < len(shared.jobs) and shared.jobs[jobID+1]['dest'] == shared.jobs[jobID]['dest'] and shared.jobs[jobID+1]['table'] == shared.jobs[jobID]['table']:
+            continue
+        streams.append((iFirstJobID, jobID))
+        iFirstJobID = jobID+1
+
+    return streams
+
 def load(p_filename:str) -> dict[int, dict[str, Any]]:
     '''loads job file into memory'''
 
@@ -277,6 +413,24 @@ def preCheck(raw_jobs:dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
             logging.processError(p_message=f'data destination [{dest}] not declared on connections. giving up.', p_stop=True, p_exitCode=4)
             return {}
 
+        if mode.upper() != 'E':
+            # readers keep their sessions while waiting for the writers' ones, so each connection must fit at least one of each
+            minSlots:dict[str, list[int]] = {}
+            for connName, iKind in ((key_source, 1), (source, 1), (dest, 2)):
+                if connName in shared.connSlots:
+                    minSlots.setdefault(connName, [0, 0, 0])
+                    minSlots[connName][0] += 1
+                    minSlots[connName][iKind] += 1
+            if source in minSlots and (aJob.get('split_column', '') != '' or str(aJob.get('split_mode', '')).lower() == 'physical'):
+                # the session that gets min/max and exports the snapshot for split readers
+                minSlots[source][0] += 1
+            for connName, needed in minSlots.items():
+                c = shared.connections[connName]
+                for limitName, iNeeded in zip(('max_sessions', 'max_readers', 'max_writers'), needed):
+                    if c[limitName] and c[limitName] < iNeeded:
+                        logging.processError(p_message=f'jobs line {key+1} needs at least {iNeeded} sessions on [{connName}], but its {limitName} is {c[limitName]}. giving up.', p_stop=True, p_exitCode=4)
+                        return {}
+
         if destDriver == 'csv':
             if shared.GENERATE_CREATE_TABLES:
                 logging.processError(p_message=f'cannot generate create table statements for CSV destination (jobs line {key+1}), giving up.', p_stop=True, p_exitCode=4)
@@ -290,6 +444,137 @@ def preCheck(raw_jobs:dict[int, dict[str, Any]]) -> dict[int, dict[str, Any]]:
             logging.processError(p_message='Query and SubQuery mode does not support main data from csv (yet), only for keys. giving up.')
             return {}
 
+        if 'packet_format' in aJob and aJob['packet_format'] != '':
+            packetFormat = str(aJob['packet_format']).lower()
+            if packetFormat not in packet_formats:
+                logging.processError(p_message=f'packet_format [{packetFormat}] is not one of {packet_formats} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if packetFormat == 'arrow' and not columnar.available():
+                logging.processError(p_message=f'packet_format arrow requested, but pyarrow is not installed (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if packetFormat == 'arrow' and mode.upper() != 'E' and not (destDriver == 'psycopg2' and str(aJob.get('write_method', '')).lower() == 'copy'):
+                logging.processError(p_message=f'packet_format arrow only pays off with write_method copy on psycopg2 destinations, the other writers would turn the packets back into rows (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        if 'write_method' in aJob and aJob['write_method'] != '' and mode.upper() != 'E':
+            writeMethod = str(aJob['write_method']).lower()
+            if writeMethod not in writemethods.supported_write_methods.get(str(destDriver), ()):
+                logging.processError(p_message=f'write_method [{writeMethod}] is not supported for [{destDriver}] destinations, use one of {writemethods.supported_write_methods.get(str(destDriver), ())} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        if 'read_prefetch' in aJob and aJob['read_prefetch'] not in ('', 0, '0') and mode.upper() != 'E':
+            try:
+                iPrefetch = int(aJob['read_prefetch'])
+            except ValueError:
+                iPrefetch = -1
+            if iPrefetch < 0:
+                logging.processError(p_message=f'read_prefetch [{aJob['read_prefetch']}] is not a number of packets (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if sourceDriver == 'csv' or str(aJob.get('read_method', '')).lower() == 'copy':
+                logging.processError(p_message=f'read_prefetch works with read_method fetch on database sources only (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        if 'write_pipeline' in aJob and aJob['write_pipeline'] not in ('', 0, '0') and mode.upper() != 'E':
+            try:
+                iPipeline = int(aJob['write_pipeline'])
+            except ValueError:
+                iPipeline = -1
+            if iPipeline < 0:
+                logging.processError(p_message=f'write_pipeline [{aJob['write_pipeline']}] is not a number of packets (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        if 'read_method' in aJob and aJob['read_method'] != '' and mode.upper() != 'E':
+            readMethod = str(aJob['read_method']).lower()
+            if readMethod not in read_methods:
+                logging.processError(p_message=f'read_method [{readMethod}] is not one of {read_methods} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if readMethod == 'copy':
+                if sourceDriver != 'psycopg2' or key_source != '':
+                    logging.processError(p_message=f'read_method copy only works on single queries from psycopg2 sources (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                    return {}
+                if destDriver != 'csv' and not (destDriver == 'psycopg2' and str(aJob.get('write_method', '')).lower() == 'copy'):
+                    logging.processError(p_message=f'read_method copy needs a csv destination, or a psycopg2 destination with write_method copy (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                    return {}
+                if str(aJob.get('packet_format', '')).lower() == 'arrow':
+                    logging.processError(p_message=f'read_method copy sends raw text packets, it cannot be used with packet_format arrow (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                    return {}
+                if destDriver == 'csv':
+                    if connections.getConnectionParameter(dest, 'quoting') in ('NONE', 'NONNUMERIC'):
+                        logging.processError(p_message=f'read_method copy writes csv as postgres does, it cannot do quoting [{connections.getConnectionParameter(dest, 'quoting')}] of [{dest}] (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                        return {}
+                    if aJob.get('csv_encode_special', '') == 'yes':
+                        logging.processError(p_message=f'read_method copy writes the text as postgres sends it, it cannot be used with csv_encode_special (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                        return {}
+
+        detailMode = str(aJob.get('detail_mode', '')).lower() or 'row'
+        if detailMode not in detail_modes:
+            logging.processError(p_message=f'detail_mode [{detailMode}] is not one of {detail_modes} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+        if detailMode != 'row':
+            if key_source == '':
+                logging.processError(p_message=f'detail_mode {detailMode} is for key_query/query (dual query) jobs (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if len(query) > 0 and query[0] != '@' and '#KEYS#' not in query:
+                logging.processError(p_message=f'detail_mode {detailMode} needs #KEYS# on the query, where the keys go (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if aJob.get('detail_cache_rows', '') not in ('', 0, '0') or aJob.get('detail_cache_kb', '') not in ('', 0, '0'):
+                logging.processError(p_message=f'detail_cache_rows and detail_cache_kb work with detail_mode row only (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if detailMode == 'temp' and sourceDriver not in datahandlers.keys_table_ddl:
+                logging.processError(p_message=f'detail_mode temp is not available for [{sourceDriver}] sources, use one of {tuple(datahandlers.keys_table_ddl.keys())} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        if key_source == '' and (aJob.get('key_dedup', '') == 'yes' or aJob.get('detail_cache_rows', '') not in ('', 0, '0') or aJob.get('detail_cache_kb', '') not in ('', 0, '0')):
+            logging.processError(p_message=f'key_dedup, detail_cache_rows and detail_cache_kb are for key_query/query (dual query) jobs (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+
+        splitMode = str(aJob.get('split_mode', '')).lower() or 'range'
+        if splitMode not in split_modes:
+            logging.processError(p_message=f'split_mode [{splitMode}] is not one of {split_modes} (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+        bSplit = aJob.get('split_column', '') != '' or splitMode == 'physical'
+        if not bSplit and (aJob.get('split_count', '') != '' or aJob.get('split_ranges', '') != '' or aJob.get('split_workers', '') != ''):
+            logging.processError(p_message=f'split_count, split_ranges and split_workers need a split_column, or split_mode physical (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+        if bSplit:
+            try:
+                iSplitCount = int(aJob.get('split_count', '') or 0)
+            except ValueError:
+                iSplitCount = -1
+            if iSplitCount < 0:
+                logging.processError(p_message=f'split_count [{aJob['split_count']}] is not a number of ranges (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            try:
+                iSplitWorkers = int(aJob.get('split_workers', '') or 0)
+            except ValueError:
+                iSplitWorkers = -1
+            if iSplitWorkers < 0:
+                logging.processError(p_message=f'split_workers [{aJob['split_workers']}] is not a number of readers (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if mode.upper() == 'E' or key_source != '' or sourceDriver == 'csv' or str(aJob.get('read_method', '')).lower() == 'copy':
+                logging.processError(p_message=f'split reads only work on single queries from database sources, with read_method fetch (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+            if splitMode == 'physical':
+                if sourceDriver not in ('oracledb', 'psycopg2'):
+                    logging.processError(p_message=f'split_mode physical only works on oracledb and psycopg2 sources (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                    return {}
+                if aJob.get('split_ranges', '') != '' or iSplitCount < 2:
+                    logging.processError(p_message=f'split_mode physical needs a split_count of 2 or more, and no split_ranges (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                    return {}
+            elif aJob.get('split_ranges', '') == '' and iSplitCount < 2:
+                logging.processError(p_message=f'split_column needs split_ranges, or a split_count of 2 or more (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+                return {}
+
+        try:
+            iCommitRows = int(aJob.get('commit_rows', '') or 0)
+            fCommitSecs = float(aJob.get('commit_secs', '') or 0)
+        except ValueError:
+            logging.processError(p_message=f'commit_rows [{aJob.get('commit_rows', '')}] or commit_secs [{aJob.get('commit_secs', '')}] is not a number (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+        if (iCommitRows != 0 or fCommitSecs != 0) and str(aJob.get('write_method', '')).lower() == 'append':
+            logging.processError(p_message=f'write_method append needs a commit after each packet, it cannot be used with commit_rows or commit_secs (jobs line {key+1}). giving up.', p_stop=True, p_exitCode=4)
+            return {}
+
         if len(apDest) > 0:
             if apDest not in shared.connections:
                 logging.processError(p_message=f'append source [{apDest}] not declared on connections. giving up.', p_stop=True, p_exitCode=4)
@@ -123,11 +123,6 @@ def processError(p_e:Optional[Exception]=None, p_stack:Optional[str]=None, p_mes
         shared.ErrorOccurred.value = True
 
     if p_stop is not None and p_stop:
-        with shared.stopWhenKeysEmpty.get_lock():
-            shared.stopWhenKeysEmpty.value = True
-        with shared.stopWhenEmpty.get_lock():
-            shared.stopWhenEmpty.value = True
-
         with shared.Working.get_lock():
             shared.Working.value = False
 
@@ -230,6 +225,7 @@ def whoAmI(stackLevel:int=2) -> str:
 def monitor_memory():
     '''
         called by writeToLog, runs on the context of its thread, not on the main PID!
+        also publishes the total on shared.rssTotalMB, for the memory governor
     '''
 
     global memoryStatsFile
@@ -245,7 +241,8 @@ def monitor_memory():
 
         memStr = shared.memoryStatsFormat.format(timestamp, shared.executionID, mem, shared.collectMemoryMainProcessID.pid, shared.collectMemoryMainProcessID.status(), ' '.join(shared.collectMemoryMainProcessID.cmdline()))
 
-        print(memStr, file=memoryStatsFile, flush=True)
+        if memoryStatsFile:
+            print(memStr, file=memoryStatsFile, flush=True)
     except Exception as e:
         logPrint(f'error on main process: [{e}]', logLevel.DEBUG)
         pass #do not remove as on production mode we comment the previous line
@@ -257,17 +254,20 @@ def monitor_memory():
             totalMem += mem
             processName = ' '.join(child.cmdline())
             memStr = shared.memoryStatsFormat.format(timestamp, shared.executionID, mem, child.pid, child.status(), processName)
-            print(memStr, file=memoryStatsFile, flush=True)
+            if memoryStatsFile:
+                print(memStr, file=memoryStatsFile, flush=True)
         except Exception as e:
             logPrint(f'error on [{processName}]: [{e}]', logLevel.DEBUG)
             pass #do not remove as on production mode we comment the previous line
     try:
         memStr = shared.memoryStatsFormat.format(timestamp, shared.executionID, totalMem, -1, '-', 'totalMemory')
-        print(memStr, file=memoryStatsFile, flush=True)
+        if memoryStatsFile:
+            print(memStr, file=memoryStatsFile, flush=True)
     except Exception as e:
         logPrint(f'error on total mem: [{e}]', logLevel.DEBUG)
         pass #do not remove as on production mode we comment the previous line
 
+    shared.rssTotalMB.value = totalMem
     logPrint(f'memory stats: [{totalMem}]', logLevel.DEBUG)
 
 def printSharedVariables(fromWhere:str):
@@ -503,7 +503,7 @@ def writeToLog_files():
         except queue.Empty:
             idleCount += 1
             if idleCount > 30:
-                setproctitle(f'datacopy: log file writer, idleCount=[{idleCount}], Working=[{shared.Working.value}], eventQueueSize=[{shared.eventQueue.qsize()}], dataQueueSize=[{shared.dataQueue.qsize()}]')
+                setproctitle(f'datacopy: log file writer, idleCount=[{idleCount}], Working=[{shared.Working.value}], eventQueueSize=[{shared.eventQueue.qsize()}]')
         except OSError:
             if shared.DEBUG:
                 print('writeToLog_files: EOError exception. giving up.', file=sys.stderr, flush=True)
@@ -512,7 +512,7 @@ def writeToLog_files():
             if shared.DEBUG:
                 print(f'writeToLog_files: Exception at line ({sys.exc_info()[2].tb_lineno}): [{e}]', file=sys.stderr, flush=True)
 
-        if shared.COLLECT_MEMORY_STATS and memoryStatsFile:
+        if (shared.COLLECT_MEMORY_STATS and memoryStatsFile) or shared.memoryLimitMB > 0:
             if timer() > collectMemoryStatsNextTime:
                 monitor_memory()
                 collectMemoryStatsNextTime = timer()+shared.collectMemoryStatsIntervalSecs
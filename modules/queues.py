@@ -0,0 +1,627 @@
+'''data queue transports'''
+
+import os
+import atexit
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from collections import deque
+from timeit import default_timer as timer
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.queues import Queue as mpQueue
+
+from queue import Empty as queueEmpty
+from queue import Full as queueFull
+
+from typing import Any, Callable, Optional
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+# slot header: payload length (-1 means the packet went to the overflow queue), number of out-of-band buffers
+_slotHeader = struct.Struct('<qI')
+
+# how often a reader checks for room again, when SPILL_MAX_MB is reached
+_spillFullWaitSecs = 0.05
+
+# smallest shm slot, whatever the ring size; smaller packets than this are rare
+_minShmSlotBytes = 64 * 1024
+
+# spill record header: payload length, compressed or not
+_spillHeader = struct.Struct('<q?')
+
+def lz4Available() -> bool:
+    return lz4frame is not None
+
+def _packInto(p_buf, p_offset:int, p_main:bytes, p_rawBuffers:list) -> None:
+    '''writes a pickled packet: header, out-of-band buffer lengths, pickle stream, out-of-band buffers'''
+    _slotHeader.pack_into(p_buf, p_offset, len(p_main), len(p_rawBuffers))
+    offset = p_offset + _slotHeader.size
+    lengths = struct.pack(f'<{len(p_rawBuffers)}q', *[r.nbytes for r in p_rawBuffers])
+    p_buf[offset:offset+len(lengths)] = lengths
+    offset += len(lengths)
+    p_buf[offset:offset+len(p_main)] = p_main
+    offset += len(p_main)
+    for r in p_rawBuffers:
+        p_buf[offset:offset+r.nbytes] = r
+        offset += r.nbytes
+
+def _copyFrom(p_buf, p_offset:int) -> tuple[int, tuple, bytes]:
+    '''copies out what _packInto wrote: pickle stream length, out-of-band buffer lengths, and stream plus buffers'''
+    mainLen, nBuffers = _slotHeader.unpack_from(p_buf, p_offset)
+    offset = p_offset + _slotHeader.size
+    bufferLens = struct.unpack_from(f'<{nBuffers}q', p_buf, offset)
+    offset += 8 * nBuffers
+    return mainLen, bufferLens, bytes(p_buf[offset:offset + mainLen + sum(bufferLens)])
+
+class ShmQueue:
+    '''
+    bounded ring of packet slots on a shared memory block, with the same put/get/qsize interface as mp.Queue.
+    packets are pickled with protocol 5 straight into the slot. only PickleBuffer objects (arrow packets) go
+    out of band, copied into the slot without going through the pickle stream first; str and bytes columns are
+    pickled in band, like on mp.Queue.
+    this is not zero copy: get copies the packet out of its slot in one piece, under the tail lock, so slots are
+    freed in ring order and unpickling happens outside the lock. so a packet is copied once in and once out,
+    like on mp.Queue, just without the pipe.
+    packets that do not fit a slot get a shared memory block of their own, and their slot holds its name,
+    so they keep their place in the ring; the reader removes the block.
+    '''
+
+    def __init__(self, p_maxsize:int, p_slotBytes:int):
+        self.maxsize:int = p_maxsize
+        self.slotBytes:int = p_slotBytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=p_maxsize * p_slotBytes)
+        self._ownerPID:int = os.getpid()
+
+        # free slots semaphore gives us the same backpressure as mp.Queue(maxsize)
+        self._freeSlots = mp.Semaphore(p_maxsize)
+        self._usedSlots = mp.Semaphore(0)
+
+        # copies in and out of the ring are done while holding these, pickling is not.
+        self._headLock = mp.Lock()
+        self._tailLock = mp.Lock()
+        self._head = mp.Value('i', 0, lock=False)
+        self._tail = mp.Value('i', 0, lock=False)
+
+        self._count = mp.Value('i', 0)
+
+        atexit.register(self.close)
+
+    def put(self, p_obj:Any, block:bool = True, timeout:Optional[float] = None):
+        '''pickles a packet and copies it to the next free slot'''
+
+        oobBuffers:list[pickle.PickleBuffer] = []
+        main = pickle.dumps(p_obj, protocol=5, buffer_callback=oobBuffers.append)
+        rawBuffers = [b.raw() for b in oobBuffers]
+
+        totalBytes = _slotHeader.size + 8 * len(rawBuffers) + len(main) + sum(r.nbytes for r in rawBuffers)
+
+        sOverflow:bytes = b''
+        if totalBytes > self.slotBytes:
+            # filled before taking a slot, only its name goes through the ring. not tracked: the reader unlinks it
+            overflow = shared_memory.SharedMemory(create=True, size=totalBytes, track=False)
+            _packInto(overflow.buf, 0, main, rawBuffers)
+            sOverflow = overflow.name.encode()
+            overflow.close()
+
+        if not self._freeSlots.acquire(block, timeout):
+            if len(sOverflow) > 0:
+                _unlinkOverflow(sOverflow)
+            raise queueFull
+
+        with self._headLock:
+            slot = self._head.value
+            self._head.value = (slot + 1) % self.maxsize
+            offset = slot * self.slotBytes
+            buf = self._shm.buf
+
+            if len(sOverflow) == 0:
+                _packInto(buf, offset, main, rawBuffers)
+            else:
+                _slotHeader.pack_into(buf, offset, -1, len(sOverflow))
+                buf[offset+_slotHeader.size:offset+_slotHeader.size+len(sOverflow)] = sOverflow
+
+        with self._count.get_lock():
+            self._count.value += 1
+        self._usedSlots.release()
+
+    def get(self, block:bool = True, timeout:Optional[float] = None) -> Any:
+        '''copies the oldest packet out of its slot and unpickles it; the out-of-band buffers are views over that copy'''
+
+        if not self._usedSlots.acquire(block, timeout):
+            raise queueEmpty
+
+        sOverflow:bytes = b''
+        with self._tailLock:
+            slot = self._tail.value
+            self._tail.value = (slot + 1) % self.maxsize
+            offset = slot * self.slotBytes
+            buf = self._shm.buf
+
+            mainLen, nameLen = _slotHeader.unpack_from(buf, offset)
+            if mainLen >= 0:
+                mainLen, bufferLens, data = _copyFrom(buf, offset)
+            else:
+                sOverflow = bytes(buf[offset+_slotHeader.size:offset+_slotHeader.size+nameLen])
+
+        self._freeSlots.release()
+        with self._count.get_lock():
+            self._count.value -= 1
+
+        if len(sOverflow) > 0:
+            overflow = shared_memory.SharedMemory(name=sOverflow.decode(), track=False)
+            try:
+                mainLen, bufferLens, data = _copyFrom(overflow.buf, 0)
+            finally:
+                overflow.close()
+                overflow.unlink()
+
+        view = memoryview(data)
+        buffers = []
+        start = mainLen
+        for bl in bufferLens:
+            buffers.append(view[start:start+bl])
+            start += bl
+        return pickle.loads(view[:mainLen], buffers=buffers)
+
+    def qsize(self) -> int:
+        return self._count.value
+
+    def close(self):
+        '''releases the shared memory block; only the process that created it unlinks it, with the overflow blocks nobody read'''
+        try:
+            if os.getpid() == self._ownerPID:
+                buf = self._shm.buf
+                for i in range(self._count.value):
+                    offset = ((self._tail.value + i) % self.maxsize) * self.slotBytes
+                    mainLen, nameLen = _slotHeader.unpack_from(buf, offset)
+                    if mainLen < 0:
+                        _unlinkOverflow(bytes(buf[offset+_slotHeader.size:offset+_slotHeader.size+nameLen]))
+            self._shm.close()
+            if os.getpid() == self._ownerPID:
+                self._shm.unlink()
+        except Exception:
+            pass
+
+def _unlinkOverflow(p_name:bytes):
+    try:
+        overflow = shared_memory.SharedMemory(name=p_name.decode(), track=False)
+        overflow.close()
+        overflow.unlink()
+    except FileNotFoundError:
+        pass
+
+class PrefetchBuffer:
+    '''
+    keeps up to p_maxPackets packets (and roughly p_maxBytes) fetched ahead by a thread of the reader process,
+    so the next fetchmany() is already waiting on the network while the reader pickles and queues the last one.
+    p_fetch and fetch() return (packet, rows), 0 rows is the end of the data. the thread starts on the first fetch().
+    '''
+
+    def __init__(self, p_fetch:Callable, p_maxPackets:int, p_maxBytes:int, p_sizeOf:Callable[[Any], int]):
+        self.maxPackets:int = max(1, p_maxPackets)
+        self.maxBytes:int = p_maxBytes
+        # times (and seconds) the reader found nothing fetched yet
+        self.stalls:int = 0
+        self.stallSecs:float = 0
+
+        self._fetch = p_fetch
+        self._sizeOf = p_sizeOf
+        self._packets:deque = deque()
+        self._bytes:int = 0
+        self._ended:bool = False
+        self._stop:bool = False
+        self._error:Optional[Exception] = None
+        self._cond = threading.Condition()
+        self._thread:Optional[threading.Thread] = None
+
+    def _run(self, p_size:int):
+        try:
+            while True:
+                with self._cond:
+                    while not self._stop and (len(self._packets) >= self.maxPackets or (len(self._packets) > 0 and self._bytes >= self.maxBytes)):
+                        self._cond.wait()
+                    if self._stop:
+                        return
+                bData, iRows = self._fetch(p_size)
+                iBytes = self._sizeOf(bData) if iRows > 0 else 0
+                with self._cond:
+                    self._packets.append( (bData, iRows, iBytes) )
+                    self._bytes += iBytes
+                    if iRows == 0:
+                        self._ended = True
+                    self._cond.notify_all()
+                if iRows == 0:
+                    return
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def fetch(self, p_size:int):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(p_size,), daemon=True)
+            self._thread.start()
+
+        with self._cond:
+            if len(self._packets) == 0 and self._error is None and not self._ended:
+                self.stalls += 1
+                wStart = timer()
+                while len(self._packets) == 0 and self._error is None and not self._ended:
+                    self._cond.wait()
+                self.stallSecs += timer() - wStart
+            if len(self._packets) > 0:
+                bData, iRows, iBytes = self._packets.popleft()
+                self._bytes -= iBytes
+                self._cond.notify_all()
+                return bData, iRows
+            if self._error is not None:
+                raise self._error
+            return [], 0
+
+    def close(self, p_timeout:Optional[float] = None):
+        '''stops fetching ahead, waiting up to p_timeout for a fetch in flight, so the cursor can be closed'''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(p_timeout)
+
+class PacketPipeline:
+    '''
+    gets the next packets (p_get, that raises queueEmpty like the queues) on a thread of the writer process,
+    up to p_maxPackets and roughly p_maxBytes, so unpickling them overlaps with the writer waiting on the database.
+    get() raises queueEmpty too; ended() is true once p_get found nothing with p_stopWhenEmpty set, and all was taken.
+    '''
+
+    def __init__(self, p_get:Callable[[], Any], p_stopWhenEmpty, p_maxPackets:int, p_maxBytes:int, p_sizeOf:Callable[[Any], int]):
+        self.maxPackets:int = max(1, p_maxPackets)
+        self.maxBytes:int = p_maxBytes
+
+        self._get = p_get
+        self._stopWhenEmpty = p_stopWhenEmpty
+        self._sizeOf = p_sizeOf
+        self._packets:deque = deque()
+        self._bytes:int = 0
+        self._ended:bool = False
+        self._stop:bool = False
+        self._error:Optional[Exception] = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._stop and (len(self._packets) >= self.maxPackets or (len(self._packets) > 0 and self._bytes >= self.maxBytes)):
+                        self._cond.wait()
+                    if self._stop:
+                        return
+                try:
+                    bData = self._get()
+                except queueEmpty:
+                    if self._stopWhenEmpty.value:
+                        with self._cond:
+                            self._ended = True
+                            self._cond.notify_all()
+                        return
+                    continue
+                iBytes = self._sizeOf(bData)
+                # a packet already taken from the queue is kept even if stopping, close() hands it back
+                with self._cond:
+                    self._packets.append( (bData, iBytes) )
+                    self._bytes += iBytes
+                    self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def get(self, timeout:Optional[float] = None) -> Any:
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._packets) > 0 or self._error is not None or self._ended, timeout)
+            if len(self._packets) > 0:
+                bData, iBytes = self._packets.popleft()
+                self._bytes -= iBytes
+                self._cond.notify_all()
+                return bData
+            if self._error is not None:
+                raise self._error
+            raise queueEmpty
+
+    def ended(self) -> bool:
+        with self._cond:
+            return self._ended and len(self._packets) == 0
+
+    def close(self, p_timeout:Optional[float] = None) -> list:
+        '''stops getting packets, and returns the ones got and not taken yet'''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(p_timeout)
+        with self._cond:
+            packets = [bData for bData, _ in self._packets]
+            self._packets.clear()
+            self._bytes = 0
+        return packets
+
+class ByteBoundedQueue:
+    '''
+    a data queue (p_queue) that also holds at most about p_maxBytes, by the size p_sizeOf estimates on the reader.
+    a packet bigger than that still goes in when the queue is empty. same put/get/qsize interface.
+    '''
+
+    def __init__(self, p_queue:mpQueue | ShmQueue, p_maxBytes:int, p_sizeOf:Callable[[Any], int]):
+        self.queue = p_queue
+        self.maxBytes:int = p_maxBytes
+
+        self._sizeOf = p_sizeOf
+        self._bytes = mp.Value('q', 0, lock=False)
+        self._cond = mp.Condition()
+
+    def put(self, p_obj:Any, block:bool = True, timeout:Optional[float] = None):
+        iBytes = self._sizeOf(p_obj)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._bytes.value == 0 or self._bytes.value + iBytes <= self.maxBytes, timeout if block else 0):
+                raise queueFull
+            self._bytes.value += iBytes
+        try:
+            self.queue.put( (iBytes, p_obj), block, timeout)
+        except Exception:
+            with self._cond:
+                self._bytes.value -= iBytes
+                self._cond.notify_all()
+            raise
+
+    def get(self, block:bool = True, timeout:Optional[float] = None) -> Any:
+        iBytes, bData = self.queue.get(block, timeout)
+        with self._cond:
+            self._bytes.value -= iBytes
+            self._cond.notify_all()
+        return bData
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def bytes(self) -> int:
+        return self._bytes.value
+
+    def close(self):
+        self.queue.close()
+
+class SpillQueue:
+    '''
+    a data queue (p_queue) with a local disk tier: once it is full, packets are appended to segment files
+    of about p_segmentBytes under p_spillDir, instead of blocking the reader, and gets take them back in order
+    after the ones in memory. while anything is spilled, new packets go to the disk too, to keep the order.
+    spills up to p_maxBytes (0 is no limit), then put waits for the spilled packets to be taken back, so the order
+    is kept there too. same put/get/qsize interface.
+    '''
+
+    def __init__(self, p_queue:mpQueue | ShmQueue | ByteBoundedQueue, p_spillDir:str, p_streamID:int, p_segmentBytes:int, p_maxBytes:int = 0, p_compress:bool = False):
+        self.queue = p_queue
+        self.segmentBytes:int = p_segmentBytes
+        self.maxBytes:int = p_maxBytes
+        self.compress:bool = p_compress and lz4frame is not None
+
+        self._dir:str = tempfile.mkdtemp(prefix=f'datacopy-spill-{p_streamID}-', dir=p_spillDir)
+        self._ownerPID:int = os.getpid()
+
+        # all spill positions and counters change while holding this
+        self._lock = mp.Lock()
+        self._writeSeg = mp.Value('q', 0, lock=False)
+        self._writeOff = mp.Value('q', 0, lock=False)
+        self._readSeg = mp.Value('q', 0, lock=False)
+        self._readOff = mp.Value('q', 0, lock=False)
+        self._pending = mp.Value('i', 0, lock=False)
+        self._pendingBytes = mp.Value('q', 0, lock=False)
+
+        # stats: packets and bytes that went to disk, seconds spent writing and reading them
+        self.spilledPackets = mp.Value('q', 0, lock=False)
+        self.spilledBytes = mp.Value('q', 0, lock=False)
+        self.spillSecs = mp.Value('d', 0, lock=False)
+
+        atexit.register(self.close)
+
+    def _segment(self, p_seg:int) -> str:
+        return os.path.join(self._dir, f'{p_seg:08d}.spill')
+
+    def _encode(self, p_obj:Any) -> bytes:
+        data = pickle.dumps(p_obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.compress:
+            data = lz4frame.compress(data) # type: ignore
+        return data
+
+    def _spill(self, p_data:bytes, p_secs:float) -> bool:
+        '''appends an encoded packet to the current segment; False if that would go over maxBytes'''
+        tStart = timer()
+        with self._lock:
+            if self.maxBytes > 0 and self._pending.value > 0 and self._pendingBytes.value + len(p_data) > self.maxBytes:
+                return False
+            with open(self._segment(self._writeSeg.value), 'ab') as f:
+                f.write(_spillHeader.pack(len(p_data), self.compress))
+                f.write(p_data)
+            self._writeOff.value += _spillHeader.size + len(p_data)
+            if self._writeOff.value >= self.segmentBytes:
+                self._writeSeg.value += 1
+                self._writeOff.value = 0
+            self._pending.value += 1
+            self._pendingBytes.value += len(p_data)
+            self.spilledPackets.value += 1
+            self.spilledBytes.value += len(p_data)
+            self.spillSecs.value += p_secs + timer() - tStart
+        return True
+
+    def _unspill(self) -> tuple[bool, Any]:
+        '''takes the oldest spilled packet, if any'''
+        tStart = timer()
+        with self._lock:
+            if self._pending.value == 0:
+                return False, None
+            sSegment = self._segment(self._readSeg.value)
+            with open(sSegment, 'rb') as f:
+                f.seek(self._readOff.value)
+                iLen, bCompressed = _spillHeader.unpack(f.read(_spillHeader.size))
+                data = f.read(iLen)
+            self._readOff.value += _spillHeader.size + iLen
+            self._pending.value -= 1
+            self._pendingBytes.value -= iLen
+            if self._readSeg.value < self._writeSeg.value and self._readOff.value >= os.path.getsize(sSegment):
+                os.remove(sSegment)
+                self._readSeg.value += 1
+                self._readOff.value = 0
+
+        if bCompressed:
+            data = lz4frame.decompress(data) # type: ignore
+        bData = pickle.loads(data)
+        with self._lock:
+            self.spillSecs.value += timer() - tStart
+        return True, bData
+
+    def _putInMemory(self, p_obj:Any) -> bool:
+        '''puts a packet on the queue, if nothing is spilled and there is room for it'''
+        with self._lock:
+            if self._pending.value > 0:
+                return False
+            try:
+                self.queue.put(p_obj, block=False)
+            except queueFull:
+                return False
+        return True
+
+    def put(self, p_obj:Any, block:bool = True, timeout:Optional[float] = None):
+        tEnd = None if timeout is None else timer() + timeout
+        data:Optional[bytes] = None
+        fEncodeSecs:float = 0
+        while True:
+            if self._putInMemory(p_obj):
+                return
+            if data is None:
+                tStart = timer()
+                data = self._encode(p_obj)
+                fEncodeSecs = timer() - tStart
+            if self._spill(data, fEncodeSecs):
+                return
+            # the disk tier is full: wait for the writers to take spilled packets back, instead of going ahead of them
+            if not block or (tEnd is not None and timer() >= tEnd):
+                raise queueFull
+            time.sleep(_spillFullWaitSecs)
+
+    def get(self, block:bool = True, timeout:Optional[float] = None) -> Any:
+        try:
+            # a short wait: mp.Queue get(block=False) can miss packets its feeder thread has not flushed yet
+            return self.queue.get(block=self.queue.qsize() > 0, timeout=0.1)
+        except queueEmpty:
+            pass
+        bFound, bData = self._unspill()
+        if bFound:
+            return bData
+        return self.queue.get(block, timeout)
+
+    def qsize(self) -> int:
+        '''packets in memory plus packets on disk'''
+        return self.queue.qsize() + self._pending.value
+
+    def close(self):
+        '''closes the queue; only the process that created it removes the spill files'''
+        try:
+            self.queue.close()
+        except Exception:
+            pass
+        if os.getpid() == self._ownerPID:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+def shmFreeBytes() -> Optional[int]:
+    '''free space on /dev/shm, None where it can't be checked'''
+    try:
+        st = os.statvfs('/dev/shm')
+    except (OSError, AttributeError):
+        return None
+    return st.f_bavail * st.f_frsize
+
+def newDataQueue(p_transport:str, p_maxsize:int, p_ringBytes:int) -> mpQueue | ShmQueue:
+    '''
+    creates the queue that carries data packets from readers to writers.
+    with shm, the ring is p_ringBytes split in p_maxsize slots; if /dev/shm does not have that much free, it's a regular queue.
+    '''
+
+    match p_transport:
+        case 'shm':
+            iSlotBytes = max(_minShmSlotBytes, p_ringBytes // p_maxsize)
+            iFree = shmFreeBytes()
+            if iFree is None or iFree >= p_maxsize * iSlotBytes:
+                return ShmQueue(p_maxsize, iSlotBytes)
+            return mp.Queue(p_maxsize)
+        case _:
+            return mp.Queue(p_maxsize)
+
+class StreamQueues:
+    '''
+    queues and flags of one stream (the jobs writing to the same destination table).
+    jobManager creates it when the stream starts, its readers and writers get it when they are forked,
+    and jobManager releases it when the stream ends.
+    '''
+
+    def __init__(self, p_streamID:int, p_transport:str, p_maxsize:int, p_ringBytes:int, p_spillDir:str = '', p_spillSegmentBytes:int = 0, p_spillMaxBytes:int = 0, p_spillCompress:bool = False,
+                 p_maxBytes:int = 0, p_sizeOf:Optional[Callable[[Any], int]] = None):
+        self.streamID:int = p_streamID
+        self.maxsize:int = p_maxsize
+
+        self.dataQueue:mpQueue | ShmQueue | ByteBoundedQueue | SpillQueue = newDataQueue(p_transport, p_maxsize, p_ringBytes)
+        # the transport actually used, shm falls back to queue when /dev/shm is short
+        self.transport:str = 'shm' if isinstance(self.dataQueue, ShmQueue) else 'queue'
+        ''' message format: just a bData object returned by cursor.fetchmany()'''
+        self.byteBoundedQueue:Optional[ByteBoundedQueue] = None
+        if p_maxBytes > 0 and p_sizeOf is not None:
+            self.byteBoundedQueue = ByteBoundedQueue(self.dataQueue, p_maxBytes, p_sizeOf)
+            self.dataQueue = self.byteBoundedQueue
+        if p_spillDir != '':
+            self.dataQueue = SpillQueue(self.dataQueue, p_spillDir, p_streamID, p_spillSegmentBytes, p_spillMaxBytes, p_spillCompress)
+
+        self.dataKeysQueue:mpQueue = mp.Queue(p_maxsize)
+        ''' message format: just a bData object returned by cursor.fetchmany()'''
+
+        self.stopWhenEmpty = mp.Value('b', False)
+        self.stopWhenKeysEmpty = mp.Value('b', False)
+
+        #writers that should exit after their current packet (elastic writers scaling down)
+        self.retireWriters = mp.Value('i', 0)
+
+        # queue stats, only updated on jobManager
+        self.maxQueueLenObserved:int = 0
+        self.maxQueueLenObservedEvents:int = 0
+        self.maxQueueBytesObserved:int = 0
+
+    def observe(self) -> int:
+        '''current data queue length, updating the queue stats'''
+        iCurrentQueueSize = self.dataQueue.qsize()
+        if iCurrentQueueSize > self.maxQueueLenObserved:
+            self.maxQueueLenObserved = iCurrentQueueSize
+        if iCurrentQueueSize >= self.maxsize:
+            self.maxQueueLenObservedEvents += 1
+        if self.byteBoundedQueue is not None:
+            self.maxQueueBytesObserved = max(self.maxQueueBytesObserved, self.byteBoundedQueue.bytes())
+        return iCurrentQueueSize
+
+    def spillStats(self) -> Optional[tuple[int, int, float]]:
+        '''packets, bytes and seconds spilled to disk, None if the data queue does not spill'''
+        if not isinstance(self.dataQueue, SpillQueue):
+            return None
+        return self.dataQueue.spilledPackets.value, self.dataQueue.spilledBytes.value, self.dataQueue.spillSecs.value
+
+    def close(self):
+        for q in (self.dataQueue, self.dataKeysQueue):
+            try:
+                q.close()
+            except Exception:
+                pass
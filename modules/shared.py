@@ -114,8 +114,42 @@ def getJobName(p_jobID:int) -> str:
 applicationName = 'datacopy'
 
 queueSize:int = int(os.getenv('QUEUE_SIZE','256'))
+#also limits the data queue by (estimated) size, 0 is packets only
+queueMaxMB:int = int(os.getenv('QUEUE_MAX_MB','0'))
 usedQueueBeforeNew:int = int(queueSize/int(os.getenv('QUEUE_FB4NEWR','3')))
 
+QUEUE_TRANSPORT:str = os.getenv('QUEUE_TRANSPORT','queue')
+#shm ring size of each stream, QUEUE_MAX_MB when that is set
+queueShmMB:int = int(os.getenv('QUEUE_SHM_MB','64'))
+
+#local disk tier for the data queue, off when SPILL_DIR is empty
+spillDir:str = os.getenv('SPILL_DIR','')
+spillSegmentMB:int = int(os.getenv('SPILL_SEGMENT_MB','64'))
+spillMaxMB:int = int(os.getenv('SPILL_MAX_MB','0'))
+SPILL_COMPRESS:str = os.getenv('SPILL_COMPRESS','none')
+
+adaptiveFetchTargetKB:int = int(os.getenv('ADAPTIVE_FETCH_TARGET_KB','1024'))
+adaptiveFetchTargetSecs:float = float(os.getenv('ADAPTIVE_FETCH_TARGET_SECS','0.5'))
+adaptiveFetchMin:int = int(os.getenv('ADAPTIVE_FETCH_MIN','64'))
+adaptiveFetchMax:int = int(os.getenv('ADAPTIVE_FETCH_MAX','100000'))
+adaptiveFetchMaxQueueMB:int = int(os.getenv('ADAPTIVE_FETCH_MAX_QUEUE_MB','1024'))
+
+writersHighWater:float = float(os.getenv('WRITERS_HIGH_WATER','0.8'))
+writersLowWater:float = float(os.getenv('WRITERS_LOW_WATER','0.2'))
+writersScaleSecs:float = float(os.getenv('WRITERS_SCALE_SECS','5'))
+
+bulkBatchMB:int = int(os.getenv('BULK_BATCH_MB','16'))
+valuesMaxKB:int = int(os.getenv('VALUES_MAX_KB','1024'))
+
+#key_dedup: memory for the hashes of the keys already seen, on each keys reader
+keysDedupMaxMB:int = int(os.getenv('KEYS_DEDUP_MAX_MB','256'))
+
+#read_prefetch: max memory of the packets each reader keeps fetched ahead
+prefetchMaxMB:int = int(os.getenv('PREFETCH_MAX_MB','64'))
+
+#write_pipeline: max memory of the packets each writer keeps unpickled ahead
+writePipelineMaxMB:int = int(os.getenv('WRITE_PIPELINE_MAX_MB','64'))
+
 REUSE_WRITERS:bool = bool(os.getenv('REUSE_WRITERS','yes') == 'yes')
 
 TEST_QUERIES:bool = bool(os.getenv('TEST_QUERIES','no') == 'yes')
@@ -173,8 +207,12 @@ parallelReaders:int = int(os.getenv('PARALLEL_READERS','1'))
 parallelReadersLaunchInterval:float = float(os.getenv('PARALLEL_READERS_LAUNCH_INTERVAL','0.2'))
 parallelProcessesNiceness:int = int(os.getenv('PARALLEL_PROCESSES_NICENESS', 16))
 
+maxParallelStreams:int = int(os.getenv('MAX_PARALLEL_STREAMS','1'))
+
 idleTimeoutSecs:int = int(os.getenv('IDLE_TIMEOUT_SECS','0'))
 connectionTimeoutSecs:int = int(os.getenv('CONNECTION_TIMEOUT_SECS','22'))
+#how many connections initConnections opens at the same time
+connectFanout:int = int(os.getenv('CONNECT_FANOUT','8'))
 
 COLLECT_MEMORY_STATS:bool = bool(os.getenv('COLLECT_MEMORY_STATS','no') == 'yes')
 collectMemoryStatsIntervalSecs:float = float(os.getenv('COLLECT_MEMORY_STATS_INTERVAL_SECS','1'))
@@ -190,6 +228,22 @@ else:
 
 collectMemoryMainProcessID:psutil.Process = psutil.Process(os.getpid())
 
+def _containerMemoryLimitMB() -> int:
+    '''memory limit of the cgroup (v2 or v1) we run in, 0 if there is none'''
+    for sFile in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(sFile, 'r', encoding='utf-8') as f:
+                sLimit = f.read().strip()
+            if sLimit != 'max' and int(sLimit) < 2**60:
+                return int(sLimit) // (1024 ** 2)
+        except Exception:
+            pass
+    return 0
+
+#memory governor: above MEMORY_HIGH_WATER of MEMORY_LIMIT_MB (total RSS), no new readers start and adaptive fetch sizes shrink
+memoryLimitMB:int = _containerMemoryLimitMB() if os.getenv('MEMORY_LIMIT_MB','0') == 'auto' else int(os.getenv('MEMORY_LIMIT_MB','0'))
+memoryHighWater:float = float(os.getenv('MEMORY_HIGH_WATER','0.8'))
+
 defaultFetchSize:int = 1024
 
 #### AI stuff ######################################
@@ -203,6 +257,8 @@ ai_api_key:Optional[str] = os.getenv(key='AI_API_KEY', default=None)
 #### Shared Variables, but changed in single thread contexts ######################################
 
 connections:dict[str, dict[str, Any]] = {}
+connSlots:dict[str, Any] = {}
+'''sessions, readers and writers in use on each connection with max_sessions, max_readers or max_writers. mp.Array('i', 3), shared by all streams'''
 jobs:dict[int, dict[str, Any]] = {}
 
 PutConn:dict[int, Any] = {}
@@ -217,18 +273,9 @@ writeP:dict[int, Any] = {}
 
 logName:str = ''
 
-maxQueueLenObserved:int = 0
-maxQueueLenObservedEvents:int = 0
-
 
 #### OBJECTS shared / edited in multithreads  #####################################################
 
-dataQueue:mp.Queue = mp.Queue(queueSize)
-''' message format: just a bData object returned by cursor.fetchmany()'''
-
-dataKeysQueue:mp.Queue = mp.Queue(queueSize)
-''' message format: just a bData object returned by cursor.fetchmany()'''
-
 eventQueue:mp.Queue = mp.Queue()
 '''message format: tuple(Type:int, jobID:int, recs:int, secs:float)'''
 
@@ -238,10 +285,9 @@ logQueue:mp.Queue = mp.Queue()
 Working:Synchronized = mp.Value('b', True)
 
 ErrorOccurred:Synchronized =  mp.Value('b',False)
-stopWhenEmpty:Synchronized = mp.Value('b', False)
-stopWhenKeysEmpty:Synchronized = mp.Value('b', False)
 logIsAlreadyClosed:Synchronized = mp.Value('b', False)
 
-idleSecsObserved:Synchronized = mp.Value('i', 0)
-
 exitCode:Synchronized = mp.Value('i', 0)
+
+rssTotalMB:Synchronized = mp.Value('d', 0)
+'''total RSS of datacopy processes, as of the last monitor_memory() run'''
@@ -25,6 +25,20 @@ def encodeSpecialChars(p_in):
         buff.append(tuple(newLine))
     return tuple(buff)
 
+def estimate_packet_bytes(p_rows, p_sampleRows:int = 16) -> int:
+    '''rough size of a list of rows, extrapolated from the first few'''
+    if len(p_rows) == 0:
+        return 0
+    iBytes = 0
+    iSample = min(len(p_rows), p_sampleRows)
+    for row in p_rows[:iSample]:
+        for col in row:
+            if isinstance(col, (str, bytes, bytearray)):
+                iBytes += len(col) + 4
+            else:
+                iBytes += 12
+    return iBytes * len(p_rows) // iSample
+
 def identify_type(obj):
     '''Identifies the type of an object as integer, float, date, or string.
 
@@ -46,6 +60,29 @@ def identify_type(obj):
     else:
         return 'unknown'
 
+#drivers that put plain int codes on cursor.description
+type_code_names:dict[str, dict[int, str]] = {
+    'psycopg2':     {16:'bool', 17:'bytea', 20:'int8', 21:'int2', 23:'int4', 25:'text', 114:'json', 600:'point', 700:'float4', 701:'float8', 1042:'bpchar', 1043:'varchar',
+                     1082:'date', 1083:'time', 1114:'timestamp', 1184:'timestamptz', 1186:'interval', 1266:'timetz', 1700:'numeric', 2950:'uuid', 3802:'jsonb'},
+    'mysql':        {0:'decimal', 1:'tiny', 2:'short', 3:'long', 4:'float', 5:'double', 7:'timestamp', 8:'longlong', 9:'int24', 10:'date', 11:'time',
+                     12:'datetime', 15:'varchar', 16:'bit', 245:'json', 246:'newdecimal', 249:'tiny_blob', 250:'medium_blob', 251:'long_blob', 252:'blob',
+                     253:'var_string', 254:'string'}
+}
+type_code_names['mariadb'] = type_code_names['mysql']
+
+def type_name(p_typeCode, p_driver:str = '') -> str:
+    '''readable name of a cursor.description type code, whatever the driver puts there'''
+    if hasattr(p_typeCode, 'name'):
+        # oracle's DbType objects
+        return str(p_typeCode.name)
+    elif hasattr(p_typeCode, '__name__'):
+        # python types, like pyodbc and databricks
+        return p_typeCode.__name__
+    elif isinstance(p_typeCode, int) and p_typeCode in type_code_names.get(p_driver, {}):
+        return type_code_names[p_driver][p_typeCode]
+    else:
+        return str(p_typeCode)
+
 def delimiter_decoder(delimiter_name:str) -> str:
     delim_decoder = {
     'tab': '\t',
@@ -0,0 +1,492 @@
+'''driver specific ways of sending a packet to a destination. all of them return the number of rows written.'''
+
+import decimal
+import io
+import json
+import re
+import tempfile
+
+from collections import namedtuple
+from typing import Any, Callable, Optional
+
+import modules.shared as shared
+import modules.utils as utils
+import modules.logging as logging
+from modules.logging import logLevel as logLevel
+import modules.columnar as columnar
+
+#which write methods each destination driver supports; the first one is the default
+supported_write_methods:dict[str, tuple[str, ...]] = {
+    'psycopg2':     ('insert', 'copy', 'values'),
+    'mysql':        ('insert', 'load_data'),
+    'mariadb':      ('insert', 'load_data'),
+    'csv':          ('insert',),
+    'oracledb':     ('insert', 'array', 'append'),
+    'pyodbc':       ('insert', 'bulk', 'values'),
+    'databricks':   ('insert', 'values'),
+    '':             ('insert',)
+}
+
+#raw text packets from COPY TO STDOUT readers: already in the destination format, rows is just for stats
+CopyPacket = namedtuple('CopyPacket', ['rows', 'data'])
+
+def isRowPacket(p_data) -> bool:
+    '''plain lists of tuples, the only packets that can be merged'''
+    return not columnar.isArrowPacket(p_data) and not isinstance(p_data, CopyPacket)
+
+def packetRows(p_data) -> list:
+    '''packets as lists of tuples, whatever format they traveled in'''
+    if columnar.isArrowPacket(p_data):
+        return columnar.ipcToRows(p_data)
+    if isinstance(p_data, CopyPacket):
+        #good enough for dumps
+        return [(line,) for line in p_data.data.splitlines()]
+    return p_data
+
+def packetBytes(p_data) -> int:
+    '''rough size of a packet, whatever format it traveled in'''
+    if columnar.isArrowPacket(p_data):
+        return p_data.size
+    if isinstance(p_data, CopyPacket):
+        return len(p_data.data)
+    return utils.estimate_packet_bytes(p_data)
+
+#### insert: plain executemany ####################################################################
+
+def insertRows(p_cursor, p_query:str, p_data) -> int:
+    bData = packetRows(p_data)
+    p_cursor.executemany(p_query, bData)
+
+    #sometimes... things don't work as expected... like with pyodbc...
+    wr = p_cursor.rowcount
+    if wr == -1:
+        wr = len(bData) # let's hope that all rows were writen...
+    return wr
+
+#### copy: postgres COPY FROM STDIN ###############################################################
+
+_copyTextEscapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def _pgArrayLiteral(p_list:list) -> str:
+    '''postgres array literal, {...} with every element that is not a number double quoted'''
+    elements:list[str] = []
+    for col in p_list:
+        if col is None:
+            elements.append('NULL')
+        elif isinstance(col, list):
+            elements.append(_pgArrayLiteral(col))
+        elif isinstance(col, bool):
+            elements.append('t' if col else 'f')
+        elif isinstance(col, (int, float, decimal.Decimal)):
+            elements.append(str(col))
+        else:
+            if isinstance(col, (bytes, bytearray, memoryview)):
+                sValue = f'\\x{bytes(col).hex()}'
+            elif isinstance(col, dict):
+                sValue = json.dumps(col)
+            else:
+                sValue = str(col)
+            elements.append('"' + sValue.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(elements) + '}'
+
+def copyTextEncode(p_rows) -> str:
+    '''
+    encodes rows in postgres COPY text format: tab delimited, \\N for NULL, backslash escapes,
+    bytea in hex format (with the backslash escaped, as it goes through the text format too),
+    lists as array literals
+    '''
+    lines:list[str] = []
+    for row in p_rows:
+        fields:list[str] = []
+        for col in row:
+            if isinstance(col, str):
+                fields.append(col.translate(_copyTextEscapes))
+            elif col is None:
+                fields.append('\\N')
+            elif isinstance(col, bool):
+                fields.append('t' if col else 'f')
+            elif isinstance(col, (bytes, bytearray, memoryview)):
+                fields.append(f'\\\\x{bytes(col).hex()}')
+            elif isinstance(col, dict):
+                fields.append(json.dumps(col).translate(_copyTextEscapes))
+            elif isinstance(col, list):
+                fields.append(_pgArrayLiteral(col).translate(_copyTextEscapes))
+            else:
+                fields.append(str(col).translate(_copyTextEscapes))
+        lines.append('\t'.join(fields))
+    lines.append('')
+    return '\n'.join(lines)
+
+def copyRowsPG(p_cursor, p_query:str, p_data) -> int:
+    '''p_query is a "COPY table (cols) FROM STDIN" statement'''
+
+    if isinstance(p_data, CopyPacket):
+        #text format straight from a COPY TO STDOUT reader
+        p_cursor.copy_expert(p_query, io.StringIO(p_data.data))
+        return p_data.rows
+
+    if columnar.isArrowPacket(p_data):
+        table = columnar.ipcToTable(p_data)
+        csvBuffer = columnar.tableToCSV(table)
+        if csvBuffer is not None:
+            p_cursor.copy_expert(f'{p_query} WITH (FORMAT csv)', csvBuffer)
+            return table.num_rows
+
+    bData = packetRows(p_data)
+    p_cursor.copy_expert(p_query, io.StringIO(copyTextEncode(bData)))
+
+    wr = p_cursor.rowcount
+    if wr == -1:
+        wr = len(bData)
+    return wr
+
+#### load_data: mysql/mariadb LOAD DATA LOCAL INFILE #############################################
+
+_loadDataTextEscapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+_loadDataBytesEscapes = ((b'\\', b'\\\\'), (b'\t', b'\\t'), (b'\n', b'\\n'), (b'\r', b'\\r'), (b'\0', b'\\0'))
+
+def loadDataEncode(p_rows) -> bytes:
+    '''
+    encodes rows in the default LOAD DATA format, the same rules as the postgres COPY text format:
+    tab delimited, \\N for NULL, backslash escapes. binary columns go in raw, escaped the same way.
+    '''
+    lines:list[bytes] = []
+    for row in p_rows:
+        fields:list[bytes] = []
+        for col in row:
+            if isinstance(col, str):
+                fields.append(col.translate(_loadDataTextEscapes).encode('utf-8'))
+            elif col is None:
+                fields.append(b'\\N')
+            elif isinstance(col, bool):
+                fields.append(b'1' if col else b'0')
+            elif isinstance(col, (bytes, bytearray, memoryview)):
+                bCol = bytes(col)
+                for (sFrom, sTo) in _loadDataBytesEscapes:
+                    bCol = bCol.replace(sFrom, sTo)
+                fields.append(bCol)
+            elif isinstance(col, dict):
+                fields.append(json.dumps(col).translate(_loadDataTextEscapes).encode('utf-8'))
+            else:
+                fields.append(str(col).translate(_loadDataTextEscapes).encode('utf-8'))
+        lines.append(b'\t'.join(fields))
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+def loadDataMySQL(p_cursor, p_query:str, p_data) -> int:
+    '''
+    p_query is the LOAD DATA statement without the file part: "INTO TABLE table ... (cols)".
+    each packet goes to a temp file (on TMPDIR), as the client libraries read LOCAL INFILE from a path.
+    '''
+    bData = packetRows(p_data)
+
+    with tempfile.NamedTemporaryFile(mode='wb', prefix='datacopy_', suffix='.tsv') as f:
+        f.write(loadDataEncode(bData))
+        f.flush()
+        sPath = f.name.replace('\\', '\\\\').replace("'", "\\'")
+        p_cursor.execute(f"LOAD DATA LOCAL INFILE '{sPath}' {p_query}")
+
+    wr = p_cursor.rowcount
+    if wr == -1:
+        wr = len(bData)
+    return wr
+
+#### bulk: pyodbc fast_executemany ###############################################################
+
+# above these, sql server wants (max) types, which fast_executemany does not bind well
+_odbcMaxChars = 4000
+_odbcMaxBytes = 8000
+
+# family of each source column type, by the exact name utils.type_name gives, per source driver.
+# names not listed (intervals, geometry, booleans, ...) are left for the driver to work out from the data.
+_columnKinds:dict[str, dict[str, str]] = {
+    'oracledb':     {'db_type_char':'text', 'db_type_nchar':'text', 'db_type_varchar':'text', 'db_type_nvarchar':'text', 'db_type_long':'text',
+                     'db_type_clob':'text', 'db_type_nclob':'text', 'db_type_json':'text', 'db_type_xmltype':'text', 'db_type_rowid':'text', 'db_type_urowid':'text',
+                     'db_type_raw':'binary', 'db_type_long_raw':'binary', 'db_type_blob':'binary',
+                     'db_type_number':'number', 'db_type_binary_double':'number', 'db_type_binary_float':'number', 'db_type_binary_integer':'number',
+                     'db_type_date':'datetime', 'db_type_timestamp':'datetime', 'db_type_timestamp_tz':'datetime', 'db_type_timestamp_ltz':'datetime'},
+    'psycopg2':     {'text':'text', 'varchar':'text', 'bpchar':'text', 'json':'text', 'jsonb':'text', 'uuid':'text',
+                     'bytea':'binary',
+                     'numeric':'decimal',
+                     'int2':'number', 'int4':'number', 'int8':'number', 'float4':'number', 'float8':'number',
+                     'date':'datetime', 'timestamp':'datetime', 'timestamptz':'datetime',
+                     'time':'time', 'timetz':'time'},
+    # text and blob columns share the blob type codes, so those are not listed
+    'mysql':        {'varchar':'text', 'var_string':'text', 'string':'text', 'json':'text',
+                     'decimal':'decimal', 'newdecimal':'decimal',
+                     'tiny':'number', 'short':'number', 'long':'number', 'longlong':'number', 'int24':'number', 'float':'number', 'double':'number',
+                     'date':'datetime', 'datetime':'datetime', 'timestamp':'datetime',
+                     'time':'time'},
+    # python types
+    'pyodbc':       {'str':'text', 'uuid':'text',
+                     'bytes':'binary', 'bytearray':'binary',
+                     'decimal':'decimal',
+                     'int':'number', 'float':'number',
+                     'date':'datetime', 'datetime':'datetime',
+                     'time':'time'},
+    'databricks':   {'string':'text', 'char':'text', 'varchar':'text',
+                     'binary':'binary',
+                     'decimal':'decimal',
+                     'tinyint':'number', 'smallint':'number', 'int':'number', 'bigint':'number', 'float':'number', 'double':'number',
+                     'date':'datetime', 'timestamp':'datetime', 'timestamp_ntz':'datetime'},
+    # arrow schemas, from read_method arrow, whatever the source driver
+    'arrow':        {'string':'text', 'large_string':'text', 'string_view':'text',
+                     'binary':'binary', 'large_binary':'binary', 'binary_view':'binary', 'fixed_size_binary':'binary',
+                     'decimal128':'decimal', 'decimal256':'decimal',
+                     'int8':'number', 'int16':'number', 'int32':'number', 'int64':'number', 'uint8':'number', 'uint16':'number', 'uint32':'number',
+                     'uint64':'number', 'halffloat':'number', 'float':'number', 'double':'number',
+                     'date32':'datetime', 'date64':'datetime', 'timestamp':'datetime',
+                     'time32':'time', 'time64':'time'}
+}
+_columnKinds['mariadb'] = _columnKinds['mysql']
+
+def _columnKind(p_typeName:str, p_sourceDriver:str) -> str:
+    '''family of a source column type, from utils.type_name: text, binary, decimal, number, datetime, time, or '' when unknown'''
+    sType = p_typeName.lower()
+    sKind = _columnKinds.get(p_sourceDriver, {}).get(sType, '')
+    if sKind == '':
+        # arrow puts the parameters in the name, like decimal128(10, 2) or timestamp[us]
+        sKind = _columnKinds['arrow'].get(re.split(r'[(\[]', sType, maxsplit=1)[0], '')
+    return sKind
+
+def odbcInputSizes(p_description:list, p_sourceDriver:str) -> tuple[list, list, list[int], int]:
+    '''
+    setinputsizes() lists out of the source description: one for fast_executemany, where long strings and binaries
+    are capped, and one for the fallback, where they are bound as (max) types.
+    also returns the columns that may need the fallback, and the estimated bytes per row of the parameter array.
+    '''
+    import pyodbc
+
+    fastSizes:list = []
+    slowSizes:list = []
+    longCols:list[int] = []
+    iRowBytes = 0
+
+    for i, col in enumerate(p_description):
+        iSize = col[3] if isinstance(col[3], int) and col[3] > 0 else (col[2] if isinstance(col[2], int) and col[2] > 0 else 0)
+        match _columnKind(utils.type_name(col[1], p_sourceDriver), p_sourceDriver):
+            case 'text':
+                if iSize == 0 or iSize > _odbcMaxChars:
+                    fastSizes.append( (pyodbc.SQL_WVARCHAR, _odbcMaxChars, 0) )
+                    slowSizes.append( (pyodbc.SQL_WLONGVARCHAR, 0, 0) )
+                    longCols.append(i)
+                    iSize = _odbcMaxChars
+                else:
+                    fastSizes.append( (pyodbc.SQL_WVARCHAR, iSize, 0) )
+                    slowSizes.append( (pyodbc.SQL_WVARCHAR, iSize, 0) )
+                iRowBytes += 2 * iSize + 8
+            case 'binary':
+                if iSize == 0 or iSize > _odbcMaxBytes:
+                    fastSizes.append( (pyodbc.SQL_VARBINARY, _odbcMaxBytes, 0) )
+                    slowSizes.append( (pyodbc.SQL_LONGVARBINARY, 0, 0) )
+                    longCols.append(i)
+                    iSize = _odbcMaxBytes
+                else:
+                    fastSizes.append( (pyodbc.SQL_VARBINARY, iSize, 0) )
+                    slowSizes.append( (pyodbc.SQL_VARBINARY, iSize, 0) )
+                iRowBytes += iSize + 8
+            case 'decimal' if isinstance(col[4], int) and 0 < col[4] <= 38:
+                fastSizes.append( (pyodbc.SQL_DECIMAL, col[4], col[5] if isinstance(col[5], int) and col[5] >= 0 else 0) )
+                slowSizes.append(fastSizes[-1])
+                iRowBytes += col[4] + 10
+            case _:
+                # let pyodbc work it out from the first row
+                fastSizes.append(None)
+                slowSizes.append(None)
+                iRowBytes += 24
+
+    return fastSizes, slowSizes, longCols, iRowBytes
+
+def newBulkWriterODBC(p_cursor, p_description:Optional[list], p_sourceDriver:str) -> Callable[[Any, str, Any], int]:
+    '''
+    turns on fast_executemany, binds the parameters from the source description, and returns a packet writer
+    that sends batches of up to BULK_BATCH_MB of parameter array.
+    batches with strings or binaries longer than what fast_executemany binds well go with fast_executemany off.
+    '''
+
+    p_cursor.fast_executemany = True
+
+    fastSizes:list = []
+    slowSizes:list = []
+    longCols:list[int] = []
+    iBatchRows = 0
+    if p_description is not None and len(p_description) > 0:
+        fastSizes, slowSizes, longCols, iRowBytes = odbcInputSizes(p_description, p_sourceDriver)
+        iBatchRows = max(1, (shared.bulkBatchMB * 1024 * 1024) // iRowBytes)
+        p_cursor.setinputsizes(fastSizes)
+
+    def _needsFallback(p_rows) -> bool:
+        for row in p_rows:
+            for i in longCols:
+                v = row[i]
+                if v is not None and len(v) > (_odbcMaxBytes if isinstance(v, (bytes, bytearray, memoryview)) else _odbcMaxChars):
+                    return True
+        return False
+
+    def bulkRowsODBC(p_cursor, p_query:str, p_data) -> int:
+        bData = packetRows(p_data)
+        iBatch = iBatchRows if iBatchRows > 0 else len(bData)
+        wr = 0
+        for iFrom in range(0, len(bData), iBatch):
+            bBatch = bData[iFrom:iFrom+iBatch]
+            if len(longCols) > 0 and _needsFallback(bBatch):
+                p_cursor.fast_executemany = False
+                p_cursor.setinputsizes(slowSizes)
+                try:
+                    p_cursor.executemany(p_query, bBatch)
+                finally:
+                    p_cursor.fast_executemany = True
+                    p_cursor.setinputsizes(fastSizes)
+            else:
+                p_cursor.executemany(p_query, bBatch)
+            # rowcount on pyodbc executemany is not reliable
+            wr += len(bBatch)
+        return wr
+
+    return bulkRowsODBC
+
+#### array, append: oracledb array DML ###########################################################
+
+_oracleMaxChars = 32767
+_oracleMaxRaw = 2000
+_oracleFloatTypes = ('DB_TYPE_BINARY_DOUBLE', 'DB_TYPE_BINARY_FLOAT')
+
+def oracleInputSizes(p_description:list, p_sourceDriver:str) -> list:
+    '''setinputsizes() list out of the source description, so buffers are not resized as longer values show up'''
+    import oracledb
+
+    sizes:list = []
+    for col in p_description:
+        iSize = col[3] if isinstance(col[3], int) and col[3] > 0 else (col[2] if isinstance(col[2], int) and col[2] > 0 else 0)
+        sTypeName = utils.type_name(col[1], p_sourceDriver)
+        if p_sourceDriver == 'oracledb' and sTypeName in _oracleFloatTypes:
+            # oracle to oracle, keep ieee floats as they are, infinity and nan included
+            sizes.append(getattr(oracledb, sTypeName))
+            continue
+        match _columnKind(sTypeName, p_sourceDriver):
+            case 'text':
+                if iSize == 0:
+                    # unknown size, let the driver size it from the data
+                    sizes.append(None)
+                elif iSize > _oracleMaxChars:
+                    sizes.append(oracledb.DB_TYPE_CLOB)
+                else:
+                    sizes.append(iSize)
+            case 'binary':
+                if iSize == 0:
+                    sizes.append(None)
+                elif iSize > _oracleMaxRaw:
+                    sizes.append(oracledb.DB_TYPE_BLOB)
+                else:
+                    sizes.append( (oracledb.DB_TYPE_RAW, iSize) )
+            case 'decimal' | 'number':
+                sizes.append(oracledb.DB_TYPE_NUMBER)
+            case 'datetime':
+                sizes.append(oracledb.DB_TYPE_TIMESTAMP)
+            case _:
+                sizes.append(None)
+    return sizes
+
+def newArrayWriterOracle(p_cursor, p_description:Optional[list], p_sourceDriver:str, p_batchErrors:bool, p_jobID:int, p_threadID:int) -> Callable[[Any, str, Any], int]:
+    '''
+    array DML on oracle: binds defined once from the source description, and, with p_batchErrors,
+    bad rows are reported and dumped instead of failing the whole packet.
+    '''
+
+    sizes:list = []
+    if p_description is not None and len(p_description) > 0:
+        sizes = oracleInputSizes(p_description, p_sourceDriver)
+
+    def arrayRowsOracle(p_cursor, p_query:str, p_data) -> int:
+        bData = packetRows(p_data)
+        if len(sizes) > 0:
+            # executemany resets them
+            p_cursor.setinputsizes(*sizes)
+        p_cursor.executemany(p_query, bData, batcherrors=p_batchErrors)
+        if not p_batchErrors:
+            return len(bData)
+
+        errors = p_cursor.getbatcherrors()
+        if len(errors) > 0:
+            logging.statsPrint('writeRejected', p_jobID, len(errors), 0, 0)
+            logging.logPrint(f'{len(errors)} rows rejected, first one at offset {errors[0].offset}: [{errors[0].message}]', logLevel.ERROR, p_jobID=p_jobID, p_threadID=p_threadID)
+            logging.logPrint([bData[e.offset] for e in errors], logLevel.DUMP_DATA)
+        return len(bData) - len(errors)
+
+    return arrayRowsOracle
+
+#### values: multi row INSERT ... VALUES (...),(...) #############################################
+
+#(max bind parameters per statement, max rows per VALUES list), 0 is no limit
+values_limits:dict[str, tuple[int, int]] = {
+    'psycopg2':     (65535, 0),
+    'pyodbc':       (2099, 1000),
+    'databricks':   (256, 0),
+    '':             (1000, 0)
+}
+
+def newValuesWriter(p_destDriver:str) -> Callable[[Any, str, Any], int]:
+    '''
+    sends each packet as a few INSERT ... VALUES (...),(...) statements.
+    statements only come in power of two row counts, and are built once, so the server sees few distinct statements
+    and can reuse their plans.
+    '''
+
+    iMaxParams, iMaxRows = values_limits.get(p_destDriver, values_limits[''])
+    statements:dict[tuple[str, int], str] = {}
+
+    def _statement(p_query:str, p_rows:int) -> str:
+        if (p_query, p_rows) not in statements:
+            #p_query is the single row insert, built by jobManager
+            sPrefix, sRowGroup = p_query.rsplit(' VALUES ', 1)
+            statements[(p_query, p_rows)] = f"{sPrefix} VALUES {','.join([sRowGroup] * p_rows)}"
+        return statements[(p_query, p_rows)]
+
+    def valuesRows(p_cursor, p_query:str, p_data) -> int:
+        bData = packetRows(p_data)
+        if len(bData) == 0:
+            return 0
+
+        iCols = max(1, len(bData[0]))
+        iRows = iMaxParams // iCols
+        if iMaxRows > 0:
+            iRows = min(iRows, iMaxRows)
+        iRows = min(iRows, max(1, (shared.valuesMaxKB * 1024) // max(1, utils.estimate_packet_bytes(bData[:1]))))
+        iRows = 1 << (max(1, iRows).bit_length() - 1)
+
+        wr = 0
+        iFrom = 0
+        while iFrom < len(bData):
+            #full statements first, then the remainder in smaller power of two chunks
+            while iRows > len(bData) - iFrom:
+                iRows >>= 1
+            bBatch = bData[iFrom:iFrom+iRows]
+            p_cursor.execute(_statement(p_query, iRows), [col for row in bBatch for col in row])
+            wr += p_cursor.rowcount if p_cursor.rowcount > 0 else iRows
+            iFrom += iRows
+        return wr
+
+    return valuesRows
+
+#### dispatcher ###################################################################################
+
+write_methods:dict[str, Callable[[Any, str, Any], int]] = {
+    'insert':   insertRows,
+    'copy':     copyRowsPG,
+    'load_data':loadDataMySQL
+}
+
+def newPacketWriter(p_writeMethod:str, p_cursor, p_description:Optional[list] = None, p_sourceDriver:str = '', p_destDriver:str = '', p_jobID:int = 0, p_threadID:int = 0) -> Callable[[Any, str, Any], int]:
+    '''called once per writer; methods that prepare the cursor for the whole job do it here'''
+    match p_writeMethod:
+        case 'bulk':
+            return newBulkWriterODBC(p_cursor, p_description, p_sourceDriver)
+        case 'array':
+            return newArrayWriterOracle(p_cursor, p_description, p_sourceDriver, True, p_jobID, p_threadID)
+        case 'append':
+            # direct path inserts do not do batch errors
+            return newArrayWriterOracle(p_cursor, p_description, p_sourceDriver, False, p_jobID, p_threadID)
+        case 'values':
+            return newValuesWriter(p_destDriver)
+        case _:
+            return write_methods[p_writeMethod]
@@ -0,0 +1,43 @@
+'''writer side packet coalescing, with row and copy packets on the same queue'''
+
+import queue
+
+import pytest
+
+import modules.datahandlers as datahandlers
+import modules.writemethods as writemethods
+
+def _queueOf(*p_packets) -> queue.Queue:
+    q:queue.Queue = queue.Queue()
+    for packet in p_packets:
+        q.put(packet)
+    return q
+
+def test_merges_row_packets():
+    q = _queueOf([(1,), (2,)], [(3,)], [(4,), (5,)])
+    pending:list = []
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) == [(1,), (2,), (3,), (4,), (5,)]
+    assert pending == []
+
+def test_copy_packet_behind_rows_is_not_merged():
+    copyPacket = writemethods.CopyPacket(2, b'a\tb\nc\td\n')
+    q = _queueOf([(1,), (2,)], copyPacket, [(3,)])
+    pending:list = []
+
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) == [(1,), (2,)]
+    assert pending == [copyPacket]
+
+    # the copy packet comes out next, untouched, and the rows behind it are not lost
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) is copyPacket
+    assert pending == []
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) == [(3,)]
+
+    with pytest.raises(queue.Empty):
+        datahandlers.getCoalescedPacket(q, 10, 0, 0.01, pending)
+
+def test_copy_packet_first_is_returned_alone():
+    copyPacket = writemethods.CopyPacket(1, b'x\n')
+    q = _queueOf(copyPacket, [(1,)])
+    pending:list = []
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) is copyPacket
+    assert datahandlers.getCoalescedPacket(q, 10, 0, 0.2, pending) == [(1,)]
@@ -0,0 +1,58 @@
+'''arrow fetcher: dataframe batches cut to the size asked on each fetch'''
+
+import types
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+import modules.columnar as columnar
+
+def _dataframeConnection(p_rows:int, p_batchRows:int):
+    def fetch_df_batches(statement:str, size:int):
+        for start in range(0, p_rows, p_batchRows):
+            yield pa.table({'id': list(range(start, min(start + p_batchRows, p_rows)))})
+    return types.SimpleNamespace(fetch_df_batches=fetch_df_batches)
+
+def test_dataframe_fetch_follows_the_size_asked():
+    fetcher = columnar.ArrowFetcher(_dataframeConnection(25, 10), None, 10)
+    fetcher.execute('select id from t')
+
+    sizes = []
+    ids = []
+    for size in (4, 13, 3, 100, 10):
+        packet, rows = fetcher.fetch(size)
+        sizes.append(rows)
+        if rows > 0:
+            ids.extend(columnar.ipcToRows(packet))
+    assert sizes == [4, 13, 3, 5, 0]
+    assert ids == [(i,) for i in range(25)]
+    assert [col[0] for col in fetcher.description] == ['id']
+
+def test_copy_arrow_counts_rows_from_the_packet():
+    import modules.writemethods as writemethods
+
+    class CopyCursor:
+        rowcount = -1
+        def copy_expert(self, p_query, p_file):
+            self.query = p_query
+            self.data = p_file.read()
+
+    cursor = CopyCursor()
+    packet = columnar.toIPC(pa.table({'id': [1, 2, 3], 'name': ['a', None, 'c']}))
+    assert writemethods.copyRowsPG(cursor, 'COPY t (id, name) FROM STDIN', packet) == 3
+    assert cursor.query.endswith('WITH (FORMAT csv)')
+
+def test_dataframe_fetch_without_rows_describes_from_the_cursor():
+    class EmptyCursor:
+        description = None
+        def execute(self, p_query):
+            self.query = p_query
+            self.description = [('ID', 'DB_TYPE_NUMBER', None, None, None, None, True)]
+
+    cursor = EmptyCursor()
+    fetcher = columnar.ArrowFetcher(_dataframeConnection(0, 10), cursor, 10)
+    fetcher.execute('select id from t;')
+    assert fetcher.fetch(10) == ([], 0)
+    assert cursor.query == 'SELECT * FROM (select id from t) dc_arrow_query WHERE 1=0'
+    assert fetcher.description == cursor.description
@@ -0,0 +1,53 @@
+'''COPY TO STDOUT options for csv destinations, session slots'''
+
+import multiprocessing as mp
+import queue
+import threading
+
+import modules.connections as connections
+import modules.shared as shared
+from modules.logging import logLevel
+
+def test_copy_out_options(monkeypatch):
+    monkeypatch.setattr(shared, 'connections', {
+        'out':  {'driver':'csv', 'delimiter':'semicolon', 'quoting':'ALL'},
+        'tab':  {'driver':'csv', 'delimiter':'tab'},
+        'pg':   {'driver':'psycopg2'},
+    })
+    assert connections.getCopyOutOptions('out') == """WITH (FORMAT csv, DELIMITER E';', QUOTE '"', ESCAPE '"', FORCE_QUOTE *)"""
+    assert connections.getCopyOutOptions('tab') == """WITH (FORMAT csv, DELIMITER E'\t', QUOTE '"', ESCAPE '"')"""
+    assert connections.getCopyOutOptions('pg') == ''
+
+def test_release_more_slots_than_acquired(monkeypatch):
+    monkeypatch.setattr(shared, 'connections', {'db': {'max_sessions':2, 'max_readers':0, 'max_writers':1}})
+    monkeypatch.setattr(shared, 'connSlots', {'db': mp.Array('i', 3)})
+    monkeypatch.setattr(shared, 'logQueue', queue.Queue())
+    monkeypatch.setattr(shared, 'DEBUG', False)
+
+    assert connections.acquireSlots('db', 'w', 3) == 1
+    connections.releaseSlots('db', 'w')
+    assert shared.logQueue.empty()
+
+    connections.releaseSlots('db', 'w')
+    assert shared.connSlots['db'][:] == [0, 0, 0]
+    assert shared.logQueue.get_nowait()[0] == logLevel.ERROR
+
+def test_first_connection_is_opened_alone(monkeypatch):
+    monkeypatch.setattr(shared, 'connections', {'db': {'driver':'psycopg2'}})
+    monkeypatch.setattr(shared, 'connectFanout', 4)
+    monkeypatch.setattr(shared, 'idleTimeoutSecs', 0)
+    monkeypatch.setattr(shared, 'logQueue', queue.Queue())
+    monkeypatch.setattr(shared, 'DEBUG', False)
+    monkeypatch.setattr(shared, 'statsFormat', '{2}\t{4}\t{6}')
+
+    threadNames:dict[int, str] = {}
+    def connect(x:int):
+        threadNames[x] = threading.current_thread().name
+        return x
+
+    assert connections._connectAll('db', 4, connect) == {0: 0, 1: 1, 2: 2, 3: 3}
+    assert threadNames[0] == threading.current_thread().name
+    assert all(threadNames[x].startswith('connect[db]') for x in (1, 2, 3))
+
+    stats = sorted(shared.logQueue.get_nowait()[1] for _ in range(4))
+    assert stats == [f'connectionOpen\t0\t{x}' for x in range(4)]
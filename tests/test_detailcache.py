@@ -0,0 +1,20 @@
+'''detail results cache limits'''
+
+import modules.detailcache as detailcache
+
+def test_fits_checks_rows_and_bytes():
+    cache = detailcache.DetailCache(100, 1024)
+    assert cache.fits(10, 512)
+    assert not cache.fits(101, 0)
+    assert not cache.fits(10, 2048)
+
+def test_fits_without_limits():
+    cache = detailcache.DetailCache(0, 0)
+    assert cache.fits(10**9, 10**12)
+
+def test_put_skips_results_over_the_byte_limit():
+    cache = detailcache.DetailCache(0, 1024)
+    cache.put((1,), [('x' * 100,)] * 20)
+    assert len(cache) == 0
+    cache.put((2,), [('x' * 10,)] * 5)
+    assert cache.get((2,)) == [('x' * 10,)] * 5
@@ -0,0 +1,89 @@
+'''data queue transports'''
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+
+from queue import Full as queueFull
+
+import pytest
+
+import modules.queues as queues
+
+def test_shm_ring_sized_from_ring_bytes(monkeypatch):
+    monkeypatch.setattr(queues, 'shmFreeBytes', lambda: None)
+    q = queues.newDataQueue('shm', 16, 16 * 1024 * 1024)
+    try:
+        assert isinstance(q, queues.ShmQueue)
+        assert q.slotBytes == 1024 * 1024
+        q.put([(1, 'a'), (2, b'b')])
+        q.put([(3, 'x' * (2 * 1024 * 1024))])
+        assert q.get(timeout=1) == [(1, 'a'), (2, b'b')]
+        assert q.get(timeout=1) == [(3, 'x' * (2 * 1024 * 1024))]
+    finally:
+        q.close()
+
+def test_shm_falls_back_without_free_space(monkeypatch):
+    monkeypatch.setattr(queues, 'shmFreeBytes', lambda: 1024 * 1024)
+    streamQueues = queues.StreamQueues(1, 'shm', 256, 64 * 1024 * 1024)
+    try:
+        assert not isinstance(streamQueues.dataQueue, queues.ShmQueue)
+        assert streamQueues.transport == 'queue'
+    finally:
+        streamQueues.close()
+
+def _putBig(p_queue, p_producer:int, p_packets:int):
+    for i in range(p_packets):
+        p_queue.put([(p_producer, i, 'x' * (100 * 1024))])
+
+def test_shm_overflow_keeps_its_place():
+    q = queues.ShmQueue(4, queues._minShmSlotBytes)
+    try:
+        ctx = mp.get_context('fork')
+        producers = [ctx.Process(target=_putBig, args=(q, p, 20)) for p in range(3)]
+        for producer in producers:
+            producer.start()
+        got:dict[int, list[int]] = {0:[], 1:[], 2:[]}
+        for _ in range(60):
+            packet = q.get(timeout=10)
+            got[packet[0][0]].append(packet[0][1])
+            assert len(packet[0][2]) == 100 * 1024
+        for producer in producers:
+            producer.join()
+        assert got == {p: list(range(20)) for p in range(3)}
+    finally:
+        q.close()
+
+def test_shm_close_removes_unread_overflow():
+    q = queues.ShmQueue(4, queues._minShmSlotBytes)
+    q.put([(1, 'x' * (100 * 1024))])
+    sName = bytes(q._shm.buf[queues._slotHeader.size:queues._slotHeader.size + 64]).split(b'\0')[0].decode()
+    assert os.path.exists(f'/dev/shm/{sName}')
+    q.close()
+    assert not os.path.exists(f'/dev/shm/{sName}')
+
+def test_spill_keeps_order_past_max_bytes(tmp_path):
+    # a thread queue, so the test does not depend on mp.Queue feeder timing
+    spill = queues.SpillQueue(queue.Queue(2), str(tmp_path), 1, 4096, p_maxBytes=200)
+    packets = [[(i, 'x' * 60)] for i in range(6)]
+    try:
+        # 2 in memory, 2 on disk, then SPILL_MAX_MB is reached
+        for packet in packets[:4]:
+            spill.put(packet, block=False)
+        assert spill._pending.value == 2
+        with pytest.raises(queueFull):
+            spill.put(packets[4], block=False)
+
+        # a free memory slot is not enough, the spilled packets go first
+        assert spill.get(timeout=1) == packets[0]
+        with pytest.raises(queueFull):
+            spill.put(packets[4], block=False)
+
+        tPut = threading.Thread(target=lambda: [spill.put(packet, timeout=5) for packet in packets[4:]])
+        tPut.start()
+        got = [spill.get(timeout=5) for _ in range(5)]
+        tPut.join()
+        assert got == packets[1:]
+    finally:
+        spill.close()
@@ -0,0 +1,164 @@
+'''split reads: snapshot export/import on postgres, and range/physical predicates'''
+
+import queue
+import types
+
+import pytest
+
+import modules.jobmanager as jobmanager
+import modules.jobs as jobs
+import modules.logging as logging
+import modules.shared as shared
+
+class ProgrammingError(Exception):
+    pass
+
+class MockPGConnection:
+    '''tracks the transaction the way psycopg2 does: the first execute opens it, rollback/commit close it'''
+
+    def __init__(self):
+        self.inTransaction = False
+        self.transactionStatements:list[str] = []
+        self.isolation = 'READ COMMITTED'
+        self.readonly = False
+        self.transactionIsolation = ''
+        self.serverVersion = 160000
+
+    def cursor(self):
+        return MockPGCursor(self)
+
+    def rollback(self):
+        self.inTransaction = False
+        self.transactionStatements = []
+
+    commit = rollback
+
+    def set_session(self, isolation_level=None, readonly=None):
+        if self.inTransaction:
+            raise ProgrammingError('set_session cannot be used inside a transaction')
+        if isolation_level is not None:
+            self.isolation = isolation_level
+        if readonly is not None:
+            self.readonly = readonly
+
+    @property
+    def isolation_level(self):
+        return self.isolation
+
+    @isolation_level.setter
+    def isolation_level(self, p_value):
+        if self.inTransaction:
+            raise ProgrammingError('isolation_level cannot be used inside a transaction')
+        self.isolation = p_value
+
+class MockPGCursor:
+
+    def __init__(self, p_conn:MockPGConnection):
+        self.conn = p_conn
+        self.result = None
+
+    def execute(self, p_sql:str):
+        conn = self.conn
+        if not conn.inTransaction:
+            conn.inTransaction = True
+            conn.transactionIsolation = conn.isolation
+        if p_sql.startswith('SET TRANSACTION SNAPSHOT') and len(conn.transactionStatements) > 0:
+            raise ProgrammingError('SET TRANSACTION SNAPSHOT must be called before any query')
+        conn.transactionStatements.append(p_sql)
+        if 'pg_export_snapshot' in p_sql:
+            self.result = (f'snap-{conn.transactionIsolation}',)
+        elif 'server_version_num' in p_sql:
+            self.result = (str(conn.serverVersion),)
+        elif 'pg_relation_size' in p_sql:
+            self.result = (1000,)
+        else:
+            self.result = ('x',)
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+def freshConnection() -> MockPGConnection:
+    '''what initConnections hands out: version check (and setup) already ran, transaction still open'''
+    conn = MockPGConnection()
+    conn.cursor().execute('SELECT version()')
+    return conn
+
+def test_export_snapshot_on_fresh_connection():
+    conn = freshConnection()
+    sSnapshot = jobmanager._pgExportSnapshot(conn)
+    assert sSnapshot == 'snap-REPEATABLE READ'
+    assert conn.transactionStatements == ['SELECT pg_export_snapshot()']
+    assert conn.readonly
+
+def test_import_snapshot_is_first_statement():
+    conn = freshConnection()
+    jobmanager._pgImportSnapshot(conn, 'snap-1')
+    assert conn.transactionStatements == ["SET TRANSACTION SNAPSHOT 'snap-1'"]
+    assert conn.transactionIsolation == 'REPEATABLE READ'
+    assert conn.readonly
+
+def test_import_snapshot_old_way_fails():
+    '''what the split readers used to do, so the mock does catch it'''
+    conn = freshConnection()
+    with pytest.raises(ProgrammingError):
+        conn.isolation_level = 'REPEATABLE READ'
+
+class MockOracleConnection:
+    def __init__(self):
+        self.calls:list = []
+
+    def cursor(self):
+        return types.SimpleNamespace(execute=lambda p_sql: self.calls.append(p_sql), fetchone=lambda: (12345,),
+                                     callproc=lambda p_name, p_args: self.calls.append((p_name, p_args)), close=lambda: None)
+
+    def rollback(self):
+        self.calls.append('rollback')
+
+def test_oracle_split_readers_go_back_to_the_scn():
+    conn = MockOracleConnection()
+    iSCN = jobmanager._oraCurrentSCN(conn.cursor())
+    jobmanager._oraFlashbackSCN(conn, iSCN)
+    assert conn.calls == ['SELECT CURRENT_SCN FROM V$DATABASE', 'rollback', ('DBMS_FLASHBACK.ENABLE_AT_SYSTEM_CHANGE_NUMBER', [12345])]
+
+def test_range_predicates():
+    assert jobmanager._rangePredicates('id', []) == ['1=1']
+    assert jobmanager._rangePredicates('id', ['10', '20']) == ['id < 10 OR id IS NULL', 'id >= 10 AND id < 20', 'id >= 20']
+    assert jobmanager._rangePredicates('ctid', ['a'], False) == ['ctid < a', 'ctid >= a']
+
+def test_split_boundaries():
+    assert jobmanager._splitBoundaries(1, 100, 4) == ['26', '51', '76']
+    assert jobmanager._splitBoundaries(None, 100, 4) == []
+    with pytest.raises(ValueError):
+        jobmanager._splitBoundaries('a', 'z', 4)
+
+def physicalJob():
+    return types.SimpleNamespace(jobID=1, sourceDriver='psycopg2', nbrSplits=4)
+
+def test_physical_boundaries_pg14():
+    conn = freshConnection()
+    jobmanager._pgExportSnapshot(conn)
+    column, boundaries = jobmanager._physicalBoundaries(physicalJob(), conn.cursor(), 'public.t')
+    assert column == 'ctid'
+    assert boundaries == ["'(250,0)'::tid", "'(500,0)'::tid", "'(750,0)'::tid"]
+
+def test_physical_boundaries_before_pg14_is_one_chunk():
+    conn = freshConnection()
+    conn.serverVersion = 130011
+    column, boundaries = jobmanager._physicalBoundaries(physicalJob(), conn.cursor(), 'public.t')
+    assert column == 'ctid'
+    assert jobmanager._rangePredicates(column, boundaries, False) == ['1=1']
+
+@pytest.mark.parametrize('p_column, p_value', [('split_count', 'four'), ('split_workers', '2.5')])
+def test_split_numbers_are_checked(monkeypatch, p_column, p_value):
+    monkeypatch.setattr(shared, 'connections', {'pg': {'driver':'psycopg2', 'max_sessions':0, 'max_readers':0, 'max_writers':0}})
+    monkeypatch.setattr(shared, 'logQueue', queue.Queue())
+    errors:list[dict] = []
+    monkeypatch.setattr(logging, 'processError', lambda **kw: errors.append(kw))
+
+    job = {'source':'pg', 'dest':'pg', 'mode':'I', 'query':'select 1', 'table':'t', 'split_column':'id', 'split_count':'4', p_column:p_value}
+    assert jobs.preCheck({0: job}) == {}
+    assert p_column in errors[0]['p_message']
+    assert errors[0]['p_exitCode'] == 4
@@ -0,0 +1,120 @@
+'''writemethods: source column types and the binds they get'''
+
+import datetime
+import decimal
+import sys
+import types
+
+import pytest
+
+import modules.writemethods as writemethods
+
+@pytest.mark.parametrize('p_driver, p_typeName, p_kind', [
+    ('oracledb', 'DB_TYPE_BINARY_DOUBLE', 'number'),
+    ('oracledb', 'DB_TYPE_BINARY_FLOAT', 'number'),
+    ('oracledb', 'DB_TYPE_BINARY_INTEGER', 'number'),
+    ('oracledb', 'DB_TYPE_RAW', 'binary'),
+    ('oracledb', 'DB_TYPE_LONG', 'text'),
+    ('oracledb', 'DB_TYPE_INTERVAL_DS', ''),
+    ('psycopg2', 'interval', ''),
+    ('psycopg2', 'point', ''),
+    ('psycopg2', 'int4', 'number'),
+    ('psycopg2', 'time', 'time'),
+    ('psycopg2', 'timestamp', 'datetime'),
+    ('mysql', 'blob', ''),
+    ('mysql', 'medium_blob', ''),
+    ('mariadb', 'long_blob', ''),
+    ('mysql', 'time', 'time'),
+    ('mysql', 'datetime', 'datetime'),
+    ('pyodbc', 'time', 'time'),
+    ('pyodbc', 'Decimal', 'decimal'),
+    ('pyodbc', 'bytes', 'binary'),
+    ('databricks', 'interval', ''),
+    ('oracledb', 'decimal128(10, 2)', 'decimal'),
+    ('oracledb', 'timestamp[us]', 'datetime'),
+])
+def test_column_kind(p_driver, p_typeName, p_kind):
+    assert writemethods._columnKind(p_typeName, p_driver) == p_kind
+
+@pytest.fixture
+def fakePyodbc(monkeypatch):
+    fake = types.SimpleNamespace(SQL_WVARCHAR='wvarchar', SQL_WLONGVARCHAR='wlongvarchar', SQL_VARBINARY='varbinary',
+                                 SQL_LONGVARBINARY='longvarbinary', SQL_DECIMAL='decimal')
+    monkeypatch.setitem(sys.modules, 'pyodbc', fake)
+    return fake
+
+def test_odbc_input_sizes_binds(fakePyodbc):
+    description = [
+        ('d', types.SimpleNamespace(name='DB_TYPE_BINARY_DOUBLE'), None, None, None, None, True),
+        ('f', types.SimpleNamespace(name='DB_TYPE_BINARY_FLOAT'), None, None, None, None, True),
+        ('i', types.SimpleNamespace(name='DB_TYPE_BINARY_INTEGER'), None, None, None, None, True),
+        ('r', types.SimpleNamespace(name='DB_TYPE_RAW'), 16, 16, None, None, True),
+    ]
+    fastSizes, _, longCols, _ = writemethods.odbcInputSizes(description, 'oracledb')
+    assert fastSizes == [None, None, None, ('varbinary', 16, 0)]
+    assert longCols == []
+
+def test_odbc_input_sizes_leaves_unknown_types(fakePyodbc):
+    description = [
+        ('iv', 1186, None, None, None, None, True),
+        ('pt', 600, None, None, None, None, True),
+        ('tm', 1083, None, None, None, None, True),
+        ('n', 1700, None, None, 12, 2, True),
+    ]
+    fastSizes, _, _, _ = writemethods.odbcInputSizes(description, 'psycopg2')
+    assert fastSizes == [None, None, None, ('decimal', 12, 2)]
+
+def test_odbc_input_sizes_mysql_text_is_not_binary(fakePyodbc):
+    description = [
+        ('t', 252, None, 65535, None, None, True),
+        ('tm', 11, None, None, None, None, True),
+    ]
+    fastSizes, _, longCols, _ = writemethods.odbcInputSizes(description, 'mysql')
+    assert fastSizes == [None, None]
+    assert longCols == []
+
+def test_odbc_input_sizes_python_types(fakePyodbc):
+    description = [
+        ('t', datetime.time, None, None, None, None, True),
+        ('n', decimal.Decimal, None, None, 10, 3, True),
+    ]
+    fastSizes, _, _, _ = writemethods.odbcInputSizes(description, 'pyodbc')
+    assert fastSizes == [None, ('decimal', 10, 3)]
+
+@pytest.fixture
+def fakeOracledb(monkeypatch):
+    fake = types.SimpleNamespace(DB_TYPE_RAW='raw', DB_TYPE_BLOB='blob', DB_TYPE_CLOB='clob', DB_TYPE_NUMBER='number', DB_TYPE_TIMESTAMP='timestamp',
+                                 DB_TYPE_BINARY_DOUBLE='binary_double', DB_TYPE_BINARY_FLOAT='binary_float')
+    monkeypatch.setitem(sys.modules, 'oracledb', fake)
+    return fake
+
+def test_oracle_input_sizes_binary_floats(fakeOracledb):
+    description = [
+        ('d', types.SimpleNamespace(name='DB_TYPE_BINARY_DOUBLE'), None, None, None, None, True),
+        ('f', types.SimpleNamespace(name='DB_TYPE_BINARY_FLOAT'), None, None, None, None, True),
+        ('i', types.SimpleNamespace(name='DB_TYPE_BINARY_INTEGER'), None, None, None, None, True),
+        ('r', types.SimpleNamespace(name='DB_TYPE_RAW'), 16, 16, None, None, True),
+    ]
+    assert writemethods.oracleInputSizes(description, 'oracledb') == ['binary_double', 'binary_float', 'number', ('raw', 16)]
+
+def test_oracle_input_sizes_other_sources(fakeOracledb):
+    description = [
+        ('iv', 1186, None, None, None, None, True),
+        ('tm', 1083, None, None, None, None, True),
+        ('f', 701, None, None, None, None, True),
+        ('b', 17, None, 8, None, None, True),
+    ]
+    assert writemethods.oracleInputSizes(description, 'psycopg2') == [None, None, 'number', ('raw', 8)]
+
+def test_copy_text_arrays():
+    line = writemethods.copyTextEncode([([1, 2, None], ['a', 'b"c', 'd\\e', None, 'x,y'], [[1, 2], [3, 4]], [b'\x01\xff'], [True, decimal.Decimal('1.5')])])
+    assert line == '\t'.join([
+        '{1,2,NULL}',
+        '{"a","b\\\\"c","d\\\\\\\\e",NULL,"x,y"}',
+        '{{1,2},{3,4}}',
+        '{"\\\\\\\\x01ff"}',
+        '{t,1.5}',
+    ]) + '\n'
+
+def test_copy_text_array_with_tab():
+    assert writemethods.copyTextEncode([(['a\tb'],)]) == '{"a\\tb"}\n'